@@ -0,0 +1,366 @@
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import avms_stats
+from avms_main import DSAHeap, DSAKeyedHeap, FrozenDSAGraph
+
+HUNGARIAN_LIMIT = 150  # Largest batch solved optimally; beyond it the greedy solver runs
+GREEDY_CANDIDATES = 3  # Nearest feasible vehicles kept per request for the greedy solver
+POOL_THRESHOLD = 1000  # Batches this large run their searches in a process pool
+
+def assign_requests(graph, table, requests, min_battery=None, max_distance=None, method="auto",
+                    candidates=GREEDY_CANDIDATES, workers=None, time_limit=None):
+    # Assigns a batch of ride requests to distinct vehicles by road distance to
+    # the pickup. A request is a pickup label or a (pickup, trip km) pair; a
+    # vehicle is only eligible when its range covers the drive to the pickup
+    # plus the trip. Returns (assignments, unassigned): assignments holds
+    # (request index, vehicle, pickup distance) in request order, unassigned
+    # the indexes of requests no eligible vehicle was left for.
+    #
+    # Each request gets one bounded search outward from its pickup, collecting
+    # the nearest eligible vehicles. "hungarian" keeps len(requests) of them
+    # per request, which always contains an optimal matching: a request matched
+    # further away has a free vehicle among its n nearest to swap to. It then
+    # maximises the number of requests served and, among those, minimises the
+    # total distance. "greedy" keeps `candidates` per request and matches the
+    # globally shortest pairs first, then serves requests whose candidates
+    # were all taken from the vehicles left over, in rounds that run until no
+    # free vehicle can serve a waiting request. time_limit stops the rounds
+    # that many seconds after the call; requests still waiting then are
+    # reported unassigned for the next batch. "auto" picks by batch size.
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    pickups, trips = [], []
+    for request in requests:
+        pickup, trip = request if isinstance(request, tuple) else (request, 0)
+        pickups.append(pickup)
+        trips.append(trip)
+    if method == "auto":
+        method = "hungarian" if len(pickups) <= HUNGARIAN_LIMIT else "greedy"
+    if method not in ("hungarian", "greedy"):
+        raise ValueError(f"Unknown assignment method: {method}")
+
+    # Vehicles are numbered by fleet row, straight off the location index
+    at_location = table.fleet.ranges_by_location(min_battery)
+    if not at_location or not pickups:
+        return [], list(range(len(pickups)))
+
+    frozen = graph if isinstance(graph, FrozenDSAGraph) else graph.freeze()  # Reused until the network changes
+    searcher = _CandidateSearch(frozen, at_location, max_distance)
+    limit = len(pickups) if method == "hungarian" else candidates
+    with avms_stats.span("assign.search"):
+        found = _search_all(searcher, pickups, trips, limit, workers)
+    with avms_stats.span("assign." + method):
+        if method == "hungarian":
+            matched = _solve_hungarian(found)
+        else:
+            matched = _solve_greedy(searcher, pickups, trips, found, limit, deadline)
+
+    vehicles = table.fleet.vehicles
+    assignments = [(i, vehicles[matched[i][0]], matched[i][1]) for i in sorted(matched)]
+    unassigned = [i for i in range(len(pickups)) if i not in matched]
+    return assignments, unassigned
+
+class _CandidateSearch:
+    # Searches share one heap and distance table sized to the graph; each
+    # search resets only the entries it touched.
+    def __init__(self, graph, at_location, max_distance):
+        self.graph = graph
+        self.at_location = at_location
+        self.max_distance = max_distance
+        self.max_range = max(range_km for here in at_location.values() for _, range_km in here)
+        self.at_node = [None] * graph.node_count()  # node index -> at_location entry
+        for location, here in at_location.items():
+            if graph.has_node(location):
+                self.at_node[graph.index[location]] = here
+        self.distances = [math.inf] * graph.node_count()
+        self.heap = DSAKeyedHeap(graph.node_count())
+
+    def candidates(self, pickup, trip, limit):
+        # [(pickup distance, vehicle index)] for the nearest eligible vehicles,
+        # nearest first. Vehicles at the last settled location are all kept,
+        # so the list can run past limit.
+        found = []
+        graph = self.graph
+        if not graph.has_node(pickup):
+            return found
+        bound = self.max_range - trip
+        if self.max_distance is not None:
+            bound = min(bound, self.max_distance)
+        if bound < 0:
+            return found
+        offsets, neighbors, weights = graph.offsets, graph.neighbors, graph.weights
+        at_node, distances, heap = self.at_node, self.distances, self.heap
+        origin = graph.index[pickup]
+        distances[origin] = 0
+        touched = [origin]
+        heap.push(origin, 0)
+        while heap:
+            current, distance = heap.pop()
+            here = at_node[current]
+            if here is not None:
+                for index, range_km in here:
+                    if distance + trip <= range_km:
+                        found.append((distance, index))
+                if len(found) >= limit:
+                    break
+            for j in range(offsets[current], offsets[current + 1]):
+                neighbor = neighbors[j]
+                candidate = distance + weights[j]
+                if candidate <= bound and candidate < distances[neighbor]:
+                    if distances[neighbor] == math.inf:
+                        touched.append(neighbor)
+                    distances[neighbor] = candidate
+                    heap.push(neighbor, candidate)
+        heap.clear()
+        for node in touched:
+            distances[node] = math.inf
+        return found
+
+_worker_search = None
+
+def _init_worker(graph, at_location, max_distance):
+    global _worker_search
+    _worker_search = _CandidateSearch(graph, at_location, max_distance)
+
+def _worker_candidates(task):
+    return _worker_search.candidates(*task)
+
+def _search_all(searcher, pickups, trips, limit, workers):
+    # One search per distinct (pickup, trip), shared by the requests asking
+    # it. Each extra request lengthens the list by one, so every request
+    # still has limit vehicles its neighbours cannot all take.
+    shared = {}
+    for key in zip(pickups, trips):
+        shared[key] = shared.get(key, 0) + 1
+    tasks = [(pickup, trip, min(limit + count - 1, len(pickups))) for (pickup, trip), count in shared.items()]
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(tasks) >= POOL_THRESHOLD else 1
+    if workers <= 1:
+        lists = [searcher.candidates(*task) for task in tasks]
+    else:
+        initargs = (searcher.graph, searcher.at_location, searcher.max_distance)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+            lists = list(pool.map(_worker_candidates, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    found = dict(zip(shared, lists))
+    return [found[key] for key in zip(pickups, trips)]
+
+def _solve_greedy(searcher, pickups, trips, found, limit, deadline):
+    # Shortest pickup distance first across the whole batch. Candidate lists
+    # are already sorted, so the heap holds one entry per request at its
+    # nearest untaken candidate and moves it along when that vehicle goes,
+    # rather than holding every pair. Ties go to the lower request index.
+    matched = {}
+    taken = set()
+    heap = DSAHeap.heapify(((candidates[0][0], request, 0), None)
+                           for request, candidates in enumerate(found) if candidates)
+    while heap.count > 0:
+        entry = heap.peek()
+        distance, request, position = entry.priority
+        candidates = found[request]
+        index = candidates[position][1]
+        if index not in taken:
+            matched[request] = (index, distance)
+            taken.add(index)
+            heap.remove()
+            continue
+        while position < len(candidates) and candidates[position][1] in taken:
+            position += 1
+        if position == len(candidates):
+            heap.remove()
+        else:
+            heap.update(entry, (candidates[position][0], request, position))
+    # Requests whose candidates all went elsewhere are matched in rounds: one
+    # search outward from all of them at once finds, for each location, the
+    # pending request a vehicle there could serve with the least range (drive
+    # plus trip), and every pickup takes the closest free vehicle that found
+    # it. Searching per request instead would send each one across the
+    # thinned-out fleet separately. Between rounds the search is repaired
+    # around the pickups just served rather than rerun. Rounds go on until no
+    # free vehicle can serve any pending request, so none is left over that
+    # could still have been served.
+    graph = searcher.graph
+    # A request that found fewer than limit candidates searched its whole
+    # reach, so with those taken no vehicle is left that could serve it.
+    pending = [request for request in range(len(pickups))
+               if request not in matched and len(found[request]) >= limit]
+    free = [(graph.index[location], index, range_km) for location, here in searcher.at_location.items()
+            if graph.has_node(location) for index, range_km in here if index not in taken]
+    nearest = None
+    last_round = 0.0
+    while pending and free:
+        started = time.perf_counter()
+        if deadline is not None and started + last_round > deadline:
+            break  # Another round like the last would overrun the batch deadline
+        if nearest is None:
+            sources = [(graph.index[pickups[request]], request, trips[request]) for request in pending]
+            nearest = _NearestPickups(graph, sources, max(range_km for _, _, range_km in free))
+        need, drive, owner = nearest.need, nearest.drive, nearest.owner
+        claims = {}
+        still_free = []
+        for location, index, range_km in free:
+            if need[location] > range_km:
+                continue  # Cannot serve any pending request, now or in any later round
+            still_free.append((location, index, range_km))
+            request, distance = owner[location], drive[location]
+            if searcher.max_distance is not None and distance > searcher.max_distance:
+                continue
+            if request not in claims or (distance, index) < claims[request]:
+                claims[request] = (distance, index)
+        if not claims:
+            break
+        for request, (distance, index) in claims.items():
+            matched[request] = (index, distance)
+            taken.add(index)
+        pending = [request for request in pending if request not in matched]
+        free = [vehicle for vehicle in still_free if vehicle[1] not in taken]
+        nearest.remove(claims)
+        last_round = time.perf_counter() - started
+    return matched
+
+class _NearestPickups:
+    # Multi-source Dijkstra from (node, request, trip) sources, each starting
+    # at its trip: need[node] is the least range a vehicle there needs to
+    # serve one of the requests, owner[node] that request and drive[node] the
+    # drive to its pickup. Nodes beyond bound stay at infinity. remove() drops
+    # served requests by clearing only the nodes they owned and settling the
+    # labelled nodes around them again, since those labels are still the best
+    # among the requests left.
+    def __init__(self, graph, sources, bound):
+        self.graph = graph
+        self.bound = bound
+        self.need = [math.inf] * graph.node_count()
+        self.drive = [0] * graph.node_count()
+        self.owner = [-1] * graph.node_count()
+        self.sources = {}  # node -> [(trip, request)] picked up there, shortest trip first
+        self.pickup = {}  # request -> node
+        for node, request, trip in sources:
+            self.sources.setdefault(node, []).append((trip, request))
+            self.pickup[request] = node
+        self.heap = DSAKeyedHeap(graph.node_count())
+        for node, here in self.sources.items():
+            here.sort()
+            self._offer(node, here[0][0], 0, here[0][1])
+        self._settle()
+
+    def remove(self, requests):
+        need, owner = self.need, self.owner
+        for request in requests:
+            here = self.sources[self.pickup.pop(request)]
+            here[:] = [source for source in here if source[1] != request]
+        cleared = [node for node, request in enumerate(owner) if request in requests]
+        for node in cleared:
+            need[node] = math.inf
+            owner[node] = -1
+        offsets, neighbors = self.graph.offsets, self.graph.neighbors
+        border = set()
+        for node in cleared:
+            here = self.sources.get(node)
+            if here:
+                self._offer(node, here[0][0], 0, here[0][1])
+            for j in range(offsets[node], offsets[node + 1]):
+                if owner[neighbors[j]] >= 0:
+                    border.add(neighbors[j])
+        for node in border:
+            self.heap.push(node, need[node])  # Settling it again relaxes the cleared nodes beside it
+        self._settle()
+
+    def _offer(self, node, need, drive, request):
+        if need <= self.bound and need < self.need[node]:
+            self.need[node] = need
+            self.drive[node] = drive
+            self.owner[node] = request
+            self.heap.push(node, need)
+
+    def _settle(self):
+        offsets, neighbors, weights = self.graph.offsets, self.graph.neighbors, self.graph.weights
+        need, drive, owner, heap, bound = self.need, self.drive, self.owner, self.heap, self.bound
+        while heap:
+            current, settled = heap.pop()
+            request, driven = owner[current], drive[current]
+            for j in range(offsets[current], offsets[current + 1]):
+                neighbor = neighbors[j]
+                candidate = settled + weights[j]
+                if candidate <= bound and candidate < need[neighbor]:
+                    need[neighbor] = candidate
+                    drive[neighbor] = driven + weights[j]
+                    owner[neighbor] = request
+                    heap.push(neighbor, candidate)
+
+def _solve_hungarian(found):
+    # Rows are requests, columns the union of their candidate vehicles. Pairs
+    # with no candidate entry cost more than any set of real pairs together,
+    # so the solver only uses one when no eligible vehicle remains.
+    columns = {}
+    for candidates in found:
+        for _, index in candidates:
+            columns.setdefault(index, len(columns))
+    vehicle_of = list(columns)
+    finite = [distance for candidates in found for distance, _ in candidates]
+    if not finite:
+        return {}
+    missing = (max(finite) + 1) * (len(found) + 1)
+    cost = []
+    for candidates in found:
+        row = [missing] * len(columns)
+        for distance, index in candidates:
+            row[columns[index]] = distance
+        cost.append(row)
+
+    transposed = len(cost) > len(columns)
+    if transposed:
+        cost = [list(column) for column in zip(*cost)]
+    matched = {}
+    for row, column in _hungarian(cost):
+        request, column = (column, row) if transposed else (row, column)
+        for distance, index in found[request]:
+            if index == vehicle_of[column]:
+                matched[request] = (index, distance)
+                break
+    return matched
+
+def _hungarian(cost):
+    # Shortest augmenting paths with row and column potentials, O(n^2 m) for
+    # n rows and m >= n columns. Returns [(row, column)] covering every row.
+    n, m = len(cost), len(cost[0])
+    inf = float("inf")
+    u = [0] * (n + 1)
+    v = [0] * (m + 1)
+    owner = [0] * (m + 1)  # Row matched to each column, 1-based; column 0 is a sentinel
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    reduced = row[j - 1] - ui0 - v[j]
+                    if reduced < minv[j]:
+                        minv[j] = reduced
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    return [(owner[j] - 1, j - 1) for j in range(1, m + 1) if owner[j]]
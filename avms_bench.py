@@ -0,0 +1,210 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from avms_main import (VehicleHashTable, heap_sort_vehicles_by_distance, quick_sort_vehicles_by_battery,
+                       sort_vehicles, battery_desc_distance_asc_key, k_nearest_vehicles)
+from avms_assign import assign_requests
+from avms_dispatch import nearest_vehicles_to
+from avms_generators import grid_city, random_geometric, scale_free, fleet
+
+# Benchmark suite. Each case times individual operations, so results carry
+# latency percentiles as well as throughput. Results are written as JSON and
+# can be compared against a stored baseline to flag regressions.
+
+class Measurement:
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.latencies = []
+
+    def time(self, operation, *args):
+        started = time.perf_counter()
+        result = operation(*args)
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    def result(self):
+        latencies = sorted(self.latencies)
+        total = sum(latencies)
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e6 if latencies else 0.0
+        return {
+            "name": self.name,
+            "size": self.size,
+            "ops": len(latencies),
+            "seconds": total,
+            "throughput": len(latencies) / total if total > 0 else 0.0,
+            "p50_us": percentile(0.50),
+            "p95_us": percentile(0.95),
+            "p99_us": percentile(0.99),
+        }
+
+def _network(kind, size, seed):
+    if kind == "grid":
+        side = max(2, int(size ** 0.5))
+        return grid_city(side, side, seed)
+    if kind == "geometric":
+        return random_geometric(size, seed=seed)[0]
+    if kind == "scale-free":
+        return scale_free(size, seed=seed)
+    raise ValueError(f"Unknown network kind: {kind}")
+
+def bench_hash_table(size, queries, seed):
+    rng = random.Random(seed)
+    vehicles = fleet(grid_city(4, 4, seed), size, seed=seed)
+    table = VehicleHashTable()
+    put, get, churn = Measurement("hash.put", size), Measurement("hash.get", size), Measurement("hash.churn", size)
+    for vehicle in vehicles:
+        put.time(table.put, vehicle.vehicle_id, vehicle)
+    ids = [vehicle.vehicle_id for vehicle in vehicles]
+    for _ in range(queries):
+        get.time(table.get, rng.choice(ids))
+    # Churn: deregister and re-register, which exercises tombstone handling
+    for _ in range(queries // 2):
+        vehicle = vehicles[rng.randrange(size)]
+        churn.time(table.remove, vehicle.vehicle_id)
+        churn.time(table.put, vehicle.vehicle_id, vehicle)
+    drain = Measurement("hash.remove", size)
+    for vid in ids:
+        drain.time(table.remove, vid)
+    return [put.result(), get.result(), churn.result(), drain.result()]
+
+def bench_graph(kind, size, queries, seed):
+    rng = random.Random(seed)
+    graph = _network(kind, size, seed)
+    labels = list(graph.nodes)
+    is_path = Measurement(f"graph.{kind}.is_path", size)
+    for _ in range(queries):
+        is_path.time(graph.is_path, rng.choice(labels), rng.choice(labels))
+    # A small set of shared destinations, as in a real fleet, so the route cache shows
+    destinations = [rng.choice(labels) for _ in range(max(1, min(50, queries // 20)))]
+    route = Measurement(f"graph.{kind}.shortest_distance", size)
+    for _ in range(min(queries, 2000)):
+        route.time(graph.shortest_distance, rng.choice(labels), rng.choice(destinations))
+    return [is_path.result(), route.result()]
+
+def bench_sorts(size, repeats, seed):
+    results = []
+    network = grid_city(4, 4, seed)
+    for distribution in ("uniform", "ties"):
+        vehicles = fleet(network, size, distribution, seed)
+        heap = Measurement(f"sort.heap_distance.{distribution}", size)
+        quick = Measurement(f"sort.quick_battery.{distribution}", size)
+        multi = Measurement(f"sort.stable_battery_distance.{distribution}", size)
+        for _ in range(repeats):
+            heap.time(heap_sort_vehicles_by_distance, vehicles)
+            arr = list(vehicles)
+            quick.time(quick_sort_vehicles_by_battery, arr, 0, len(arr) - 1)
+            multi.time(sort_vehicles, vehicles, battery_desc_distance_asc_key, False, True)
+        results += [heap.result(), quick.result(), multi.result()]
+    return results
+
+def bench_recommendations(size, queries, seed):
+    rng = random.Random(seed)
+    side = max(2, int((size / 10) ** 0.5))
+    network = grid_city(side, side, seed)
+    vehicles = fleet(network, size, "ties", seed)
+    table = VehicleHashTable()
+    table.reserve(size)
+    for vehicle in vehicles:
+        table.put(vehicle.vehicle_id, vehicle)
+    labels = list(network.nodes)
+    nearest = Measurement("recommend.nearest", size)
+    top_k = Measurement("recommend.k_highest_battery_10", size)
+    filtered = Measurement("recommend.k_nearest_10_min_battery_50", size)
+    update = Measurement("recommend.telemetry_update", size)
+    dispatch = Measurement("recommend.dispatch_5", size)
+    for _ in range(queries):
+        nearest.time(table.nearest_vehicle, True)
+        top_k.time(table.k_highest_battery, 10)
+        filtered.time(table.k_nearest, 10, 50)
+        vehicle = vehicles[rng.randrange(size)]
+        update.time(vehicle.set_battery_level, rng.randint(0, 100))
+    for _ in range(min(queries, 500)):
+        dispatch.time(nearest_vehicles_to, network, table, rng.choice(labels), 5)
+    selection = Measurement("recommend.k_nearest_vehicles_list_10", size)
+    for _ in range(min(queries, 5)):
+        selection.time(k_nearest_vehicles, vehicles, 10)
+    return [nearest.result(), top_k.result(), filtered.result(), update.result(),
+            dispatch.result(), selection.result()]
+
+def bench_assign(size, seed):
+    # Batches are capped at 5,000 requests x 5,000 vehicles, one dispatch tick's worth
+    rng = random.Random(seed)
+    batch = min(size, 5000)
+    side = max(2, int((batch * 2) ** 0.5))
+    network = grid_city(side, side, seed)
+    table = VehicleHashTable()
+    for vehicle in fleet(network, batch, seed=seed):
+        table.put(vehicle.vehicle_id, vehicle)
+    labels = list(network.nodes)
+    results = []
+    for method, requests in (("hungarian", min(batch, 100)), ("greedy", batch)):
+        measurement = Measurement(f"assign.{method}", requests)
+        for _ in range(3):
+            pickups = [rng.choice(labels) for _ in range(requests)]
+            measurement.time(assign_requests, network, table, pickups, None, None, method)
+        results.append(measurement.result())
+    return results
+
+SUITES = {
+    "hash": lambda size, args: bench_hash_table(size, args.queries, args.seed),
+    "graph": lambda size, args: [r for kind in args.networks.split(",")
+                                 for r in bench_graph(kind, size, args.queries, args.seed)],
+    "sort": lambda size, args: bench_sorts(size, args.repeats, args.seed),
+    "recommend": lambda size, args: bench_recommendations(size, args.queries, args.seed),
+    "assign": lambda size, args: bench_assign(size, args.seed),
+}
+
+def compare(results, baseline, tolerance):
+    # Returns (name, size, baseline throughput, current throughput) for every
+    # case that got slower than the tolerance allows
+    previous = {(r["name"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["name"], result["size"]))
+        if old and result["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append((result["name"], result["size"], old["throughput"], result["throughput"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AVMS data structures.")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated entity counts, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--suites", default=",".join(SUITES))
+    parser.add_argument("--networks", default="grid,geometric,scale-free")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per sort case")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop before flagging")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        for suite in args.suites.split(","):
+            for result in SUITES[suite](size, args):
+                results.append(result)
+                print(f"{result['name']:<45} n={size:<8} {result['throughput']:>14,.0f} ops/s  "
+                      f"p50={result['p50_us']:.1f}us p99={result['p99_us']:.1f}us")
+
+    with open(args.output, "w") as f:
+        json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                   "timestamp": time.time(), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, size, old, new in regressions:
+            print(f"REGRESSION {name} n={size}: {old:,.0f} -> {new:,.0f} ops/s")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
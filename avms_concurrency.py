@@ -0,0 +1,261 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from avms_main import DSAGraph, FrozenDSAGraph, VehicleHashTable, plain_number
+from avms_dispatch import nearest_vehicles_to
+from avms_ingest import apply_telemetry_batch, load_locations, load_roads, load_vehicles, parse_positive_int
+
+class ReadWriteLock:
+    # Many readers or one writer. Waiting writers block new readers, so a
+    # steady stream of queries cannot starve telemetry updates.
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self, blocking=True):
+        # Without blocking, returns False instead of waiting for writers
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                if not blocking:
+                    return False
+                self._condition.wait()
+            self._readers += 1
+            return True
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    def reading(self):
+        return _Held(self.acquire_read, self.release_read)
+
+    def writing(self):
+        return _Held(self.acquire_write, self.release_write)
+
+class _Held:
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._release()
+
+def vehicle_record(vehicle):
+    # Plain copy of a vehicle's fields, safe to hand out after the lock is released
+    if vehicle is None:
+        return None
+    distance = vehicle.get_distance_to_destination()
+    return {
+        "id": vehicle.vehicle_id,
+        "location": vehicle.get_location(),
+        "destination": vehicle.get_destination(),
+        "distance": None if distance == float("inf") else plain_number(distance),  # None: unreachable
+        "battery": plain_number(vehicle.get_battery_level()),
+        "class": vehicle.vehicle_class,
+    }
+
+class ConcurrentAVMS:
+    # Thread-safe front for one road network and fleet. Writers take the write
+    # lock one at a time; reads never wait for them. Fleet reads and dispatch
+    # use a frozen copy of the fleet that each write publishes as it finishes
+    # (VehicleHashTable.freeze: typed arrays and lists copied wholesale, about
+    # 7 ms at 100k vehicles). Path queries run on a copy-on-write
+    # FrozenDSAGraph that is rebuilt after the network has changed; while a
+    # writer holds or waits for the lock, the previous one keeps answering.
+    # The graph can also start as a FrozenDSAGraph, e.g. Snapshot.graph() over
+    # a mapped file: reads are served from it directly, and it is thawed into
+    # a DSAGraph by the first write, so startup does not pay O(size) to
+    # rebuild the network.
+    READ_OPERATIONS = {
+        "get_vehicle", "vehicles_at", "vehicles_heading_to", "nearest_vehicle",
+        "highest_battery_vehicle", "k_nearest", "k_highest_battery", "dispatch",
+        "is_path", "shortest_path", "shortest_distance",
+    }
+
+    def __init__(self, graph=None, table=None, workers=4):
+        self._graph = graph if graph is not None else DSAGraph()
+        self.table = table if table is not None else VehicleHashTable()
+        self.lock = ReadWriteLock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)  # Runs reads, here and in AVMSServer
+        self._fleet = self.table.freeze()
+        self._frozen = None
+        self._frozen_version = -1
+        if isinstance(self._graph, FrozenDSAGraph):
+            self._frozen, self._graph = self._graph, None
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def graph(self):
+        # The mutable network, thawed from the starting FrozenDSAGraph on first
+        # use. Only writers (holding the write lock) should touch it.
+        if self._graph is None:
+            graph = self._frozen.thaw()
+            self._frozen_version = graph.version  # The frozen graph is still current
+            self._graph = graph
+        return self._graph
+
+    def network(self):
+        # Replacing the reference is atomic, so readers see either the old or
+        # the new snapshot, never one that is half built.
+        frozen = self._frozen
+        if self._graph is None:
+            return frozen  # Not thawed yet, so nothing has changed it
+        if frozen is None or self._frozen_version != self._graph.version:
+            if not self.lock.acquire_read(blocking=frozen is None):
+                return frozen  # A write is running or queued: answer as of before it
+            try:
+                version = self.graph.version
+                frozen = self.graph.freeze()
+            finally:
+                self.lock.release_read()
+            self._frozen, self._frozen_version = frozen, version
+        return frozen
+
+    def fleet(self):
+        # Frozen VehicleHashTable as of the last completed write
+        return self._fleet
+
+    def _writing(self):
+        # The write lock; releasing it publishes the fleet as the write left it
+        return _Held(self.lock.acquire_write, self._publish_and_release)
+
+    def _publish_and_release(self):
+        try:
+            self._fleet = self.table.freeze()
+        finally:
+            self.lock.release_write()
+
+    # Reads
+
+    def get_vehicle(self, vid):
+        return vehicle_record(self._fleet.get(vid))
+
+    def vehicles_at(self, location):
+        return [vehicle_record(v) for v in self._fleet.vehicles_at(location)]
+
+    def vehicles_heading_to(self, destination):
+        return [vehicle_record(v) for v in self._fleet.vehicles_heading_to(destination)]
+
+    def nearest_vehicle(self, feasible_only=True):
+        return vehicle_record(self._fleet.nearest_vehicle(feasible_only))
+
+    def highest_battery_vehicle(self, feasible_only=True):
+        return vehicle_record(self._fleet.highest_battery_vehicle(feasible_only))
+
+    def k_nearest(self, k, min_battery=None, location=None, feasible_only=True):
+        return [vehicle_record(v) for v in self._fleet.k_nearest(k, min_battery, location, feasible_only)]
+
+    def k_highest_battery(self, k, min_battery=None, location=None, feasible_only=True):
+        return [vehicle_record(v) for v in self._fleet.k_highest_battery(k, min_battery, location, feasible_only)]
+
+    def dispatch(self, pickup, k=1, min_battery=None, feasible_only=True):
+        found = nearest_vehicles_to(self.network(), self._fleet, pickup, k, min_battery, feasible_only=feasible_only)
+        return [(vehicle_record(v), distance) for v, distance in found]
+
+    def is_path(self, source, destination):
+        return self.network().is_path(source, destination)
+
+    def shortest_path(self, source, destination):
+        return self.network().shortest_path(source, destination)
+
+    def shortest_distance(self, source, destination):
+        return self.network().shortest_distance(source, destination)
+
+    def batch_query(self, queries):
+        # Fans (operation, *args) tuples out across the worker pool and returns
+        # the results in order. Only read operations are accepted.
+        futures = []
+        for query in queries:
+            operation, args = query[0], query[1:]
+            if operation not in self.READ_OPERATIONS:
+                raise ValueError(f"Unknown or non-read operation: {operation}")
+            futures.append(self.executor.submit(getattr(self, operation), *args))
+        return [future.result() for future in futures]
+
+    # Writes. Each returns the IngestReport from the shared validation code.
+
+    def add_location(self, location, charger=False):
+        with self._writing():
+            return load_locations(self.graph, [{"location": location, "charger": "1" if charger else ""}])
+
+    def add_road(self, loc1, loc2, distance):
+        with self._writing():
+            version = self.graph.version
+            report = load_roads(self.graph, [{"from": loc1, "to": loc2, "distance": distance}])
+            self.table.refresh_distances(self.graph, version)
+            return report
+
+    # Road changes return the ids of vehicles left without a route to their
+    # destination, or None when the road or location does not exist.
+
+    def update_road(self, loc1, loc2, distance):
+        # Same rules as add_road: a positive whole number of km
+        try:
+            distance = parse_positive_int(distance)
+        except ValueError as e:
+            raise ValueError(f"Distance between {loc1} and {loc2} {e}.") from None
+        with self._writing():
+            version = self.graph.version
+            if not self.graph.update_edge_weight(loc1, loc2, distance):
+                return None
+            return [v.vehicle_id for v in self.table.refresh_distances(self.graph, version)]
+
+    def close_road(self, loc1, loc2):
+        with self._writing():
+            version = self.graph.version
+            if not self.graph.remove_edge(loc1, loc2):
+                return None
+            return [v.vehicle_id for v in self.table.refresh_distances(self.graph, version)]
+
+    def remove_location(self, location):
+        # Refused while vehicles are at or heading to the location, as in the menu
+        with self._writing():
+            users = self.table.vehicles_using(location)
+            if users:
+                raise ValueError(f"Location {location} is used by {len(users)} vehicle(s): "
+                                 f"{', '.join(sorted(vehicle.vehicle_id for vehicle in users))}.")
+            version = self.graph.version
+            if not self.graph.remove_node(location):
+                return None
+            return [v.vehicle_id for v in self.table.refresh_distances(self.graph, version)]
+
+    def add_vehicle(self, record):
+        with self._writing():
+            return load_vehicles(self.graph, self.table, [record])
+
+    def remove_vehicle(self, vid):
+        with self._writing():
+            return self.table.remove(vid)
+
+    def apply_updates(self, records):
+        with self._writing():
+            return apply_telemetry_batch(self.graph, self.table, records)
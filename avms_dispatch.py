@@ -0,0 +1,33 @@
+from avms_main import ENERGY_MODELS, sort_vehicles, battery_key
+
+def nearest_vehicles_to(graph, table, pickup, k=1, min_battery=None, max_distance=None, feasible_only=False):
+    # Bounded Dijkstra outward from the pickup over the road network. Vehicles
+    # are collected from each location as it is settled via the fleet's
+    # location index, and the search stops once k have been found, so the
+    # cost depends on how dense the fleet is around the pickup rather than on
+    # fleet or network size. Returns [(vehicle, road distance)], nearest first;
+    # vehicles at the same location are ordered by battery, highest first.
+    # With feasible_only, vehicles without the range to reach the pickup are
+    # skipped and the search never goes past the best range in the fleet.
+    found = []
+    if k <= 0 or not graph.has_node(pickup):
+        return found
+    if feasible_only:
+        best = table.highest_battery_vehicle()
+        if best is None:
+            return found
+        fleet_range = best.get_battery_level() * max(ENERGY_MODELS.values())
+        max_distance = fleet_range if max_distance is None else min(max_distance, fleet_range)
+    for location, distance in graph.nodes_by_distance(pickup, max_distance):
+        if table.count_at(location) == 0:
+            continue
+        candidates = table.vehicles_at(location)
+        if min_battery is not None:
+            candidates = [v for v in candidates if v.get_battery_level() >= min_battery]
+        if feasible_only:
+            candidates = [v for v in candidates if v.can_travel(distance)]
+        for vehicle in sort_vehicles(candidates, battery_key, reverse=True):
+            found.append((vehicle, distance))
+            if len(found) == k:
+                return found
+    return found
@@ -0,0 +1,100 @@
+from avms_main import DSAHeap, ENERGY_MODELS
+
+# Range-aware routing. Works on DSAGraph and FrozenDSAGraph alike through
+# has_node/get_neighbors/is_charger. A vehicle's range is its battery level
+# times the km-per-percent of its class (see ENERGY_MODELS).
+
+def route_within_range(graph, source, destination, range_km):
+    # Dijkstra from the source that never extends a route past range_km, so
+    # the search stops as soon as the battery would run out.
+    if not graph.has_node(source) or not graph.has_node(destination):
+        return [], None
+    distances = {source: 0}
+    parent = {}
+    settled = set()
+    heap = DSAHeap(None)
+    heap.add(0, source)
+    while heap.count > 0:
+        entry = heap.remove()
+        current = entry.value
+        if current in settled:
+            continue
+        settled.add(current)
+        if current == destination:
+            return _unwind(parent, destination), entry.priority
+        for neighbor, distance in graph.get_neighbors(current):
+            candidate = entry.priority + distance
+            if candidate > range_km:
+                continue
+            if neighbor not in distances or candidate < distances[neighbor]:
+                distances[neighbor] = candidate
+                parent[neighbor] = current
+                heap.add(candidate, neighbor)
+    return [], None
+
+def can_reach(graph, vehicle, destination):
+    return route_within_range(graph, vehicle.get_location(), destination, vehicle.get_range())[1] is not None
+
+def plan_route_with_charging(graph, source, destination, range_km, full_range_km):
+    # Resource-constrained shortest path: the state is (location, range left)
+    # and arriving at a charger restores full_range_km. States leave the heap
+    # in order of distance, so one reaching a location with no more range than
+    # an earlier state there is dominated and dropped.
+    # Returns (route, distance, charging stops) or ([], None, []).
+    if not graph.has_node(source) or not graph.has_node(destination):
+        return [], None, []
+    states = [(source, -1)]  # (location, parent state) for route reconstruction
+    best_range = {}
+    heap = DSAHeap(None)
+    heap.add(0, (0, range_km))
+    while heap.count > 0:
+        entry = heap.remove()
+        state, remaining = entry.value
+        location = states[state][0]
+        if remaining <= best_range.get(location, -1):
+            continue
+        best_range[location] = remaining
+        if location == destination:
+            route = []
+            while state >= 0:
+                route.append(states[state][0])
+                state = states[state][1]
+            route.reverse()
+            return route, entry.priority, _charging_stops(graph, route, range_km, full_range_km)
+        if graph.is_charger(location):
+            remaining = max(remaining, full_range_km)
+        for neighbor, distance in graph.get_neighbors(location):
+            if distance <= remaining and remaining - distance > best_range.get(neighbor, -1):
+                states.append((neighbor, state))
+                heap.add(entry.priority + distance, (len(states) - 1, remaining - distance))
+    return [], None, []
+
+def plan_vehicle_route(graph, vehicle, destination):
+    full_range = 100 * ENERGY_MODELS[vehicle.vehicle_class]
+    return plan_route_with_charging(graph, vehicle.get_location(), destination, vehicle.get_range(), full_range)
+
+def _charging_stops(graph, route, range_km, full_range_km):
+    # The search tops up at every charger it passes. Along the chosen route,
+    # charging only at the last charger before the range would run out gives
+    # the fewest stops.
+    travelled = [0]  # Distance from the start to each route position
+    for i in range(len(route) - 1):
+        travelled.append(travelled[-1] + dict(graph.get_neighbors(route[i]))[route[i + 1]])
+    stops = []
+    last_charger = -1
+    base_position, base_range = 0, range_km
+    for i in range(len(route) - 1):
+        if graph.is_charger(route[i]):
+            last_charger = i
+        if travelled[i + 1] - travelled[base_position] > base_range:
+            stops.append(route[last_charger])
+            base_position, base_range = last_charger, full_range_km
+            last_charger = -1
+    return stops
+
+def _unwind(parent, destination):
+    route = [destination]
+    while route[-1] in parent:
+        route.append(parent[route[-1]])
+    route.reverse()
+    return route
@@ -0,0 +1,94 @@
+import math
+import random
+
+from avms_main import DSAGraph, ENERGY_MODELS, Vehicle
+
+# Deterministic synthetic road networks and fleets for benchmarks and
+# load tests. Every generator takes a seed, so the same arguments always
+# produce the same data.
+
+def grid_city(rows, cols, seed=1, min_distance=1, max_distance=10):
+    rng = random.Random(seed)
+    graph = DSAGraph()
+    for r in range(rows):
+        for c in range(cols):
+            graph.add_node(f"N{r}-{c}")
+    for r in range(rows):
+        for c in range(cols):
+            if c + 1 < cols:
+                graph.add_edge(f"N{r}-{c}", f"N{r}-{c + 1}", rng.randint(min_distance, max_distance))
+            if r + 1 < rows:
+                graph.add_edge(f"N{r}-{c}", f"N{r + 1}-{c}", rng.randint(min_distance, max_distance))
+    return graph
+
+def random_geometric(count, side_km=100.0, degree=6, seed=1):
+    # Points scattered over a side_km square, joined to every neighbour within
+    # the radius that gives roughly `degree` roads per location. Roads are the
+    # straight-line distance rounded up, so they are never shorter than it.
+    rng = random.Random(seed)
+    points = [(rng.uniform(0, side_km), rng.uniform(0, side_km)) for _ in range(count)]
+    radius = side_km * math.sqrt(degree / (math.pi * max(count, 1)))
+    cells = {}
+    for i, (x, y) in enumerate(points):
+        cells.setdefault((int(x // radius), int(y // radius)), []).append(i)
+
+    graph = DSAGraph()
+    for i, (x, y) in enumerate(points):
+        graph.add_node(f"G{i}", x, y)
+    for i, (x, y) in enumerate(points):
+        cx, cy = int(x // radius), int(y // radius)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in cells.get((cx + dx, cy + dy), ()):
+                    if j > i:
+                        d = math.hypot(x - points[j][0], y - points[j][1])
+                        if d <= radius:
+                            graph.add_edge(f"G{i}", f"G{j}", max(1, math.ceil(d)))
+    return graph, points
+
+def scale_free(count, links=2, seed=1, min_distance=1, max_distance=20):
+    # Barabasi-Albert preferential attachment: a few hubs with many roads
+    rng = random.Random(seed)
+    graph = DSAGraph()
+    endpoints = []  # Every road end once, so picking from it is degree-weighted
+    for i in range(count):
+        graph.add_node(f"H{i}")
+        if i == 0:
+            continue
+        targets = set()
+        while len(targets) < min(links, i):
+            targets.add(rng.choice(endpoints) if endpoints else rng.randrange(i))
+        for j in targets:
+            graph.add_edge(f"H{i}", f"H{j}", rng.randint(min_distance, max_distance))
+            endpoints += (i, j)
+    return graph
+
+def vehicle_ids(count, prefix="AV-", width=None):
+    # Sequential IDs such as AV-0001, the scheme that defeats ordinal-sum hashes
+    width = width or max(4, len(str(count - 1)))
+    return [f"{prefix}{i:0{width}d}" for i in range(count)]
+
+def battery_levels(count, distribution="uniform", seed=1):
+    rng = random.Random(seed)
+    if distribution == "uniform":
+        return [rng.randint(0, 100) for _ in range(count)]
+    if distribution == "ties":
+        # Morning after overnight charging: most of the fleet sits at 100%
+        return [100 if rng.random() < 0.7 else rng.randint(0, 100) for _ in range(count)]
+    if distribution == "full":
+        return [100] * count
+    raise ValueError(f"Unknown battery distribution: {distribution}")
+
+def fleet(graph, count, distribution="uniform", seed=1):
+    # Vehicles at random locations with random trip distances, so building a
+    # large fleet needs no route searches. Not inserted anywhere, so callers
+    # can time the inserts.
+    rng = random.Random(seed)
+    labels = list(graph.nodes)
+    classes = list(ENERGY_MODELS)
+    vehicles = []
+    for vid, battery in zip(vehicle_ids(count), battery_levels(count, distribution, seed)):
+        vehicle = Vehicle(vid, rng.choice(labels), rng.choice(labels), battery, rng.choice(classes))
+        vehicle.set_distance_to_destination(rng.randint(0, 500))
+        vehicles.append(vehicle)
+    return vehicles
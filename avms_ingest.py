@@ -0,0 +1,332 @@
+import argparse
+import csv
+import json
+import math
+import time
+
+from avms_main import DEFAULT_VEHICLE_CLASS, ENERGY_MODELS, DSAGraph, VehicleHashTable, Vehicle
+from avms_snapshot import SnapshotError, load_snapshot, save_snapshot
+
+class IngestReport:
+    def __init__(self, name):
+        self.name = name
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []  # First few validation errors, for diagnosis
+        self.failed = {}  # Record position -> error, for telemetry updates
+        self.elapsed = 0.0
+        self.max_errors = 20
+
+    def reject(self, message, records=1, key=None):
+        self.rejected += records
+        if key is not None:
+            self.failed[key] = message
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
+
+    def merge(self, other):
+        base = self.accepted + self.rejected  # other's positions follow on from ours
+        self.accepted += other.accepted
+        self.rejected += other.rejected
+        self.elapsed += other.elapsed
+        for position, message in other.failed.items():
+            self.failed[base + position] = message
+        for message in other.errors:
+            if len(self.errors) < self.max_errors:
+                self.errors.append(message)
+
+    def rate(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return (self.accepted + self.rejected) / self.elapsed
+
+    def __str__(self):
+        return (f"{self.name}: {self.accepted} accepted, {self.rejected} rejected "
+                f"in {self.elapsed:.3f}s ({self.rate():,.0f} records/s)")
+
+def read_records(path):
+    # Yields one dict per record from a .csv (header row) or .jsonl file
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+def _text(record, field):
+    value = record.get(field)
+    return "" if value is None else str(value).strip()
+
+def _integer(value):
+    # Same rules as the menu's int(input(...)): whole numbers only
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(value)
+    return int(value)
+
+def parse_positive_int(value):
+    # A positive whole number, as for road distances. The ValueError says
+    # what was wrong, for the caller to prefix with the field.
+    try:
+        value = _integer(value)
+    except ValueError:
+        raise ValueError("must be a valid integer") from None
+    if value <= 0:
+        raise ValueError("must be a positive integer")
+    return value
+
+def _coordinate(value):
+    # Finite number, or None when the field is absent
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(value)
+    return value
+
+def load_locations(graph, records):
+    report = IngestReport("locations")
+    start = time.perf_counter()
+    for record in records:
+        location = _text(record, "location")
+        if not location:
+            report.reject("Location name cannot be empty.")
+            continue
+        try:
+            x, y = _coordinate(record.get("x")), _coordinate(record.get("y"))
+            placed = (x is None) == (y is None)
+        except (TypeError, ValueError):
+            placed = False
+        if not placed:
+            report.reject(f"Coordinates for {location} must be two numbers.")
+        elif not graph.add_node(location, x, y):
+            report.reject(f"Location {location} already exists.")
+        else:
+            if _text(record, "charger").lower() in ("1", "true", "yes"):
+                graph.set_charger(location)
+            report.accepted += 1
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def load_roads(graph, records):
+    report = IngestReport("roads")
+    start = time.perf_counter()
+    for record in records:
+        loc1, loc2 = _text(record, "from"), _text(record, "to")
+        if loc1 not in graph.nodes:
+            report.reject(f"Location {loc1} does not exist.")
+            continue
+        if loc2 not in graph.nodes:
+            report.reject(f"Location {loc2} does not exist.")
+            continue
+        if loc1 == loc2:
+            report.reject("Locations must be different.")
+            continue
+        try:
+            distance = parse_positive_int(record.get("distance"))
+        except ValueError as e:
+            report.reject(f"Distance between {loc1} and {loc2} {e}.")
+            continue
+        if not graph.add_edge(loc1, loc2, distance):
+            report.reject(f"Road between {loc1} and {loc2} already exists.")
+            continue
+        report.accepted += 1
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def load_vehicles(graph, table, records):
+    records = list(records)
+    report = IngestReport("vehicles")
+    start = time.perf_counter()
+    table.reserve(table.count + len(records))
+    for record in records:
+        vid = _text(record, "id")
+        location = _text(record, "location")
+        destination = _text(record, "destination")
+        vehicle_class = _text(record, "class") or DEFAULT_VEHICLE_CLASS
+        if not vid:
+            report.reject("Vehicle ID cannot be empty.")
+            continue
+        if not location:
+            report.reject(f"Location for {vid} cannot be empty.")
+            continue
+        if not destination:
+            report.reject(f"Destination for {vid} cannot be empty.")
+            continue
+        if location not in graph.nodes:
+            report.reject(f"Location {location} does not exist in road network.")
+            continue
+        if destination not in graph.nodes:
+            report.reject(f"Destination {destination} does not exist in road network.")
+            continue
+        try:
+            battery = _integer(record.get("battery"))
+        except ValueError:
+            report.reject(f"Battery level for {vid} must be a valid integer.")
+            continue
+        if not 0 <= battery <= 100:
+            report.reject(f"Battery level for {vid} must be between 0 and 100.")
+            continue
+        if vehicle_class not in ENERGY_MODELS:
+            report.reject(f"Unknown vehicle class {vehicle_class} for {vid}.")
+            continue
+        distance = graph.shortest_distance(location, destination)
+        if distance is None:
+            report.reject(f"No path exists between {location} and {destination}.")
+            continue
+
+        vehicle = Vehicle(vid, location, destination, battery, vehicle_class)
+        vehicle.set_distance_to_destination(distance)
+        if not table.put(vid, vehicle):  # Single probe doubles as the duplicate check
+            report.reject(f"Vehicle {vid} already exists.")
+            continue
+        report.accepted += 1
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def batched(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _telemetry_update(graph, table, pending, record):
+    # Checks one record against its vehicle as left by the batch's earlier
+    # accepted records and folds it into pending. Returns an error, or None.
+    vid = _text(record, "id")
+    if not vid:
+        return "Vehicle ID cannot be empty."
+    state = pending.get(vid)
+    if state is None:
+        vehicle = table.get(vid)
+        if vehicle is None:
+            return f"Vehicle {vid} not found."
+        state = [vehicle, vehicle.get_location(), vehicle.get_destination(), vehicle.get_battery_level()]
+    location, destination, battery = state[1:]
+    if record.get("location") not in (None, ""):
+        location = _text(record, "location")
+        if location not in graph.nodes:
+            return f"Location {location} does not exist in road network."
+    elif record.get("x") not in (None, "") or record.get("y") not in (None, ""):
+        try:
+            x, y = _coordinate(record.get("x")), _coordinate(record.get("y"))
+        except (TypeError, ValueError):
+            x = y = None
+        if x is None or y is None:
+            return f"Position for {vid} must be two numbers."
+        nearest = graph.spatial_index().nearest(x, y)
+        if nearest is None:
+            return f"No location has coordinates to place {vid} at."
+        location = nearest[0]
+    if record.get("destination") not in (None, ""):
+        destination = _text(record, "destination")
+        if destination not in graph.nodes:
+            return f"Destination {destination} does not exist in road network."
+    if record.get("battery") not in (None, ""):
+        try:
+            battery = _integer(record["battery"])
+        except ValueError:
+            battery = -1
+        if not 0 <= battery <= 100:
+            return f"Battery level for {vid} must be an integer between 0 and 100."
+    if (location != state[1] or destination != state[2]) and not graph.is_path(location, destination):
+        return f"No path exists between {location} and {destination}."
+    state[1:] = location, destination, battery
+    pending[vid] = state
+    return None
+
+def apply_telemetry_batch(graph, table, batch):
+    # Each record is validated on its own, so a bad record never takes a
+    # valid one for the same vehicle down with it; report.failed maps the
+    # position of each rejected record in the batch to its error. Accepted
+    # records are then coalesced per vehicle (last value per field wins) so
+    # each vehicle's indexes, heaps and route distance are touched at most
+    # once. A record may give a GPS position (x, y) instead of a location; it
+    # is snapped to the nearest location with coordinates.
+    report = IngestReport("telemetry")
+    start = time.perf_counter()
+    pending = {}  # vehicle id -> [vehicle, location, destination, battery]
+    for position, record in enumerate(batch):
+        error = _telemetry_update(graph, table, pending, record)
+        if error is None:
+            report.accepted += 1
+        else:
+            report.reject(error, key=position)
+
+    for vehicle, location, destination, battery in pending.values():
+        if location != vehicle.get_location() or destination != vehicle.get_destination():
+            vehicle.set_location(location)
+            vehicle.set_destination(destination)
+            vehicle.set_distance_to_destination(graph.shortest_distance(location, destination))
+        if battery != vehicle.get_battery_level():
+            vehicle.set_battery_level(battery)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+def stream_telemetry(graph, table, records, batch_size=10000):
+    # Generator pipeline: records -> batches -> applied batches, yielding one
+    # report per batch so callers can track throughput while replaying.
+    for batch in batched(records, batch_size):
+        yield apply_telemetry_batch(graph, table, batch)
+
+def apply_telemetry(graph, table, records, batch_size=10000):
+    total = IngestReport("telemetry")
+    for report in stream_telemetry(graph, table, records, batch_size):
+        total.merge(report)
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load AVMS data without the interactive menu.")
+    parser.add_argument("--locations", help="CSV/JSONL file with a 'location' field and optional 'charger' flag and 'x', 'y' coordinates")
+    parser.add_argument("--roads", help="CSV/JSONL file with 'from', 'to' and 'distance' fields")
+    parser.add_argument("--vehicles", help="CSV/JSONL file with 'id', 'location', 'destination', 'battery' and optional 'class' fields")
+    parser.add_argument("--telemetry", help="CSV/JSONL file of updates with 'id' and any of 'location' (or 'x', 'y'), 'destination', 'battery'")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--snapshot", help="Snapshot file to load into; saved back in place unless --out is given")
+    parser.add_argument("--out", help="Snapshot file to save the resulting network and fleet to")
+    args = parser.parse_args()
+
+    graph = DSAGraph()
+    table = VehicleHashTable()
+    if args.snapshot:
+        try:
+            with load_snapshot(args.snapshot, verify=True) as snapshot:
+                graph = snapshot.thaw_graph()
+                table = snapshot.load_fleet()
+        except (OSError, SnapshotError) as e:
+            parser.exit(1, f"Error: Could not load snapshot: {e}\n")
+    reports = []
+    if args.locations:
+        reports.append(load_locations(graph, read_records(args.locations)))
+    if args.roads:
+        reports.append(load_roads(graph, read_records(args.roads)))
+    if args.vehicles:
+        reports.append(load_vehicles(graph, table, read_records(args.vehicles)))
+    if args.telemetry:
+        reports.append(apply_telemetry(graph, table, read_records(args.telemetry), args.batch_size))
+    for report in reports:
+        print(report)
+        for message in report.errors:
+            print(f"  Error: {message}")
+
+    stats = graph.stats()
+    print(f"Result: {stats['nodes']} locations, {stats['edges']} roads, {table.count} vehicles")
+    out = args.out or args.snapshot
+    if out:
+        try:
+            save_snapshot(out, graph, table)
+        except OSError as e:
+            parser.exit(1, f"Error: Could not save snapshot: {e}\n")
+        print(f"Snapshot saved to {out}.")
+    else:
+        print("Not saved; pass --out to keep the result as a snapshot.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import random
+import time
+
+from avms_server import AVMSClient, AVMSServer
+
+# Drives an AVMSServer with a mix of telemetry updates and read queries from
+# several concurrent clients. With no --port it starts a server in-process on a
+# free port and seeds a grid network and fleet first.
+
+async def seed(client, grid, vehicles, rng):
+    labels = [f"N{r}-{c}" for r in range(grid) for c in range(grid)]
+    await asyncio.gather(*(client.call("add_location", location=label, charger=(i % 17 == 0))
+                           for i, label in enumerate(labels)))
+    roads = []
+    for r in range(grid):
+        for c in range(grid):
+            if c + 1 < grid:
+                roads.append((f"N{r}-{c}", f"N{r}-{c + 1}"))
+            if r + 1 < grid:
+                roads.append((f"N{r}-{c}", f"N{r + 1}-{c}"))
+    await asyncio.gather(*(client.call("add_road", **{"from": a, "to": b, "distance": rng.randint(1, 10)})
+                           for a, b in roads))
+    await asyncio.gather(*(client.call("add_vehicle", vehicle_id=f"AV-{i:06d}", location=rng.choice(labels),
+                                       destination=rng.choice(labels), battery=rng.randint(0, 100))
+                           for i in range(vehicles)))
+    return labels
+
+async def worker(client, labels, vehicles, deadline, read_ratio, rng, results):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        if rng.random() < read_ratio:
+            op = rng.choice(("nearest_vehicle", "k_highest_battery", "dispatch", "get_vehicle", "is_path"))
+            if op == "k_highest_battery":
+                response = await client.call(op, k=5)
+            elif op == "dispatch":
+                response = await client.call(op, pickup=rng.choice(labels), k=3)
+            elif op == "get_vehicle":
+                response = await client.call(op, vehicle_id=f"AV-{rng.randrange(vehicles):06d}")
+            elif op == "is_path":
+                response = await client.call(op, source=rng.choice(labels), destination=rng.choice(labels))
+            else:
+                response = await client.call(op)
+        else:
+            op = "update_vehicle"
+            response = await client.call(op, vehicle_id=f"AV-{rng.randrange(vehicles):06d}",
+                                         location=rng.choice(labels), battery=rng.randint(0, 100))
+        results.append((op, time.perf_counter() - started, response.get("ok", False)))
+
+async def run(args):
+    rng = random.Random(args.seed)
+    server = None
+    port = args.port
+    if port is None:
+        server = await AVMSServer().start()
+        port = server.port
+    clients = [await AVMSClient.connect(args.host, port) for _ in range(args.clients)]
+    try:
+        labels = [f"N{r}-{c}" for r in range(args.grid) for c in range(args.grid)]
+        if server is not None:
+            labels = await seed(clients[0], args.grid, args.vehicles, rng)
+        results = []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(client, labels, args.vehicles, deadline, args.read_ratio,
+                                      random.Random(rng.random()), results) for client in clients))
+        elapsed = time.perf_counter() - started
+        print(f"{len(results)} requests in {elapsed:.2f}s ({len(results) / elapsed:,.0f} req/s), "
+              f"{sum(1 for _, _, ok in results if not ok)} failed")
+        by_op = {}
+        for op, latency, ok in results:
+            by_op.setdefault(op, []).append(latency)
+        for op, latencies in sorted(by_op.items()):
+            latencies.sort()
+            print(f"  {op:<20} n={len(latencies):<7} p50={latencies[len(latencies) // 2] * 1000:.2f}ms "
+                  f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+        stats = await clients[0].call("stats")
+        print(f"Server applied {stats['result']['batched_updates']} updates in {stats['result']['batches']} batches")
+    finally:
+        for client in clients:
+            await client.close()
+        if server is not None:
+            await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the AVMS server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="Existing server to target; omit to start one in-process")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds")
+    parser.add_argument("--read-ratio", type=float, default=0.5)
+    parser.add_argument("--grid", type=int, default=20, help="Seeded network is a grid x grid city")
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
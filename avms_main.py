@@ -1,36 +1,255 @@
+import math
+import time
+from array import array
+from collections import OrderedDict
+
+import avms_stats
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; FleetStore queries fall back to pure Python
+    np = None
+
 class DSAGraphNode:
-    def __init__(self, label):
+    def __init__(self, label, x=None, y=None):
         self.label = label
         self.adjacent = []
-        self.visited = False
         self.distance = {}  # Stores distances to neighbors
+        self.charger = False  # Vehicles can recharge here
+        self.x = x  # Optional position in km on a flat map, None when unknown
+        self.y = y
 
     def add_edge(self, node, distance):
-        if node not in self.adjacent:
-            self.adjacent.append(node)
-            self.distance[node.label] = distance
-            node.adjacent.append(self)
-            node.distance[self.label] = distance
+        if node.label in self.distance:  # O(1) duplicate check
+            return False
+        self.adjacent.append(node)
+        self.distance[node.label] = distance
+        node.adjacent.append(self)
+        node.distance[self.label] = distance
+        return True
+
+    def remove_edge(self, node):
+        if node.label not in self.distance:
+            return False
+        self.adjacent.remove(node)
+        del self.distance[node.label]
+        node.adjacent.remove(self)
+        del node.distance[self.label]
+        return True
 
     def __str__(self):
         return self.label
 
+class GraphChange:
+    # One entry in the change feed. routes lists the destinations whose cached
+    # shortest-path trees the change invalidated; every other cached tree was
+    # left exactly as it was.
+    def __init__(self, version, kind, label1, label2=None, distance=None, routes=()):
+        self.version = version
+        self.kind = kind  # add_node, remove_node, add_edge, update_edge, remove_edge or set_charger
+        self.label1 = label1
+        self.label2 = label2
+        self.distance = distance  # New distance for add_edge and update_edge
+        self.routes = routes
+
+CHANGE_LOG_LIMIT = 1024
+ROUTE_CACHE_LIMIT = 64  # Shortest-path trees kept per graph; each holds an entry per location
+
 class DSAGraph:
-    def __init__(self):
+    def __init__(self, route_cache_limit=ROUTE_CACHE_LIMIT):
         self.nodes = {}
+        self._route_cache = OrderedDict()  # destination -> (distances, next_hop), least recently used first
+        self.route_cache_limit = route_cache_limit
+        self._route_versions = {}  # destination -> version its cached tree was built at
+        self._parent = {}  # Union-find over locations, kept in step with add_edge
+        self._component_size = {}
+        self._components_dirty = False  # Set by removals, which union-find cannot undo
+        self.version = 0  # Bumped on every change, so readers can tell a snapshot is stale
+        self._changes = []  # Most recent CHANGE_LOG_LIMIT GraphChanges, oldest first
+        self._spatial = None  # SpatialIndex over located nodes, rebuilt after locations change
+        self._unplaced = 0  # Locations without coordinates
+        self._short_roads = 0  # Roads shorter than the straight line between their ends
+        self._frozen = None  # freeze() result, reused until the next change
 
-    def add_node(self, label):
+    def add_node(self, label, x=None, y=None):
         if label not in self.nodes:
-            self.nodes[label] = DSAGraphNode(label)
+            # A new location is unreachable from everything, so no cached tree changes
+            if x is None or y is None:
+                x = y = None
+            self.nodes[label] = DSAGraphNode(label, x, y)
+            if x is not None:
+                self._spatial = None
+            else:
+                self._unplaced += 1
+            self._parent[label] = label
+            self._component_size[label] = 1
+            self._record("add_node", label)
             return True
         return False
 
     def add_edge(self, label1, label2, distance):
-        if label1 in self.nodes and label2 in self.nodes:
-            self.nodes[label1].add_edge(self.nodes[label2], distance)
+        # Returns False for unknown locations or a road that already exists;
+        # update_edge_weight changes an existing road's distance.
+        if label1 not in self.nodes or label2 not in self.nodes:
+            return False
+        if not self.nodes[label1].add_edge(self.nodes[label2], distance):
+            return False
+        self._short_roads += self._is_short(label1, label2, distance)
+        if not self._components_dirty:
+            self._union(label1, label2)
+        routes = self._drop_routes(lambda distances, next_hop:
+                                   self._improves(distances, label1, label2, distance))
+        self._record("add_edge", label1, label2, distance, routes)
+        return True
+
+    def update_edge_weight(self, label1, label2, distance):
+        node = self.nodes.get(label1)
+        if node is None or label2 not in node.distance:
+            return False
+        old = node.distance[label2]
+        if distance == old:
+            return True
+        node.distance[label2] = distance
+        self.nodes[label2].distance[label1] = distance
+        self._short_roads += self._is_short(label1, label2, distance) - self._is_short(label1, label2, old)
+        # A longer road only matters to trees that route along it; a shorter
+        # one also matters wherever it now beats the current distances.
+        if distance > old:
+            routes = self._drop_routes(lambda distances, next_hop:
+                                       self._uses(next_hop, label1, label2))
+        else:
+            routes = self._drop_routes(lambda distances, next_hop:
+                                       self._uses(next_hop, label1, label2)
+                                       or self._improves(distances, label1, label2, distance))
+        self._record("update_edge", label1, label2, distance, routes)
+        return True
+
+    def remove_edge(self, label1, label2):
+        node = self.nodes.get(label1)
+        if node is None or label2 not in node.distance:
+            return False
+        self._short_roads -= self._is_short(label1, label2, node.distance[label2])
+        node.remove_edge(self.nodes[label2])
+        self._components_dirty = True
+        routes = self._drop_routes(lambda distances, next_hop: self._uses(next_hop, label1, label2))
+        self._record("remove_edge", label1, label2, routes=routes)
+        return True
+
+    def remove_node(self, label):
+        node = self.nodes.get(label)
+        if node is None:
+            return False
+        neighbors = [neighbor.label for neighbor in node.adjacent]
+        for neighbor in list(node.adjacent):
+            self._short_roads -= self._is_short(label, neighbor.label, node.distance[neighbor.label])
+            node.remove_edge(neighbor)
+        del self.nodes[label]
+        self._components_dirty = True
+        if node.x is not None:
+            self._spatial = None
+        else:
+            self._unplaced -= 1
+        # Trees that route through the location are dropped; in the rest it is
+        # a leaf or absent, so removing its own entry keeps them exact.
+        routes = self._drop_routes(lambda distances, next_hop: any(
+            next_hop.get(neighbor) == label for neighbor in neighbors))
+        if label in self._route_cache:
+            del self._route_cache[label]
+            del self._route_versions[label]
+            routes.append(label)
+        for distances, next_hop in self._route_cache.values():
+            distances.pop(label, None)
+            next_hop.pop(label, None)
+        self._record("remove_node", label, routes=routes)
+        return True
+
+    def changes_since(self, version):
+        # GraphChanges after version, oldest first, or None when the log no
+        # longer reaches back that far and the caller has to resynchronise.
+        if version >= self.version:
+            return []
+        changes = self._changes
+        if not changes or changes[0].version > version + 1:
+            return None
+        start = len(changes) - (self.version - version)
+        return changes[start:]
+
+    def route_unchanged_since(self, destination, version):
+        # True when the cached tree for destination already existed at version
+        # and no later change touched it, so distances to it are still current.
+        built = self._route_versions.get(destination)
+        return built is not None and built <= version
+
+    def _record(self, kind, label1, label2=None, distance=None, routes=()):
+        self.version += 1
+        self._frozen = None
+        self._changes.append(GraphChange(self.version, kind, label1, label2, distance, routes))
+        if len(self._changes) > CHANGE_LOG_LIMIT:
+            del self._changes[:len(self._changes) - CHANGE_LOG_LIMIT]
+
+    def _drop_routes(self, affected):
+        dropped = [destination for destination, (distances, next_hop) in self._route_cache.items()
+                   if affected(distances, next_hop)]
+        for destination in dropped:
+            del self._route_cache[destination]
+            del self._route_versions[destination]
+        if avms_stats.enabled:
+            avms_stats.count("graph.route_cache.invalidated", len(dropped))
+            avms_stats.count("graph.route_cache.kept", len(self._route_cache))
+        return dropped
+
+    @staticmethod
+    def _uses(next_hop, label1, label2):
+        return next_hop.get(label1) == label2 or next_hop.get(label2) == label1
+
+    @staticmethod
+    def _improves(distances, label1, label2, distance):
+        # Whether a road of this length gives either end a shorter way to the root
+        distance1, distance2 = distances.get(label1), distances.get(label2)
+        if distance1 is not None and (distance2 is None or distance1 + distance < distance2):
+            return True
+        return distance2 is not None and (distance1 is None or distance2 + distance < distance1)
+
+    def has_node(self, label):
+        return label in self.nodes
+
+    def set_charger(self, label, charger=True):
+        if label in self.nodes:
+            self.nodes[label].charger = charger
+            self._record("set_charger", label)
             return True
         return False
 
+    def is_charger(self, label):
+        return label in self.nodes and self.nodes[label].charger
+
+    def get_coordinates(self, label):
+        node = self.nodes.get(label)
+        if node is None or node.x is None:
+            return None
+        return node.x, node.y
+
+    def spatial_index(self):
+        # Nearest, k-nearest and radius lookups over located nodes, e.g. to
+        # snap a GPS fix to the road network
+        if self._spatial is None:
+            from avms_spatial import SpatialIndex  # avms_spatial imports DSAHeap from here
+            self._spatial = SpatialIndex((label, node.x, node.y) for label, node in self.nodes.items()
+                                         if node.x is not None)
+        return self._spatial
+
+    def heuristic_admissible(self):
+        # Straight-line distance is a valid A* lower bound only when every
+        # location is placed and no road is shorter than the straight line
+        # between its ends. Both are counted as the graph changes.
+        return bool(self.nodes) and self._unplaced == 0 and self._short_roads == 0
+
+    def _is_short(self, label1, label2, distance):
+        node1, node2 = self.nodes[label1], self.nodes[label2]
+        if node1.x is None or node2.x is None:
+            return 0
+        return 1 if distance < math.hypot(node1.x - node2.x, node1.y - node2.y) else 0
+
     def get_neighbors(self, label):
         if label in self.nodes:
             return [(node.label, self.nodes[label].distance[node.label]) 
@@ -56,230 +275,1749 @@ class DSAGraph:
         if source not in self.nodes or destination not in self.nodes:
             return False
             
-        self._reset_visited()
-        stack = [self.nodes[source]]
-        self.nodes[source].visited = True
-        
-        while stack:
-            current = stack.pop()
-            if current.label == destination:
-                return True
+        if self._components_dirty:
+            self._rebuild_components()
+        if avms_stats.enabled:
+            avms_stats.observe("graph.is_path.nodes", self._depth(source) + self._depth(destination) + 2)
+        return self._find(source) == self._find(destination)
+
+    def connected_components(self):
+        if self._components_dirty:
+            self._rebuild_components()
+        components = {}
+        for label in self.nodes:
+            components.setdefault(self._find(label), []).append(label)
+        result = [sorted(members) for members in components.values()]
+        result.sort(key=lambda members: (-len(members), members[0]))
+        return result
+
+    def component_size(self, label):
+        if label not in self.nodes:
+            return 0
+        if self._components_dirty:
+            self._rebuild_components()
+        return self._component_size[self._find(label)]
+
+    def _find(self, label):
+        parent = self._parent
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]  # Path halving
+            label = parent[label]
+        return label
+
+    def node_count(self):
+        return len(self.nodes)
+
+    def stats(self):
+        if self._components_dirty:
+            self._rebuild_components()
+        return {
+            "nodes": len(self.nodes),
+            "edges": sum(len(node.adjacent) for node in self.nodes.values()) // 2,
+            "components": len(self._component_size),
+            "cached_routes": len(self._route_cache),
+            "version": self.version,
+        }
+
+    def _depth(self, label):
+        # Parent hops from label to its root, without compressing anything
+        parent, depth = self._parent, 0
+        while parent[label] != label:
+            label = parent[label]
+            depth += 1
+        return depth
+
+    def _union(self, label1, label2):
+        root1 = self._find(label1)
+        root2 = self._find(label2)
+        if root1 == root2:
+            return
+        if self._component_size[root1] < self._component_size[root2]:
+            root1, root2 = root2, root1
+        self._parent[root2] = root1
+        self._component_size[root1] += self._component_size.pop(root2)
+
+    def _rebuild_components(self):
+        # Union-find only merges, so after a removal it is rebuilt from the
+        # remaining roads the next time connectivity is asked for. The new
+        # structure is built aside and swapped in, so concurrent readers that
+        # trigger it see either the old one or the finished new one.
+        parent = {label: label for label in self.nodes}
+        size = {label: 1 for label in self.nodes}
+        def find(label):
+            while parent[label] != label:
+                parent[label] = parent[parent[label]]
+                label = parent[label]
+            return label
+        for label, node in self.nodes.items():
+            for neighbor in node.adjacent:
+                root1, root2 = find(label), find(neighbor.label)
+                if root1 != root2:
+                    if size[root1] < size[root2]:
+                        root1, root2 = root2, root1
+                    parent[root2] = root1
+                    size[root1] += size.pop(root2)
+        self._parent, self._component_size = parent, size
+        self._components_dirty = False
+
+    def freeze(self):
+        # Frozen graphs are read-only, so one is shared by every caller until
+        # the network changes
+        if self._frozen is not None:
+            return self._frozen
+        if self._components_dirty:
+            self._rebuild_components()
+        labels = list(self.nodes)
+        index = {label: i for i, label in enumerate(labels)}
+        offsets = array('q', [0])
+        neighbors = array('q')
+        distances = []
+        for label in labels:
+            node = self.nodes[label]
+            for neighbor in node.adjacent:
+                neighbors.append(index[neighbor.label])
+                distances.append(node.distance[neighbor.label])
+            offsets.append(len(neighbors))
+        integral = all(isinstance(d, int) for d in distances)
+        weights = array('q' if integral else 'd', distances)
+        components = array('q', [index[self._find(label)] for label in labels])
+        chargers = bytearray(1 if self.nodes[label].charger else 0 for label in labels)
+        coordinates = None
+        if any(node.x is not None for node in self.nodes.values()):
+            nodes = [self.nodes[label] for label in labels]
+            coordinates = (array('d', (math.nan if node.x is None else node.x for node in nodes)),
+                           array('d', (math.nan if node.y is None else node.y for node in nodes)))
+        self._frozen = FrozenDSAGraph(labels, offsets, neighbors, weights, components, chargers, coordinates)
+        return self._frozen
+
+    def shortest_path(self, source, destination):
+        if source not in self.nodes or destination not in self.nodes:
+            return [], None
+        # A single route is cheaper by A* than by building the destination's
+        # whole tree, unless that tree is cached already. shortest_distance
+        # keeps using trees: vehicle refreshes share a few destinations.
+        if destination not in self._route_cache and self.heuristic_admissible():
+            return self._astar(source, destination)
+        distances, next_hop = self._shortest_path_tree(destination)
+        if source not in distances:
+            return [], None
+        path = [source]
+        while path[-1] != destination:
+            path.append(next_hop[path[-1]])
+        return path, distances[source]
+
+    def shortest_distance(self, source, destination):
+        if source not in self.nodes or destination not in self.nodes:
+            return None
+        return self._shortest_path_tree(destination)[0].get(source)
+
+    def _shortest_path_tree(self, destination):
+        # Roads are undirected, so one tree rooted at the destination answers
+        # every source heading there; vehicles share few destinations.
+        tree = self._route_cache.get(destination)
+        if avms_stats.enabled:
+            avms_stats.count("graph.route_cache." + ("misses" if tree is None else "hits"))
+        if tree is None:
+            tree = self._dijkstra(destination)
+            self._route_cache[destination] = tree
+            self._route_versions[destination] = self.version
+            while len(self._route_cache) > self.route_cache_limit:
+                evicted, _ = self._route_cache.popitem(last=False)
+                del self._route_versions[evicted]  # route_unchanged_since now reports it stale
+                if avms_stats.enabled:
+                    avms_stats.count("graph.route_cache.evicted")
+        else:
+            self._route_cache.move_to_end(destination)
+        return tree
+
+    def nodes_by_distance(self, source, max_distance=None):
+        # Incremental Dijkstra: yields (label, distance) as each location is
+        # settled, nearest first, so callers stop the search by not resuming it.
+        if source not in self.nodes:
+            return
+        distances = {source: 0}
+        settled = set()
+        heap = DSAHeap(None)
+        heap.add(0, self.nodes[source])
+        try:
+            while heap.count > 0:
+                entry = heap.remove()
+                current = entry.value
+                if current.label in settled:
+                    continue
+                settled.add(current.label)
+                yield current.label, entry.priority
+                for neighbor in current.adjacent:
+                    candidate = entry.priority + current.distance[neighbor.label]
+                    if max_distance is not None and candidate > max_distance:
+                        continue
+                    if neighbor.label not in distances or candidate < distances[neighbor.label]:
+                        distances[neighbor.label] = candidate
+                        heap.add(candidate, neighbor)
+        finally:
+            # Also runs when the caller abandons the search early
+            if avms_stats.enabled:
+                self._record_search("graph.nodes_by_distance", settled)
+
+    def _dijkstra(self, origin):
+        distances = {origin: 0}
+        next_hop = {}
+        settled = set()
+        heap = DSAHeap(None)
+        heap.add(0, self.nodes[origin])
+
+        while heap.count > 0:
+            entry = heap.remove()
+            current = entry.value
+            if current.label in settled:
+                continue  # Stale entry left behind by a later improvement
+            settled.add(current.label)
             for neighbor in current.adjacent:
-                if not neighbor.visited:
-                    neighbor.visited = True
-                    stack.append(neighbor)
-        return False
+                candidate = entry.priority + current.distance[neighbor.label]
+                if neighbor.label not in distances or candidate < distances[neighbor.label]:
+                    distances[neighbor.label] = candidate
+                    next_hop[neighbor.label] = current.label
+                    heap.add(candidate, neighbor)
+        if avms_stats.enabled:
+            self._record_search("graph.dijkstra", settled)
+        return distances, next_hop
 
-    def _reset_visited(self):
-        for node in self.nodes.values():
-            node.visited = False
+    def _astar(self, source, destination):
+        # Dijkstra ordered by distance so far plus the straight line to the
+        # destination. With no road shorter than its straight line the bound
+        # is consistent, so a location is final the first time it is settled.
+        if not self.is_path(source, destination):
+            return [], None  # Union-find answers this without searching the component
+        target = self.nodes[destination]
+        tx, ty = target.x, target.y
+        distances = {source: 0}
+        previous = {}
+        settled = set()
+        heap = DSAHeap(None)
+        start = self.nodes[source]
+        heap.add(math.hypot(start.x - tx, start.y - ty), start)
+        try:
+            while heap.count > 0:
+                current = heap.remove().value
+                if current.label in settled:
+                    continue
+                settled.add(current.label)
+                if current is target:
+                    path = [destination]
+                    while path[-1] != source:
+                        path.append(previous[path[-1]])
+                    path.reverse()
+                    return path, distances[destination]
+                base = distances[current.label]
+                for neighbor in current.adjacent:
+                    candidate = base + current.distance[neighbor.label]
+                    if neighbor.label not in distances or candidate < distances[neighbor.label]:
+                        distances[neighbor.label] = candidate
+                        previous[neighbor.label] = current.label
+                        heap.add(candidate + math.hypot(neighbor.x - tx, neighbor.y - ty), neighbor)
+            return [], None
+        finally:
+            if avms_stats.enabled:
+                self._record_search("graph.astar", settled)
 
-class DSAHashEntry:
-    def __init__(self, key=None, value=None):
-        self.key = key
-        self.value = value
-        self.state = 0  # 0: free, 1: used, 2: previously used
+    def _record_search(self, name, settled):
+        avms_stats.record_search(name, len(settled), sum(len(self.nodes[label].adjacent) for label in settled))
+
+class FrozenDSAGraph:
+    # Read-only compressed-sparse-row snapshot of a DSAGraph: node ids are dense
+    # integers, and the neighbours of id i are neighbors[offsets[i]:offsets[i + 1]]
+    # with matching entries in weights.
+    def __init__(self, labels, offsets, neighbors, weights, components, chargers=None, coordinates=None):
+        self.labels = labels  # Any sequence; snapshots pass one that decodes on access
+        self._index = None
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.weights = weights
+        self.components = components
+        self.chargers = chargers  # Per-node 0/1 flags, None when no location is a charger
+        self.coordinates = coordinates  # (xs, ys) with nan for unplaced nodes, None when none are placed
+        self._route_cache = OrderedDict()  # Least recently used first, as in DSAGraph
+        self.route_cache_limit = ROUTE_CACHE_LIMIT
+        self._admissible = None
+
+    def __reduce__(self):
+        # Pickles as plain arrays, so snapshot-backed graphs (memoryviews over
+        # an mmap) can still be handed to worker processes.
+        return (FrozenDSAGraph, self._in_memory())
+
+    def copy(self):
+        # Same graph held in memory, for callers that must outlive the
+        # snapshot file it was mapped from. Arrays already in memory are
+        # shared, as neither graph changes them.
+        return FrozenDSAGraph(*self._in_memory())
+
+    def _in_memory(self):
+        def portable(values):
+            return values if isinstance(values, array) else array(values.format, values)
+        chargers = None if self.chargers is None else bytes(self.chargers)
+        coordinates = None
+        if self.coordinates is not None:
+            coordinates = (portable(self.coordinates[0]), portable(self.coordinates[1]))
+        return (list(self.labels), portable(self.offsets), portable(self.neighbors), portable(self.weights),
+                portable(self.components), chargers, coordinates)
+
+    @property
+    def index(self):
+        # label -> dense id, built on first lookup so opening a snapshot does
+        # not decode every label
+        if self._index is None:
+            self._index = {label: i for i, label in enumerate(self.labels)}
+        return self._index
+
+    def node_count(self):
+        return len(self.labels)
+
+    def edge_count(self):
+        return len(self.neighbors) // 2
+
+    def stats(self):
+        return {
+            "nodes": self.node_count(),
+            "edges": self.edge_count(),
+            "components": len(set(self.components)),
+            "cached_routes": len(self._route_cache),
+        }
+
+    def has_node(self, label):
+        return label in self.index
+
+    def is_charger(self, label):
+        return self.chargers is not None and label in self.index and self.chargers[self.index[label]] == 1
+
+    def get_coordinates(self, label):
+        if self.coordinates is None or label not in self.index:
+            return None
+        i = self.index[label]
+        x, y = self.coordinates[0][i], self.coordinates[1][i]
+        return None if x != x else (x, y)  # nan marks an unplaced node
+
+    def heuristic_admissible(self):
+        # Same rule as DSAGraph.heuristic_admissible; the graph never changes
+        if self._admissible is None:
+            admissible = self.coordinates is not None and len(self.labels) > 0
+            if admissible:
+                xs, ys = self.coordinates
+                offsets, neighbors, weights = self.offsets, self.neighbors, self.weights
+                for i in range(len(self.labels)):
+                    if xs[i] != xs[i]:
+                        admissible = False
+                        break
+                    for j in range(offsets[i], offsets[i + 1]):
+                        k = neighbors[j]
+                        if weights[j] < math.hypot(xs[i] - xs[k], ys[i] - ys[k]):
+                            admissible = False
+                            break
+                    if not admissible:
+                        break
+            self._admissible = admissible
+        return self._admissible
+
+    def get_neighbors(self, label):
+        if label not in self.index:
+            return []
+        i = self.index[label]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [(self.labels[self.neighbors[j]], self.weights[j]) for j in range(start, end)]
+
+    def display(self):
+        if not self.labels:
+            print("Road Network is empty.")
+            return
+        print("Road Network Graph:")
+        for label in sorted(self.labels):
+            neighbors = self.get_neighbors(label)
+            if neighbors:
+                print(f"{label}: {neighbors}")
+            else:
+                print(f"{label}: No connections")
+
+    def connected_components(self):
+        components = {}
+        for i, label in enumerate(self.labels):
+            components.setdefault(self.components[i], []).append(label)
+        result = [sorted(members) for members in components.values()]
+        result.sort(key=lambda members: (-len(members), members[0]))
+        return result
+
+    def thaw(self):
+        # Mutable DSAGraph with the same locations, chargers and roads; O(V + E)
+        graph = DSAGraph()
+        for label in self.labels:
+            graph.add_node(label, *(self.get_coordinates(label) or ()))
+            if self.is_charger(label):
+                graph.set_charger(label)
+        labels, offsets, neighbors, weights = self.labels, self.offsets, self.neighbors, self.weights
+        for i in range(len(labels)):
+            for j in range(offsets[i], offsets[i + 1]):
+                if i < neighbors[j]:  # Each undirected road appears twice in CSR
+                    graph.add_edge(labels[i], labels[neighbors[j]], weights[j])
+        return graph
+
+    def is_path(self, source, destination):
+        if source == destination:
+            return True
+        if source not in self.index or destination not in self.index:
+            return False
+        if avms_stats.enabled:
+            avms_stats.observe("graph.is_path.nodes", 2)  # Component ids are precomputed
+        return self.components[self.index[source]] == self.components[self.index[destination]]
+
+    def shortest_path(self, source, destination):
+        if source not in self.index or destination not in self.index:
+            return [], None
+        if self.index[destination] not in self._route_cache and self.heuristic_admissible():
+            return self._astar(self.index[source], self.index[destination])
+        distances, next_hop = self._shortest_path_tree(self.index[destination])
+        current = self.index[source]
+        if distances[current] is None:
+            return [], None
+        target = self.index[destination]
+        path = [current]
+        while current != target:
+            current = next_hop[current]
+            path.append(current)
+        return [self.labels[i] for i in path], distances[self.index[source]]
+
+    def shortest_distance(self, source, destination):
+        if source not in self.index or destination not in self.index:
+            return None
+        distances = self._shortest_path_tree(self.index[destination])[0]
+        return distances[self.index[source]]
+
+    def _shortest_path_tree(self, destination):
+        tree = self._route_cache.get(destination)
+        if avms_stats.enabled:
+            avms_stats.count("graph.route_cache." + ("misses" if tree is None else "hits"))
+        if tree is None:
+            tree = self._dijkstra(destination)
+            self._route_cache[destination] = tree
+            if len(self._route_cache) > self.route_cache_limit:
+                self._route_cache.popitem(last=False)
+                if avms_stats.enabled:
+                    avms_stats.count("graph.route_cache.evicted")
+        else:
+            try:
+                self._route_cache.move_to_end(destination)
+            except KeyError:
+                pass  # Evicted by a query on another thread; frozen graphs are shared without a lock
+        return tree
+
+    def nodes_by_distance(self, source, max_distance=None):
+        if source not in self.index:
+            return
+        offsets, neighbors, weights, labels = self.offsets, self.neighbors, self.weights, self.labels
+        origin = self.index[source]
+        distances = {origin: 0}
+        settled = set()
+        heap = DSAHeap(None)
+        heap.add(0, origin)
+        try:
+            while heap.count > 0:
+                entry = heap.remove()
+                current = entry.value
+                if current in settled:
+                    continue
+                settled.add(current)
+                yield labels[current], entry.priority
+                for j in range(offsets[current], offsets[current + 1]):
+                    neighbor = neighbors[j]
+                    candidate = entry.priority + weights[j]
+                    if max_distance is not None and candidate > max_distance:
+                        continue
+                    if neighbor not in distances or candidate < distances[neighbor]:
+                        distances[neighbor] = candidate
+                        heap.add(candidate, neighbor)
+        finally:
+            if avms_stats.enabled:
+                self._record_search("graph.nodes_by_distance", settled)
+
+    def _dijkstra(self, origin):
+        offsets, neighbors, weights = self.offsets, self.neighbors, self.weights
+        distances = [None] * len(self.labels)
+        next_hop = array('q', [-1]) * len(self.labels)
+        settled = bytearray(len(self.labels))
+        distances[origin] = 0
+        heap = DSAHeap(None)
+        heap.add(0, origin)
+
+        while heap.count > 0:
+            entry = heap.remove()
+            current = entry.value
+            if settled[current]:
+                continue
+            settled[current] = 1
+            for j in range(offsets[current], offsets[current + 1]):
+                neighbor = neighbors[j]
+                candidate = entry.priority + weights[j]
+                if distances[neighbor] is None or candidate < distances[neighbor]:
+                    distances[neighbor] = candidate
+                    next_hop[neighbor] = current
+                    heap.add(candidate, neighbor)
+        if avms_stats.enabled:
+            self._record_search("graph.dijkstra", [i for i in range(len(settled)) if settled[i]])
+        return distances, next_hop
+
+    def _astar(self, origin, target):
+        if self.components[origin] != self.components[target]:
+            return [], None
+        offsets, neighbors, weights = self.offsets, self.neighbors, self.weights
+        xs, ys = self.coordinates
+        tx, ty = xs[target], ys[target]
+        distances = {origin: 0}
+        previous = {}
+        settled = set()
+        heap = DSAHeap(None)
+        heap.add(math.hypot(xs[origin] - tx, ys[origin] - ty), origin)
+        try:
+            while heap.count > 0:
+                current = heap.remove().value
+                if current in settled:
+                    continue
+                settled.add(current)
+                if current == target:
+                    path = [target]
+                    while path[-1] != origin:
+                        path.append(previous[path[-1]])
+                    return [self.labels[i] for i in reversed(path)], distances[target]
+                base = distances[current]
+                for j in range(offsets[current], offsets[current + 1]):
+                    neighbor = neighbors[j]
+                    candidate = base + weights[j]
+                    if neighbor not in distances or candidate < distances[neighbor]:
+                        distances[neighbor] = candidate
+                        previous[neighbor] = current
+                        heap.add(candidate + math.hypot(xs[neighbor] - tx, ys[neighbor] - ty), neighbor)
+            return [], None
+        finally:
+            if avms_stats.enabled:
+                self._record_search("graph.astar", settled)
+
+    def _record_search(self, name, settled):
+        offsets = self.offsets
+        avms_stats.record_search(name, len(settled), sum(offsets[i + 1] - offsets[i] for i in settled))
 
 class VehicleHashTable:
+    # Open addressing with linear probing over parallel arrays. Slot states:
+    # 0: free, 1: used, 2: previously used (tombstone).
     def __init__(self, size=100):
-        self.table = [DSAHashEntry() for _ in range(size)]
         self.count = 0
-        self.load_factor_threshold = 0.7
+        self.load_factor_threshold = 0.7  # Counts tombstones too, so probes always reach a free slot
+        self.shrink_threshold = 0.15
+        self._min_capacity = self._capacity_for(size)
+        self._allocate(self._min_capacity)
+        self.fleet = FleetStore()  # Columns, indexes and heaps for stored Vehicles
+
+    @staticmethod
+    def _capacity_for(size):
+        capacity = 8
+        while capacity < size:
+            capacity *= 2
+        return capacity
+
+    def _allocate(self, capacity):
+        self._keys = [None] * capacity
+        self._values = [None] * capacity
+        self._states = bytearray(capacity)
+        self._mask = capacity - 1
+        self._shift = 64 - (capacity.bit_length() - 1)
+        self._tombstones = 0
+
+    def capacity(self):
+        return len(self._states)
+
+    def __len__(self):
+        return self.count
 
     def _hash(self, key):
-        return sum(ord(char) for char in str(key)) % len(self.table)
+        # Fibonacci hashing: multiply by 2^64 / golden ratio and keep the top
+        # bits, so near-identical IDs such as AV-0123/AV-0132 spread out.
+        return ((hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self._shift
 
-    def _probe(self, key, index):
-        original_index = index
+    def _probe(self, key):
+        # Returns (slot holding key or -1, slot a new key should go in). Probing
+        # continues past tombstones, so a re-added key can never be duplicated.
+        states, keys, mask = self._states, self._keys, self._mask
+        start = index = self._hash(key)
+        reusable = -1
         while True:
-            if self.table[index].state == 0 or (self.table[index].state == 2 and self.table[index].key != key):
-                return index
-            if self.table[index].state == 1 and self.table[index].key == key:
-                return index
-            index = (index + 1) % len(self.table)
-            if index == original_index:
-                raise RuntimeError("Hash table is full")
-
-    def _resize(self, new_size):
-        old_table = self.table
-        self.table = [DSAHashEntry() for _ in range(new_size)]
-        self.count = 0
-        for entry in old_table:
-            if entry.state == 1:
-                self.put(entry.key, entry.value)
+            state = states[index]
+            if state == 0:
+                if avms_stats.enabled:
+                    avms_stats.observe("hash.probe_length", ((index - start) & mask) + 1)
+                return -1, index if reusable < 0 else reusable
+            if state == 1:
+                if keys[index] == key:
+                    if avms_stats.enabled:
+                        avms_stats.observe("hash.probe_length", ((index - start) & mask) + 1)
+                    return index, index
+            elif reusable < 0:
+                reusable = index
+            index = (index + 1) & mask
 
-    def put(self, key, value):
-        if self.count / len(self.table) > self.load_factor_threshold:
-            self._resize(len(self.table) * 2)
+    def _resize(self, new_capacity):
+        timed = avms_stats.enabled
+        if timed:
+            started = time.perf_counter()
+        old_keys, old_values, old_states = self._keys, self._values, self._states
+        self._allocate(new_capacity)
+        keys, values, states, mask = self._keys, self._values, self._states, self._mask
+        for i in range(len(old_states)):
+            if old_states[i] == 1:
+                # Fresh table: no tombstones or duplicates, so the first free slot wins
+                index = self._hash(old_keys[i])
+                while states[index]:
+                    index = (index + 1) & mask
+                keys[index] = old_keys[i]
+                values[index] = old_values[i]
+                states[index] = 1
+        if timed:
+            change = len(states) - len(old_states)
+            avms_stats.count("hash.resize." + ("grow" if change > 0 else "shrink" if change < 0 else "compact"))
+            avms_stats.record_time("hash.resize", time.perf_counter() - started)
 
-        index = self._hash(key)
-        index = self._probe(key, index)
+    def _rebuild(self, extra=0):
+        # Pick the smallest capacity that leaves the live keys at half the load
+        # threshold; this grows, compacts tombstones in place, or shrinks.
+        capacity = self._min_capacity
+        while self.count + extra > capacity * self.load_factor_threshold / 2:
+            capacity *= 2
+        self._resize(capacity)
 
-        if self.table[index].state == 1 and self.table[index].key == key:
-            return False  # Prevent duplicates
+    def stats(self):
+        # Current gauges; probe lengths come from a scan of the live slots
+        states, keys, mask = self._states, self._keys, self._mask
+        capacity = len(states)
+        total_probe = max_probe = 0
+        for i in range(capacity):
+            if states[i] == 1:
+                probe = ((i - self._hash(keys[i])) & mask) + 1
+                total_probe += probe
+                if probe > max_probe:
+                    max_probe = probe
+        return {
+            "count": self.count,
+            "capacity": capacity,
+            "load_factor": (self.count + self._tombstones) / capacity,
+            "live_load_factor": self.count / capacity,
+            "tombstones": self._tombstones,
+            "tombstone_ratio": self._tombstones / capacity,
+            "mean_probe": total_probe / self.count if self.count else 0.0,
+            "max_probe": max_probe,
+        }
 
-        if self.table[index].state != 1:
-            self.count += 1
+    def reserve(self, size):
+        # Presize for size live entries so a bulk load never rebuilds midway
+        if size + self._tombstones > len(self._states) * self.load_factor_threshold:
+            self._rebuild(max(size - self.count, 0))
 
-        self.table[index] = DSAHashEntry(key, value)
-        self.table[index].state = 1
+    def put(self, key, value):
+        if self.count + self._tombstones + 1 > len(self._states) * self.load_factor_threshold:
+            self._rebuild(1)
+
+        found, index = self._probe(key)
+        if found >= 0:
+            return False  # Prevent duplicates
+        if isinstance(value, Vehicle) and value._fleet is not None:
+            raise ValueError(f"Vehicle {value.vehicle_id} is already stored in a fleet")
+
+        if self._states[index] == 2:
+            self._tombstones -= 1
+        self._keys[index] = key
+        self._values[index] = value
+        self._states[index] = 1
+        self.count += 1
+        if isinstance(value, Vehicle):
+            self.fleet.attach(value)
         return True
 
     def get(self, key):
-        index = self._hash(key)
-        index = self._probe(key, index)
-
-        if self.table[index].state == 1 and self.table[index].key == key:
-            return self.table[index].value
+        found = self._probe(key)[0]
+        if found >= 0:
+            return self._values[found]
         return None
 
     def remove(self, key):
-        index = self._hash(key)
-        index = self._probe(key, index)
+        found = self._probe(key)[0]
+        if found < 0:
+            return False
 
-        if self.table[index].state == 1 and self.table[index].key == key:
-            self.table[index].state = 2
-            self.count -= 1
-            return True
-        return False
+        value = self._values[found]
+        if isinstance(value, Vehicle):
+            self.fleet.detach(value)
+
+        states, mask = self._states, self._mask
+        self._keys[found] = None
+        self._values[found] = None
+        if states[(found + 1) & mask] == 0:
+            # Nothing probes past a slot followed by a free one, so free it and
+            # any tombstones directly before it instead of leaving a marker.
+            states[found] = 0
+            index = (found - 1) & mask
+            while states[index] == 2:
+                states[index] = 0
+                self._tombstones -= 1
+                index = (index - 1) & mask
+        else:
+            states[found] = 2
+            self._tombstones += 1
+        self.count -= 1
+
+        if len(states) > self._min_capacity and self.count < len(states) * self.shrink_threshold:
+            self._rebuild()
+        return True
+
+    def vehicles_at(self, location):
+        return self.fleet.vehicles_at(location)
+
+    def vehicles_heading_to(self, destination):
+        return self.fleet.vehicles_heading_to(destination)
+
+    def vehicles_using(self, location):
+        # Vehicles at or heading to location, each once
+        vehicles = self.fleet.vehicles_at(location)
+        here = {vehicle.vehicle_id for vehicle in vehicles}
+        return vehicles + [vehicle for vehicle in self.fleet.vehicles_heading_to(location)
+                           if vehicle.vehicle_id not in here]
+
+    def refresh_distances(self, graph, since_version=None):
+        # Repairs distances to destination after the road network changed
+        # since since_version (None recomputes every vehicle). Only vehicles
+        # heading to a destination whose route tree the changes touched, or
+        # parked at a removed location, are recomputed. Returns the vehicles
+        # that can no longer reach their destination; their distance becomes
+        # infinite, which keeps them out of feasible recommendations.
+        changes = None if since_version is None else graph.changes_since(since_version)
+        if changes == []:
+            return []
+        vehicles = {}
+        for destination in self.fleet.destinations():
+            if changes is None or not graph.route_unchanged_since(destination, since_version):
+                for vehicle in self.fleet.vehicles_heading_to(destination):
+                    vehicles[vehicle.vehicle_id] = vehicle
+        for change in changes or ():
+            if change.kind == "remove_node":
+                for vehicle in self.fleet.vehicles_at(change.label1):
+                    vehicles[vehicle.vehicle_id] = vehicle
+        stranded = []
+        for vehicle in vehicles.values():
+            distance = graph.shortest_distance(vehicle.get_location(), vehicle.get_destination())
+            if distance is None:
+                distance = float("inf")
+                stranded.append(vehicle)
+            vehicle.set_distance_to_destination(distance)
+        return stranded
+
+    def count_at(self, location):
+        return self.fleet.count_at(location)
+
+    def count_heading_to(self, destination):
+        return self.fleet.count_heading_to(destination)
+
+    def nearest_vehicle(self, feasible_only=False):
+        return self.fleet.nearest(feasible_only)
+
+    def highest_battery_vehicle(self, feasible_only=False):
+        return self.fleet.highest_battery(feasible_only)
+
+    def k_nearest(self, k, min_battery=None, location=None, feasible_only=False):
+        return self.fleet.k_nearest(k, min_battery, location=location, feasible_only=feasible_only)
+
+    def k_highest_battery(self, k, min_battery=None, location=None, feasible_only=False):
+        return self.fleet.k_highest_battery(k, min_battery, location=location, feasible_only=feasible_only)
+
+    def keys(self):
+        return [self._keys[i] for i in range(len(self._states)) if self._states[i] == 1]
+
+    def values(self):
+        return [self._values[i] for i in range(len(self._states)) if self._states[i] == 1]
+
+    def items(self):
+        return [(self._keys[i], self._values[i]) for i in range(len(self._states)) if self._states[i] == 1]
+
+    def freeze(self):
+        # Read-only copy that later writes to this table do not affect, for
+        # readers that must not wait on a writer. Slots, columns, indexes and
+        # heaps are copied wholesale, at memcpy speed rather than per vehicle;
+        # the copy must not be modified.
+        frozen = VehicleHashTable.__new__(VehicleHashTable)
+        frozen.__dict__.update(self.__dict__)
+        frozen._keys = self._keys[:]
+        frozen._states = self._states[:]
+        frozen.fleet = self.fleet.freeze()
+        frozen._values = _FrozenSlots(self._values[:], frozen.fleet)
+        return frozen
 
     def display_all(self):
         if self.count == 0:
             print("Hash table is empty.")
             return
         print("Vehicle Hash Table Contents:")
-        for i, entry in enumerate(self.table):
-            if entry.state == 1:
-                print(f"Index {i}: {entry.key} => {entry.value}")
+        for i in range(len(self._states)):
+            if self._states[i] == 1:
+                print(f"Index {i}: {self._keys[i]} => {self._values[i]}")
+
+class FleetStore:
+    # Columnar storage for the vehicles in a VehicleHashTable. Each vehicle owns
+    # a dense row; locations and destinations are interned to integer ids (-1
+    # for none) so the columns stay typed arrays. Rows of removed vehicles are
+    # reused. Also keeps the location/destination indexes and the live
+    # distance/battery heaps in step with every column write. Indexes and
+    # heaps hold row numbers in typed arrays rather than per-vehicle objects.
+    def __init__(self):
+        self.battery = array('d')
+        self.distance = array('d')
+        self.location = array('q')
+        self.destination = array('q')
+        self.efficiency = array('d')  # km per battery percent, from the vehicle class
+        self.alive = bytearray()
+        self.vehicles = []  # row -> Vehicle, None for free rows
+        self.labels = []  # interned id -> location label
+        self.label_ids = {}
+        self.count = 0
+        self._free_rows = []
+        self._location_index = _RowIndex()  # location id -> rows
+        self._destination_index = _RowIndex()  # destination id -> rows
+        self._distance_heap = _RowHeap(self.distance, 1)  # Nearest to destination on top
+        self._battery_heap = _RowHeap(self.battery, -1)  # Highest battery on top
+
+    def intern(self, label):
+        if label is None:
+            return -1
+        label_id = self.label_ids.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self.label_ids[label] = label_id
+        return label_id
+
+    def label(self, label_id):
+        return None if label_id < 0 else self.labels[label_id]
+
+    def freeze(self):
+        # Copy for VehicleHashTable.freeze; vehicles come back as new views
+        # over the copy's rows
+        frozen = FleetStore.__new__(FleetStore)
+        for name in ("battery", "distance", "location", "destination", "efficiency", "alive", "labels"):
+            setattr(frozen, name, getattr(self, name)[:])
+        frozen.vehicles = _FrozenRows(self.vehicles[:], frozen)
+        frozen.label_ids = self.label_ids.copy()
+        frozen.count = self.count
+        frozen._free_rows = []
+        frozen._location_index = self._location_index.copy()
+        frozen._destination_index = self._destination_index.copy()
+        frozen._distance_heap = self._distance_heap.copy(frozen.distance)
+        frozen._battery_heap = self._battery_heap.copy(frozen.battery)
+        return frozen
+
+    def attach(self, vehicle):
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = len(self.vehicles)
+            self.battery.append(0.0)
+            self.distance.append(0.0)
+            self.location.append(-1)
+            self.destination.append(-1)
+            self.efficiency.append(0.0)
+            self.alive.append(0)
+            self.vehicles.append(None)
+
+        self.battery[row] = vehicle._battery_level
+        self.distance[row] = vehicle._distance_to_destination
+        self.location[row] = self.intern(vehicle._location)
+        self.destination[row] = self.intern(vehicle._destination)
+        self.efficiency[row] = ENERGY_MODELS[vehicle.vehicle_class]
+        self.alive[row] = 1
+        self.vehicles[row] = vehicle
+        self._distance_heap.add(row)
+        self._battery_heap.add(row)
+        self._location_index.add(self.location[row], row)
+        self._destination_index.add(self.destination[row], row)
+        self.count += 1
+
+        vehicle._fleet = self
+        vehicle._row = row
+        vehicle._location = vehicle._destination = None
+        vehicle._distance_to_destination = vehicle._battery_level = None
+
+    def detach(self, vehicle):
+        row = vehicle._row
+        location = self.label(self.location[row])
+        destination = self.label(self.destination[row])
+        self._location_index.remove(self.location[row], row)
+        self._destination_index.remove(self.destination[row], row)
+        self._distance_heap.remove(row)
+        self._battery_heap.remove(row)
+
+        vehicle._location = location
+        vehicle._destination = destination
+        vehicle._distance_to_destination = plain_number(self.distance[row])
+        vehicle._battery_level = plain_number(self.battery[row])
+        vehicle._fleet = None
+        vehicle._row = -1
+
+        self.alive[row] = 0
+        self.vehicles[row] = None
+        self._free_rows.append(row)
+        self.count -= 1
+
+    def set_location(self, row, location):
+        label_id = self.intern(location)
+        self._location_index.remove(self.location[row], row)
+        self._location_index.add(label_id, row)
+        self.location[row] = label_id
+
+    def set_destination(self, row, destination):
+        label_id = self.intern(destination)
+        self._destination_index.remove(self.destination[row], row)
+        self._destination_index.add(label_id, row)
+        self.destination[row] = label_id
+
+    def set_distance(self, row, distance):
+        self.distance[row] = distance
+        self._distance_heap.update(row)
+
+    def set_battery(self, row, level):
+        self.battery[row] = level
+        self._battery_heap.update(row)
+
+    def vehicles_at(self, location):
+        return [self.vehicles[row] for row in self._location_index.rows(self.label_ids.get(location, -1))]
+
+    def vehicles_heading_to(self, destination):
+        return [self.vehicles[row] for row in self._destination_index.rows(self.label_ids.get(destination, -1))]
+
+    def destinations(self):
+        return [self.labels[label_id] for label_id in self._destination_index.keys()]
+
+    def count_at(self, location):
+        return self._location_index.size(self.label_ids.get(location, -1))
+
+    def count_heading_to(self, destination):
+        return self._destination_index.size(self.label_ids.get(destination, -1))
+
+    def ranges_by_location(self, min_battery=None):
+        # {location: [(row, range)]} for vehicles with at least min_battery,
+        # read off the location index
+        battery, efficiency, index = self.battery, self.efficiency, self._location_index
+        found = {}
+        for label_id in index.keys():
+            here = [(row, battery[row] * efficiency[row]) for row in index.rows(label_id)
+                    if min_battery is None or battery[row] >= min_battery]
+            if here:
+                found[self.labels[label_id]] = here
+        return found
+
+    def range_of(self, row):
+        return self.battery[row] * self.efficiency[row]
+
+    def is_feasible(self, row):
+        # Enough range left for the vehicle's current trip
+        return self.battery[row] * self.efficiency[row] >= self.distance[row]
+
+    def nearest(self, feasible_only=False):
+        selected = self.k_nearest(1, feasible_only=feasible_only)
+        return selected[0] if selected else None
+
+    def highest_battery(self, feasible_only=False):
+        selected = self.k_highest_battery(1, feasible_only=feasible_only)
+        return selected[0] if selected else None
+
+    def k_nearest(self, k, min_battery=None, max_distance=None, location=None, feasible_only=False):
+        if min_battery is None and max_distance is None and location is None:
+            return self._first_k(self._distance_heap, k, feasible_only)
+        return [self.vehicles[row] for row in
+                self._top_rows(self.distance, k, False, min_battery, max_distance, location, feasible_only)]
+
+    def k_highest_battery(self, k, min_battery=None, max_distance=None, location=None, feasible_only=False):
+        if min_battery is None and max_distance is None and location is None:
+            return self._first_k(self._battery_heap, k, feasible_only)
+        return [self.vehicles[row] for row in
+                self._top_rows(self.battery, k, True, min_battery, max_distance, location, feasible_only)]
+
+    def select(self, min_battery=None, max_distance=None, location=None, feasible_only=False):
+        return [self.vehicles[row] for row in
+                self._matching_rows(min_battery, max_distance, location, feasible_only)]
+
+    def _first_k(self, heap, k, feasible_only):
+        # Walks the live heap in order, skipping infeasible vehicles as it goes
+        selected = []
+        if k <= 0:
+            return selected
+        for row in heap.ordered():
+            if feasible_only and not self.is_feasible(row):
+                continue
+            selected.append(self.vehicles[row])
+            if len(selected) == k:
+                break
+        return selected
+
+    def _location_id(self, location):
+        # -2 matches no row, unlike -1 which marks vehicles without a location
+        return self.label_ids.get(location, -2)
+
+    def _matching_rows(self, min_battery, max_distance, location, feasible_only=False):
+        if np is not None:
+            return self._mask(min_battery, max_distance, location, feasible_only).nonzero()[0].tolist()
+        battery, distance = self.battery, self.distance
+        if location is not None:
+            rows = self._location_index.rows(self._location_id(location))
+        else:
+            rows = [row for row in range(len(self.alive)) if self.alive[row]]
+        if min_battery is not None:
+            rows = [row for row in rows if battery[row] >= min_battery]
+        if max_distance is not None:
+            rows = [row for row in rows if distance[row] <= max_distance]
+        if feasible_only:
+            rows = [row for row in rows if self.is_feasible(row)]
+        return rows
+
+    def _mask(self, min_battery, max_distance, location, feasible_only=False):
+        # Views over the live column buffers; they must not outlive the query,
+        # or the arrays could no longer grow.
+        mask = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+        if min_battery is not None:
+            mask &= np.frombuffer(self.battery, dtype=np.float64) >= min_battery
+        if max_distance is not None:
+            mask &= np.frombuffer(self.distance, dtype=np.float64) <= max_distance
+        if location is not None:
+            mask &= np.frombuffer(self.location, dtype=np.int64) == self._location_id(location)
+        if feasible_only:
+            battery = np.frombuffer(self.battery, dtype=np.float64)
+            efficiency = np.frombuffer(self.efficiency, dtype=np.float64)
+            mask &= battery * efficiency >= np.frombuffer(self.distance, dtype=np.float64)
+        return mask
+
+    def _top_rows(self, column, k, largest, min_battery, max_distance, location, feasible_only):
+        if k <= 0 or self.count == 0:
+            return []
+        if np is None:
+            rows = self._matching_rows(min_battery, max_distance, location, feasible_only)
+            if largest:
+                return _select_top_k(rows, k, lambda row: column[row])
+            return _select_top_k(rows, k, lambda row: -column[row])
+
+        rows = self._mask(min_battery, max_distance, location, feasible_only).nonzero()[0]
+        values = np.frombuffer(column, dtype=np.float64)[rows]
+        if largest:
+            values = -values
+        if k < len(rows):
+            part = np.argpartition(values, k - 1)[:k]
+            rows, values = rows[part], values[part]
+        return rows[np.argsort(values, kind='stable')].tolist()
+
+class _RowIndex:
+    # FleetStore rows grouped by interned label id, as doubly linked lists
+    # threaded through typed arrays: head, tail and size per label id, next
+    # and previous per row. Insertion order is kept; -1 ids are not indexed.
+    def __init__(self):
+        self.head = array('q')
+        self.tail = array('q')
+        self.sizes = array('q')
+        self.next = array('q')
+        self.prev = array('q')
+
+    def _reserve(self, label_id, row):
+        while len(self.head) <= label_id:
+            self.head.append(-1)
+            self.tail.append(-1)
+            self.sizes.append(0)
+        while len(self.next) <= row:
+            self.next.append(-1)
+            self.prev.append(-1)
+
+    def add(self, label_id, row):
+        if label_id < 0:
+            return
+        self._reserve(label_id, row)
+        tail = self.tail[label_id]
+        self.prev[row] = tail
+        self.next[row] = -1
+        if tail < 0:
+            self.head[label_id] = row
+        else:
+            self.next[tail] = row
+        self.tail[label_id] = row
+        self.sizes[label_id] += 1
+
+    def remove(self, label_id, row):
+        if label_id < 0:
+            return
+        before, after = self.prev[row], self.next[row]
+        if before < 0:
+            self.head[label_id] = after
+        else:
+            self.next[before] = after
+        if after < 0:
+            self.tail[label_id] = before
+        else:
+            self.prev[after] = before
+        self.sizes[label_id] -= 1
+
+    def rows(self, label_id):
+        rows = []
+        if 0 <= label_id < len(self.head):
+            row = self.head[label_id]
+            while row >= 0:
+                rows.append(row)
+                row = self.next[row]
+        return rows
+
+    def size(self, label_id):
+        return self.sizes[label_id] if 0 <= label_id < len(self.sizes) else 0
+
+    def keys(self):
+        return [label_id for label_id in range(len(self.sizes)) if self.sizes[label_id]]
+
+    def copy(self):
+        index = _RowIndex.__new__(_RowIndex)
+        for name in ("head", "tail", "sizes", "next", "prev"):
+            setattr(index, name, getattr(self, name)[:])
+        return index
+
+class _FrozenRows:
+    # row -> Vehicle for a frozen FleetStore. The stored vehicles are only
+    # asked for their id and class, which never change; the returned views
+    # read everything else from the frozen columns.
+    def __init__(self, vehicles, fleet):
+        self.vehicles = vehicles
+        self.fleet = fleet
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def __getitem__(self, row):
+        vehicle = self.vehicles[row]
+        return None if vehicle is None else vehicle._view(self.fleet, row)
+
+    def row_of(self, vehicle):
+        # The vehicle's row when frozen; it may have moved or left since
+        row = vehicle._row
+        if 0 <= row < len(self.vehicles) and self.vehicles[row] is vehicle:
+            return row
+        return self.vehicles.index(vehicle)
+
+class _FrozenSlots:
+    # Hash table slot -> stored value for a frozen VehicleHashTable
+    def __init__(self, values, fleet):
+        self.values = values
+        self.fleet = fleet
+
+    def __getitem__(self, slot):
+        value = self.values[slot]
+        if not isinstance(value, Vehicle):
+            return value
+        rows = self.fleet.vehicles
+        return rows[rows.row_of(value)]
+
+# Kilometres of range per battery percent for each vehicle class
+ENERGY_MODELS = {
+    "compact": 5.0,
+    "standard": 4.0,
+    "suv": 3.0,
+    "van": 2.5,
+}
+DEFAULT_VEHICLE_CLASS = "standard"
+
+def plain_number(value):
+    # Columns hold floats; hand back ints where nothing was lost
+    return int(value) if float(value).is_integer() else value
 
 class Vehicle:
-    def __init__(self, vehicle_id, location=None, destination=None, battery_level=100):
+    # While stored in a VehicleHashTable a Vehicle is a view over its FleetStore
+    # row; the private fields below only hold data for detached vehicles.
+    __slots__ = ('vehicle_id', 'vehicle_class', '_fleet', '_row', '_location', '_destination',
+                 '_distance_to_destination', '_battery_level')
+
+    def __init__(self, vehicle_id, location=None, destination=None, battery_level=100,
+                 vehicle_class=DEFAULT_VEHICLE_CLASS):
+        if vehicle_class not in ENERGY_MODELS:
+            raise ValueError(f"Unknown vehicle class: {vehicle_class}")
         self.vehicle_id = vehicle_id
+        self.vehicle_class = vehicle_class
+        self._fleet = None
+        self._row = -1
         self._location = location
         self._destination = destination
         self._distance_to_destination = 0
         self._battery_level = battery_level
 
     def set_location(self, location):
-        self._location = location
+        if self._fleet is None:
+            self._location = location
+        else:
+            self._fleet.set_location(self._row, location)
 
     def set_destination(self, destination):
-        self._destination = destination
+        if self._fleet is None:
+            self._destination = destination
+        else:
+            self._fleet.set_destination(self._row, destination)
 
     def set_distance_to_destination(self, distance):
         if distance < 0:
             raise ValueError("Distance cannot be negative")
-        self._distance_to_destination = distance
+        if self._fleet is None:
+            self._distance_to_destination = distance
+        else:
+            self._fleet.set_distance(self._row, distance)
 
     def set_battery_level(self, level):
         if 0 <= level <= 100:
-            self._battery_level = level
+            if self._fleet is None:
+                self._battery_level = level
+            else:
+                self._fleet.set_battery(self._row, level)
         else:
             raise ValueError("Battery level must be between 0 and 100")
 
     def get_location(self):
-        return self._location
+        if self._fleet is None:
+            return self._location
+        return self._fleet.label(self._fleet.location[self._row])
 
     def get_destination(self):
-        return self._destination
+        if self._fleet is None:
+            return self._destination
+        return self._fleet.label(self._fleet.destination[self._row])
 
     def get_distance_to_destination(self):
-        return self._distance_to_destination
+        if self._fleet is None:
+            return self._distance_to_destination
+        return self._fleet.distance[self._row]
 
     def get_battery_level(self):
-        return self._battery_level
+        if self._fleet is None:
+            return self._battery_level
+        return self._fleet.battery[self._row]
+
+    def get_range(self):
+        return self.get_battery_level() * ENERGY_MODELS[self.vehicle_class]
+
+    def _view(self, fleet, row):
+        # Another view of this vehicle, over row of a frozen FleetStore
+        view = Vehicle.__new__(Vehicle)
+        view.vehicle_id = self.vehicle_id
+        view.vehicle_class = self.vehicle_class
+        view._fleet = fleet
+        view._row = row
+        return view
+
+    def can_travel(self, distance):
+        return distance <= self.get_range()
 
     def __str__(self):
-        return (f"Vehicle {self.vehicle_id}: Location={self._location}, "
-                f"Destination={self._destination}, Distance={self._distance_to_destination}km, "
-                f"Battery={self._battery_level}%")
+        distance = self.get_distance_to_destination()
+        distance = "unreachable" if distance == float("inf") else f"{plain_number(distance)}km"
+        return (f"Vehicle {self.vehicle_id}: Location={self.get_location()}, "
+                f"Destination={self.get_destination()}, "
+                f"Distance={distance}, "
+                f"Battery={plain_number(self.get_battery_level())}%")
 
 class DSAHeapEntry:
+    __slots__ = ('priority', 'value', 'slot')
+
     def __init__(self, priority, value):
         self.priority = priority
         self.value = value
+        self.slot = -1  # Index into its heap's entry table, -1 once removed
+
+class _IndexedHeap:
+    # Binary min-heap of integer items shared by DSAHeap (entry slots) and the
+    # fleet's row heaps (row numbers). Keys are kept parallel to the heap and
+    # position maps each item to its index, so the sift loops only index
+    # these containers and make no calls back into the subclass.
+    def __init__(self, heap, keys, position):
+        self.heap = heap
+        self.keys = keys
+        self.position = position
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _push(self, item, key):
+        self.heap.append(item)
+        self.keys.append(key)
+        self._trickle_up(len(self.heap) - 1)
 
-class DSAHeap:
+    def _delete(self, index):
+        # Removes the item at index; the caller forgets its position
+        heap, keys, position = self.heap, self.keys, self.position
+        last, last_key = heap.pop(), keys.pop()
+        if index < len(heap):
+            heap[index] = last
+            keys[index] = last_key
+            position[last] = index
+            if index and last_key < keys[(index - 1) // 2]:
+                self._trickle_up(index)
+            else:
+                self._trickle_down(index)
+
+    def _rekey(self, index, key):
+        old = self.keys[index]
+        self.keys[index] = key
+        if key < old:
+            self._trickle_up(index)
+        elif old < key:
+            self._trickle_down(index)
+
+    def ordered(self):
+        # Yields items in key order without modifying the heap, using a side
+        # heap of frontier positions: O(k log k) for the first k items.
+        heap, keys = self.heap, self.keys
+        if not heap:
+            return
+        frontier = DSAHeap(None)
+        frontier.add(keys[0], 0)
+        while frontier.count > 0:
+            index = frontier.remove().value
+            yield heap[index]
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    frontier.add(keys[child], child)
+
+    def _trickle_up(self, index):
+        heap, keys, position = self.heap, self.keys, self.position
+        start = index
+        item, key = heap[index], keys[index]
+        while index > 0:
+            parent = (index - 1) // 2
+            parent_key = keys[parent]
+            if not key < parent_key:
+                break
+            moved = heap[parent]
+            heap[index] = moved
+            keys[index] = parent_key
+            position[moved] = index
+            index = parent
+        heap[index] = item
+        keys[index] = key
+        position[item] = index
+        if avms_stats.enabled:
+            avms_stats.count("heap.sift_up")
+            avms_stats.count("heap.sift_up_levels", (start + 1).bit_length() - (index + 1).bit_length())
+
+    def _trickle_down(self, index):
+        heap, keys, position = self.heap, self.keys, self.position
+        count = len(heap)
+        start = index
+        item, key = heap[index], keys[index]
+        while True:
+            child = 2 * index + 1
+            if child >= count:
+                break
+            child_key = keys[child]
+            right = child + 1
+            if right < count:
+                right_key = keys[right]
+                if right_key < child_key:
+                    child = right
+                    child_key = right_key
+            if not child_key < key:
+                break
+            moved = heap[child]
+            heap[index] = moved
+            keys[index] = child_key
+            position[moved] = index
+            index = child
+        heap[index] = item
+        keys[index] = key
+        position[item] = index
+        if avms_stats.enabled:
+            avms_stats.count("heap.sift_down")
+            avms_stats.count("heap.sift_down_levels", (index + 1).bit_length() - (start + 1).bit_length())
+
+class DSAHeap(_IndexedHeap):
+    # Indexed min-heap: add() returns the entry as a handle that update() and
+    # remove_entry() accept, so priorities can change in O(log n). The heap
+    # itself holds slot numbers into a table of entries, so it shares the row
+    # heaps' position array instead of tracking positions on each entry.
     def __init__(self, max_size=100):
-        self.heap = []
+        super().__init__([], [], [])  # position: slot -> index
+        self.entries = []  # slot -> entry, None for free slots
+        self._free_slots = []
         self.count = 0
-        self.max_size = max_size
+        self.max_size = max_size  # None for an unbounded heap
+
+    def _attach(self, entry):
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self.entries[slot] = entry
+        else:
+            slot = len(self.entries)
+            self.entries.append(entry)
+            self.position.append(-1)
+        entry.slot = slot
+        self.count += 1
+        return slot
 
     def add(self, priority, value):
-        if self.count >= self.max_size:
+        if self.max_size is not None and self.count >= self.max_size:
             raise OverflowError("Heap is full")
-        entry = DSAHashEntry(priority, value)
-        self.heap.append(entry)
-        self.count += 1
-        self._trickle_up(self.count - 1)
+        entry = DSAHeapEntry(priority, value)
+        self._push(self._attach(entry), priority)
+        return entry
+
+    @classmethod
+    def heapify(cls, items, max_size=None):
+        # Bottom-up construction from (priority, value) pairs in O(n)
+        heap = cls(max_size)
+        for priority, value in items:
+            slot = heap._attach(DSAHeapEntry(priority, value))
+            heap.position[slot] = len(heap.heap)
+            heap.heap.append(slot)
+            heap.keys.append(priority)
+        if max_size is not None and heap.count > max_size:
+            raise OverflowError("Heap is full")
+        for index in range(heap.count // 2 - 1, -1, -1):
+            heap._trickle_down(index)
+        return heap
+
+    def ordered(self):
+        entries = self.entries
+        for slot in super().ordered():
+            yield entries[slot]
+
+    def peek(self):
+        if self.count == 0:
+            raise IndexError("Heap is empty")
+        return self.entries[self.heap[0]]
 
     def remove(self):
         if self.count == 0:
             raise IndexError("Heap is empty")
-        root = self.heap[0]
-        self.heap[0] = self.heap[self.count - 1]
-        self.heap.pop()
+        slot = self.heap[0]
+        entry = self.entries[slot]
+        self.entries[slot] = None
+        self._free_slots.append(slot)
+        entry.slot = -1
         self.count -= 1
-        self._trickle_down(0)
-        return root
+        self._delete(0)
+        return entry
 
-    def _trickle_up(self, index):
-        parent = (index - 1) // 2
-        while index > 0 and self.heap[index].priority < self.heap[parent].priority:
-            self.heap[index], self.heap[parent] = self.heap[parent], self.heap[index]
-            index = parent
-            parent = (index - 1) // 2
+    def remove_entry(self, entry):
+        slot = entry.slot
+        if slot < 0 or slot >= len(self.entries) or self.entries[slot] is not entry:
+            raise ValueError("Entry is not in this heap")
+        index = self.position[slot]
+        self.entries[slot] = None
+        self._free_slots.append(slot)
+        entry.slot = -1
+        self.count -= 1
+        self._delete(index)
+        return entry
 
-    def _trickle_down(self, index):
-        while True:
-            left = 2 * index + 1
-            right = 2 * index + 2
-            smallest = index
+    def update(self, entry, priority):
+        slot = entry.slot
+        if slot < 0 or slot >= len(self.entries) or self.entries[slot] is not entry:
+            raise ValueError("Entry is not in this heap")
+        entry.priority = priority
+        self._rekey(self.position[slot], priority)
 
-            if left < self.count and self.heap[left].priority < self.heap[smallest].priority:
-                smallest = left
-            if right < self.count and self.heap[right].priority < self.heap[smallest].priority:
-                smallest = right
+class DSAKeyedHeap(_IndexedHeap):
+    # Min-heap of distinct ints below size, e.g. node indexes in a search.
+    # Each item is queued at most once: push lowers the key of one already
+    # queued instead of adding a duplicate, and no entry objects are made.
+    # clear() only touches what is left, so one heap can serve many searches.
+    def __init__(self, size):
+        super().__init__([], [], [-1] * size)  # position: item -> index, -1 when absent
 
-            if smallest == index:
-                break
-            self.heap[index], self.heap[smallest] = self.heap[smallest], self.heap[index]
-            index = smallest
+    def push(self, item, key):
+        index = self.position[item]
+        if index < 0:
+            self._push(item, key)
+        elif key < self.keys[index]:
+            self.keys[index] = key
+            self._trickle_up(index)
+
+    def pop(self):
+        # (item, key) with the smallest key
+        if not self.heap:
+            raise IndexError("Heap is empty")
+        item, key = self.heap[0], self.keys[0]
+        self.position[item] = -1
+        self._delete(0)
+        return item, key
+
+    def clear(self):
+        for item in self.heap:
+            self.position[item] = -1
+        del self.heap[:]
+        del self.keys[:]
+
+class _RowHeap(_IndexedHeap):
+    # Indexed min-heap of FleetStore rows keyed straight off a column (times
+    # sign, so -1 puts the largest on top). The heap, its keys and each row's
+    # position are typed arrays; after a column write, update(row) restores order.
+    def __init__(self, column, sign):
+        super().__init__(array('q'), array('d'), array('q'))  # position: row -> index, -1 when absent
+        self.column = column
+        self.sign = sign
+
+    def _key(self, row):
+        return self.sign * self.column[row]
+
+    def add(self, row):
+        while len(self.position) <= row:
+            self.position.append(-1)
+        self._push(row, self._key(row))
+
+    def remove(self, row):
+        index = self.position[row]
+        self.position[row] = -1
+        self._delete(index)
+
+    def update(self, row):
+        self._rekey(self.position[row], self._key(row))
+
+    def copy(self, column):
+        # Same heap over a copy of its column
+        heap = _RowHeap.__new__(_RowHeap)
+        _IndexedHeap.__init__(heap, self.heap[:], self.keys[:], self.position[:])
+        heap.column = column
+        heap.sign = self.sign
+        return heap
 
 def heap_sort_vehicles_by_distance(vehicles):
-    heap = DSAHeap(len(vehicles))
-    for vehicle in vehicles:
-        heap.add(vehicle.get_distance_to_destination(), vehicle)
+    heap = DSAHeap.heapify((vehicle.get_distance_to_destination(), vehicle) for vehicle in vehicles)
     
     sorted_vehicles = []
     while heap.count > 0:
         sorted_vehicles.append(heap.remove().value)
     return sorted_vehicles
 
-def find_nearest_vehicle(vehicles):
-    if not vehicles:
+def _matches(vehicle, min_battery, location, feasible_only=False):
+    if min_battery is not None and vehicle.get_battery_level() < min_battery:
+        return False
+    if location is not None and vehicle.get_location() != location:
+        return False
+    if feasible_only and not vehicle.can_travel(vehicle.get_distance_to_destination()):
+        return False
+    return True
+
+def _select_top_k(items, k, priority, accept=None):
+    # Keeps the k best seen so far in a heap whose root is the worst of them,
+    # so each further item costs at most one O(log k) replacement.
+    if k <= 0:
+        return []
+    heap = DSAHeap(k)
+    for item in items:
+        if accept is not None and not accept(item):
+            continue
+        key = priority(item)
+        if heap.count < k:
+            heap.add(key, item)
+        elif heap.peek().priority < key:
+            worst = heap.peek()
+            worst.value = item
+            heap.update(worst, key)
+    selected = []
+    while heap.count > 0:
+        selected.append(heap.remove().value)
+    selected.reverse()
+    return selected
+
+def _vehicle_filter(min_battery, location, feasible_only):
+    if min_battery is None and location is None and not feasible_only:
         return None
-    return heap_sort_vehicles_by_distance(vehicles)[0]
+    return lambda vehicle: _matches(vehicle, min_battery, location, feasible_only)
+
+def k_nearest_vehicles(vehicles, k, min_battery=None, location=None, feasible_only=False):
+    return _select_top_k(vehicles, k, lambda v: -v.get_distance_to_destination(),
+                         _vehicle_filter(min_battery, location, feasible_only))
+
+def k_highest_battery(vehicles, k, min_battery=None, location=None, feasible_only=False):
+    return _select_top_k(vehicles, k, lambda v: v.get_battery_level(),
+                         _vehicle_filter(min_battery, location, feasible_only))
+
+def find_nearest_vehicle(vehicles, feasible_only=False):
+    selected = k_nearest_vehicles(vehicles, 1, feasible_only=feasible_only)
+    return selected[0] if selected else None
+
+def battery_key(vehicle):
+    return vehicle.get_battery_level()
+
+def distance_key(vehicle):
+    return vehicle.get_distance_to_destination()
+
+def battery_desc_distance_asc_key(vehicle):
+    return (-vehicle.get_battery_level(), vehicle.get_distance_to_destination())
 
-def partition(arr, low, high):
-    pivot = arr[high].get_battery_level()
-    i = low - 1
-    for j in range(low, high):
-        if arr[j].get_battery_level() >= pivot:
+_INSERTION_SORT_THRESHOLD = 16
+
+def sort_vehicles(vehicles, key, reverse=False, stable=False):
+    # Keys are computed once up front, then sorted alongside the vehicles.
+    # The default engine is an iterative introsort; stable=True uses a
+    # bottom-up merge sort instead.
+    if avms_stats.enabled:
+        return _sort_vehicles_counted(vehicles, key, reverse, stable)
+    keys = [key(vehicle) for vehicle in vehicles]
+    items = list(vehicles)
+    if stable:
+        _merge_sort(keys, items, reverse)
+        return items
+    _introsort(keys, items)
+    if reverse:
+        items.reverse()
+    return items
+
+def _sort_vehicles_counted(vehicles, key, reverse, stable):
+    # Same engines over wrapped keys and items, so the uninstrumented path
+    # carries no counting at all.
+    started = time.perf_counter()
+    keys = [avms_stats.CountingKey(key(vehicle)) for vehicle in vehicles]
+    items = avms_stats.CountingList(vehicles)
+    if stable:
+        _merge_sort(keys, items, reverse)
+    else:
+        _introsort(keys, items)
+        if reverse:
+            items.reverse()
+    avms_stats.count("sort.calls")
+    avms_stats.count("sort.elements", len(items))
+    avms_stats.record_time("sort.stable" if stable else "sort.introsort", time.perf_counter() - started)
+    return list(items)
+
+def _introsort(keys, items):
+    n = len(keys)
+    if n < 2:
+        return
+    stack = [(0, n - 1, 2 * n.bit_length())]
+    while stack:
+        low, high, depth = stack.pop()
+        while high - low > _INSERTION_SORT_THRESHOLD:
+            if depth == 0:
+                _heap_sort_range(keys, items, low, high)
+                break
+            depth -= 1
+            lt, gt = _partition3(keys, items, low, high)
+            # Defer the larger side and keep going on the smaller one, which
+            # bounds the stack at O(log n) entries.
+            if lt - low > high - gt:
+                stack.append((low, lt - 1, depth))
+                low = gt + 1
+            else:
+                stack.append((gt + 1, high, depth))
+                high = lt - 1
+    # Every range left unsorted is short and already in its final partition
+    _insertion_sort(keys, items, 0, n - 1)
+
+def _partition3(keys, items, low, high):
+    # Median-of-three pivot, then a Dutch-flag pass into < pivot, == pivot and
+    # > pivot, so runs of equal keys (e.g. a fleet charged to 100%) drop out.
+    a, b, c = keys[low], keys[(low + high) // 2], keys[high]
+    if a < b:
+        pivot = b if b < c else (c if a < c else a)
+    else:
+        pivot = a if a < c else (c if b < c else b)
+    lt, i, gt = low, low, high
+    while i <= gt:
+        key = keys[i]
+        if key < pivot:
+            keys[lt], keys[i] = key, keys[lt]
+            items[lt], items[i] = items[i], items[lt]
+            lt += 1
+            i += 1
+        elif pivot < key:
+            keys[gt], keys[i] = key, keys[gt]
+            items[gt], items[i] = items[i], items[gt]
+            gt -= 1
+        else:
             i += 1
-            arr[i], arr[j] = arr[j], arr[i]
-    arr[i + 1], arr[high] = arr[high], arr[i + 1]
-    return i + 1
+    return lt, gt
+
+def _insertion_sort(keys, items, low, high):
+    for i in range(low + 1, high + 1):
+        key, item = keys[i], items[i]
+        j = i - 1
+        while j >= low and key < keys[j]:
+            keys[j + 1] = keys[j]
+            items[j + 1] = items[j]
+            j -= 1
+        keys[j + 1] = key
+        items[j + 1] = item
+
+def _heap_sort_range(keys, items, low, high):
+    n = high - low + 1
+    for start in range(n // 2 - 1, -1, -1):
+        _sift_down(keys, items, low, start, n)
+    for end in range(n - 1, 0, -1):
+        keys[low], keys[low + end] = keys[low + end], keys[low]
+        items[low], items[low + end] = items[low + end], items[low]
+        _sift_down(keys, items, low, 0, end)
+
+def _sift_down(keys, items, offset, index, size):
+    # Max-heap over keys[offset:offset + size] for the ascending heapsort
+    while True:
+        child = 2 * index + 1
+        if child >= size:
+            return
+        if child + 1 < size and keys[offset + child] < keys[offset + child + 1]:
+            child += 1
+        if not keys[offset + index] < keys[offset + child]:
+            return
+        i, j = offset + index, offset + child
+        keys[i], keys[j] = keys[j], keys[i]
+        items[i], items[j] = items[j], items[i]
+        index = child
+
+def _merge_sort(keys, items, reverse):
+    n = len(keys)
+    width = _INSERTION_SORT_THRESHOLD
+    for low in range(0, n, width):
+        high = min(low + width, n) - 1
+        if reverse:
+            _insertion_sort_desc(keys, items, low, high)
+        else:
+            _insertion_sort(keys, items, low, high)
+
+    src_keys, src_items = keys, items
+    dst_keys, dst_items = [None] * n, [None] * n
+    if type(items) is not list:
+        dst_items = type(items)(dst_items)  # Keeps an instrumented list instrumented
+    while width < n:
+        for low in range(0, n, 2 * width):
+            mid = min(low + width, n)
+            high = min(low + 2 * width, n)
+            i, j, k = low, mid, low
+            while i < mid and j < high:
+                # Take from the right run only on a strict win, which keeps equal keys in order
+                if (src_keys[i] < src_keys[j]) if reverse else (src_keys[j] < src_keys[i]):
+                    dst_keys[k], dst_items[k] = src_keys[j], src_items[j]
+                    j += 1
+                else:
+                    dst_keys[k], dst_items[k] = src_keys[i], src_items[i]
+                    i += 1
+                k += 1
+            dst_keys[k:high] = src_keys[i:mid] if i < mid else src_keys[j:high]
+            dst_items[k:high] = src_items[i:mid] if i < mid else src_items[j:high]
+        src_keys, dst_keys = dst_keys, src_keys
+        src_items, dst_items = dst_items, src_items
+        width *= 2
+    if src_items is not items:
+        items[:] = src_items
+        keys[:] = src_keys
+
+def _insertion_sort_desc(keys, items, low, high):
+    for i in range(low + 1, high + 1):
+        key, item = keys[i], items[i]
+        j = i - 1
+        while j >= low and keys[j] < key:
+            keys[j + 1] = keys[j]
+            items[j + 1] = items[j]
+            j -= 1
+        keys[j + 1] = key
+        items[j + 1] = item
 
 def quick_sort_vehicles_by_battery(arr, low, high):
     if low < high:
-        pi = partition(arr, low, high)
-        quick_sort_vehicles_by_battery(arr, low, pi - 1)
-        quick_sort_vehicles_by_battery(arr, pi + 1, high)
+        arr[low:high + 1] = sort_vehicles(arr[low:high + 1], battery_key, reverse=True)
 
-def find_vehicle_with_highest_battery(vehicles):
-    if not vehicles:
-        return None
-    arr = vehicles.copy()  # Create a copy to avoid modifying original list
-    quick_sort_vehicles_by_battery(arr, 0, len(arr) - 1)
-    return arr[0]
\ No newline at end of file
+def find_vehicle_with_highest_battery(vehicles, feasible_only=False):
+    selected = k_highest_battery(vehicles, 1, feasible_only=feasible_only)
+    return selected[0] if selected else None
@@ -0,0 +1,203 @@
+import mmap
+import os
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from avms_main import DSAHeap, FrozenDSAGraph
+
+# Many-to-many road distances: one single-source search per origin, each
+# stopping once every destination is settled. Origins are split into chunks
+# that worker processes search over the CSR graph handed to their
+# initializer; with the fork start method the arrays are inherited
+# copy-on-write rather than copied, since array buffers carry no reference
+# counts. Results are float64, row-major, inf where a destination cannot be
+# reached and nan for rows not computed because the run was cancelled.
+
+INF = float("inf")
+NAN = float("nan")
+CHUNK_ROWS = 16  # Origins per task; also how often progress is reported
+
+class DistanceMatrix:
+    def __init__(self, origins, destinations, values, storage=None):
+        self.origins = origins
+        self.destinations = destinations
+        self.values = values  # array('d'), or a memoryview over a mapped file
+        self.complete = True
+        self._storage = storage  # (file, mmap) when the matrix lives on disk
+        self._rows = {label: i for i, label in enumerate(origins)}
+        self._columns = {label: j for j, label in enumerate(destinations)}
+
+    def shape(self):
+        return len(self.origins), len(self.destinations)
+
+    def get(self, origin, destination):
+        # Distance in km, None when unreachable or unknown
+        i, j = self._rows.get(origin), self._columns.get(destination)
+        if i is None or j is None:
+            return None
+        value = self.values[i * len(self.destinations) + j]
+        return None if value == INF or value != value else value
+
+    def row(self, origin):
+        i = self._rows[origin]
+        width = len(self.destinations)
+        return self.values[i * width:(i + 1) * width]
+
+    def close(self):
+        if self._storage is not None:
+            self.values.release()
+            f, mapping = self._storage
+            mapping.close()
+            f.close()
+            self._storage = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _map_file(path, size, write):
+    # Matrix files are raw little-endian float64, row-major, with no header
+    f = open(path, "r+b" if write else "rb")
+    try:
+        if write:
+            f.truncate(size * 8)
+        if size == 0:
+            f.close()  # An empty file cannot be mapped, and nothing needs it open
+            return None, None, memoryview(array('d'))
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+    except Exception:
+        f.close()
+        raise
+    return f, mapping, memoryview(mapping).cast('d')
+
+def load_matrix(path, origins, destinations):
+    # Reopens a matrix written by distance_matrix(..., path=...) read-only
+    size = len(origins) * len(destinations)
+    if os.path.getsize(path) != size * 8:
+        raise ValueError(f"{path} does not hold a {len(origins)} x {len(destinations)} matrix")
+    f, mapping, values = _map_file(path, size, False)
+    return DistanceMatrix(origins, destinations, values, (f, mapping) if mapping is not None else None)
+
+def _ids(graph, labels):
+    ids = []
+    for label in labels:
+        if label not in graph.index:
+            raise ValueError(f"Location {label} does not exist.")
+        ids.append(graph.index[label])
+    return ids
+
+def _search_rows(graph, origins, columns, width):
+    # One bounded Dijkstra per origin. columns maps a node id to the matrix
+    # columns it fills (a location can be listed more than once), so a search
+    # ends as soon as every destination node is settled.
+    offsets, neighbors, weights = graph.offsets, graph.neighbors, graph.weights
+    rows = array('d', [INF]) * (len(origins) * width)
+    for r, origin in enumerate(origins):
+        base = r * width
+        remaining = len(columns)
+        distances = {origin: 0}
+        settled = set()
+        heap = DSAHeap(None)
+        heap.add(0, origin)
+        while heap.count > 0 and remaining:
+            entry = heap.remove()
+            current = entry.value
+            if current in settled:
+                continue
+            settled.add(current)
+            filled = columns.get(current)
+            if filled is not None:
+                for j in filled:
+                    rows[base + j] = entry.priority
+                remaining -= 1
+            for j in range(offsets[current], offsets[current + 1]):
+                neighbor = neighbors[j]
+                candidate = entry.priority + weights[j]
+                if neighbor not in distances or candidate < distances[neighbor]:
+                    distances[neighbor] = candidate
+                    heap.add(candidate, neighbor)
+    return rows
+
+_worker_graph = None
+_worker_columns = None
+
+def _init_worker(graph, columns):
+    global _worker_graph, _worker_columns
+    _worker_graph, _worker_columns = graph, columns
+
+def _worker_rows(task):
+    start, origins, width = task
+    return start, _search_rows(_worker_graph, origins, _worker_columns, width)
+
+def distance_matrix(graph, origins, destinations=None, workers=1, path=None, progress=None):
+    # Road distances from every origin to every destination (default: the
+    # origins). With path, the matrix is written to that file through a
+    # memory map instead of being held in memory; call close() when done.
+    # progress(rows done, total rows) is called after each chunk; returning
+    # False stops the run, leaving complete False and nan in unfinished rows.
+    frozen = graph if isinstance(graph, FrozenDSAGraph) else graph.freeze()
+    origins = list(origins)
+    destinations = origins if destinations is None else list(destinations)
+    origin_ids = _ids(frozen, origins)
+    columns = {}
+    for j, node in enumerate(_ids(frozen, destinations)):
+        columns.setdefault(node, []).append(j)
+    width = len(destinations)
+
+    size = len(origins) * width
+    if path is None:
+        matrix = DistanceMatrix(origins, destinations, array('d', [NAN]) * size)
+    else:
+        with open(path, "wb"):
+            pass
+        f, mapping, values = _map_file(path, size, True)
+        matrix = DistanceMatrix(origins, destinations, values, (f, mapping) if mapping is not None else None)
+        block = memoryview(array('d', [NAN]) * min(size, 65536))
+        for k in range(0, size, len(block) or 1):
+            values[k:k + len(block)] = block[:size - k]
+    if size == 0:
+        return matrix
+
+    tasks = [(start, origin_ids[start:start + CHUNK_ROWS], width)
+             for start in range(0, len(origin_ids), CHUNK_ROWS)]
+    done = 0
+
+    def store(start, rows):
+        nonlocal done
+        offset = start * width
+        matrix.values[offset:offset + len(rows)] = rows if path is None else memoryview(rows)
+        done += len(rows) // width
+        return progress is None or progress(done, len(origins)) is not False
+
+    if workers <= 1:
+        for start, chunk, _ in tasks:
+            if not store(start, _search_rows(frozen, chunk, columns, width)):
+                matrix.complete = False
+                break
+        return matrix
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(frozen, columns)) as pool:
+        # Keep a couple of chunks queued per worker, so cancelling stops
+        # promptly instead of after the whole backlog has been submitted
+        pending = set()
+        queue = iter(tasks)
+        for task in queue:
+            pending.add(pool.submit(_worker_rows, task))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                if not store(*future.result()):
+                    matrix.complete = False
+            if not matrix.complete:
+                for future in pending:
+                    future.cancel()
+                break
+            for task in queue:
+                pending.add(pool.submit(_worker_rows, task))
+                if len(pending) >= workers * 2:
+                    break
+    return matrix
@@ -1,9 +1,69 @@
-from avms_main import DSAGraph, VehicleHashTable, Vehicle, heap_sort_vehicles_by_distance, find_nearest_vehicle, quick_sort_vehicles_by_battery, find_vehicle_with_highest_battery
+import math
+import sys
+
+import avms_stats
+from avms_main import DEFAULT_VEHICLE_CLASS, ENERGY_MODELS, DSAGraph, VehicleHashTable, Vehicle
+from avms_assign import assign_requests
+from avms_dispatch import nearest_vehicles_to
+from avms_energy import plan_vehicle_route
+from avms_snapshot import SnapshotError, load_snapshot, save_snapshot
 
 class AVMSMenu:
-    def __init__(self):
-        self.road_network = DSAGraph()
+    def __init__(self, snapshot_path=None):
+        self._road_network = DSAGraph()
+        self._snapshot = None  # Open while reads are served from its mapped graph
         self.vehicle_table = VehicleHashTable()
+        if snapshot_path:
+            self.load_state(snapshot_path)
+    
+    @property
+    def road_network(self):
+        # The mutable network. After a load it is thawed from the snapshot on
+        # first use, i.e. by the first change, and the file is released.
+        if self._road_network is None:
+            with avms_stats.span("menu.thaw_network"):
+                self._road_network = self._snapshot.thaw_graph()
+            self._snapshot.close()
+            self._snapshot = None
+        return self._road_network
+    
+    def network(self):
+        # Graph for read-only queries: the snapshot's frozen graph until
+        # something changes, so loading does not rebuild the whole network
+        if self._road_network is None:
+            return self._snapshot.graph()
+        return self._road_network
+    
+    def load_state(self, path):
+        try:
+            with avms_stats.span("menu.load_snapshot"):
+                snapshot = load_snapshot(path)
+                try:
+                    fleet = snapshot.load_fleet()
+                    locations = snapshot.graph().node_count()
+                except Exception:
+                    snapshot.close()
+                    raise
+            if self._snapshot is not None:
+                self._snapshot.close()
+            self._snapshot, self._road_network, self.vehicle_table = snapshot, None, fleet
+            print(f"Loaded {locations} locations and {self.vehicle_table.count} vehicles from {path}.")
+        except (OSError, SnapshotError) as e:
+            print(f"Error: Could not load snapshot: {e}")
+    
+    def save_state(self):
+        path = input("Enter snapshot file name: ").strip()
+        if not path:
+            print("Error: File name cannot be empty.")
+            return
+        try:
+            with avms_stats.span("menu.save_snapshot"):
+                # road_network, not network(): saving over the loaded file
+                # must not happen while it is still mapped
+                save_snapshot(path, self.road_network, self.vehicle_table)
+            print(f"Snapshot saved to {path}.")
+        except OSError as e:
+            print(f"Error: Could not save snapshot: {e}")
         
     def run(self):
         while True:
@@ -11,9 +71,11 @@ class AVMSMenu:
             print("1. Manage Road Network")
             print("2. Manage Vehicles")
             print("3. Vehicle Recommendations")
-            print("4. Exit")
+            print("4. Save Snapshot")
+            print("5. Show Statistics")
+            print("6. Exit")
             
-            choice = input("Enter choice (1-4): ").strip()
+            choice = input("Enter choice (1-6): ").strip()
             
             if choice == "1":
                 self.manage_road_network()
@@ -22,10 +84,14 @@ class AVMSMenu:
             elif choice == "3":
                 self.vehicle_recommendations()
             elif choice == "4":
+                self.save_state()
+            elif choice == "5":
+                print(avms_stats.report(self.vehicle_table, self.network()))
+            elif choice == "6":
                 print("Exiting AVMS. Goodbye!")
                 break
             else:
-                print("Invalid choice. Please enter a number between 1 and 4.")
+                print("Invalid choice. Please enter a number between 1 and 6.")
     
     def manage_road_network(self):
         while True:
@@ -34,26 +100,40 @@ class AVMSMenu:
             print("2. Add Road")
             print("3. Display Network")
             print("4. Check Path")
-            print("5. Back to Main Menu")
+            print("5. Show Connected Components")
+            print("6. Mark Charging Station")
+            print("7. Update Road Distance")
+            print("8. Close Road")
+            print("9. Remove Location")
+            print("10. Back to Main Menu")
             
-            choice = input("Enter choice (1-5): ").strip()
+            choice = input("Enter choice (1-10): ").strip()
             
             if choice == "1":
                 location = input("Enter location name: ").strip()
                 if not location:
                     print("Error: Location name cannot be empty.")
-                elif location in self.road_network.nodes:
+                elif self.network().has_node(location):
                     print(f"Error: Location {location} already exists.")
                 else:
-                    self.road_network.add_node(location)
+                    coordinates = input("Enter coordinates as x,y in km (blank to skip): ").strip()
+                    try:
+                        x, y = (float(part) for part in coordinates.split(",")) if coordinates else (None, None)
+                        if x is not None and not (math.isfinite(x) and math.isfinite(y)):
+                            raise ValueError(coordinates)
+                    except ValueError:
+                        print("Error: Coordinates must be two numbers separated by a comma.")
+                        continue
+                    with avms_stats.span("menu.add_location"):
+                        self.road_network.add_node(location, x, y)
                     print(f"Location {location} added successfully.")
             elif choice == "2":
                 loc1 = input("Enter first location: ").strip()
                 loc2 = input("Enter second location: ").strip()
-                if loc1 not in self.road_network.nodes:
+                if not self.network().has_node(loc1):
                     print(f"Error: Location {loc1} does not exist.")
                     continue
-                if loc2 not in self.road_network.nodes:
+                if not self.network().has_node(loc2):
                     print(f"Error: Location {loc2} does not exist.")
                     continue
                 if loc1 == loc2:
@@ -64,32 +144,135 @@ class AVMSMenu:
                     if distance <= 0:
                         print("Error: Distance must be a positive integer.")
                         continue
-                    self.road_network.add_edge(loc1, loc2, distance)
+                    with avms_stats.span("menu.add_road"):
+                        version = self.road_network.version
+                        added = self.road_network.add_edge(loc1, loc2, distance)
+                        if added:
+                            self.refresh_vehicle_distances(version)
+                    if not added:
+                        print(f"Error: Road between {loc1} and {loc2} already exists.")
+                        continue
                     print(f"Road between {loc1} and {loc2} added with distance {distance}km.")
                 except ValueError:
                     print("Error: Distance must be a valid integer.")
             elif choice == "3":
-                if not self.road_network.nodes:
+                if not self.network().node_count():
                     print("Error: Road network is empty.")
                 else:
-                    self.road_network.display()
+                    self.network().display()
             elif choice == "4":
                 loc1 = input("Enter source location: ").strip()
                 loc2 = input("Enter destination location: ").strip()
-                if loc1 not in self.road_network.nodes:
+                network = self.network()
+                if not network.has_node(loc1):
                     print(f"Error: Location {loc1} does not exist.")
                     continue
-                if loc2 not in self.road_network.nodes:
+                if not network.has_node(loc2):
                     print(f"Error: Location {loc2} does not exist.")
                     continue
-                if self.road_network.is_path(loc1, loc2):
+                with avms_stats.span("menu.check_path"):
+                    connected = network.is_path(loc1, loc2)
+                    if connected:
+                        route, distance = network.shortest_path(loc1, loc2)
+                if connected:
                     print(f"Path exists between {loc1} and {loc2}.")
+                    print(f"Shortest route: {' -> '.join(route)} ({distance}km)")
                 else:
                     print(f"No path exists between {loc1} and {loc2}.")
             elif choice == "5":
+                if not self.network().node_count():
+                    print("Error: Road network is empty.")
+                else:
+                    with avms_stats.span("menu.connected_components"):
+                        components = self.network().connected_components()
+                    print(f"{len(components)} connected component(s):")
+                    for members in components:
+                        print(f"Size {len(members)}: {members}")
+            elif choice == "6":
+                location = input("Enter location name: ").strip()
+                if not self.network().has_node(location):
+                    print(f"Error: Location {location} does not exist.")
+                else:
+                    self.road_network.set_charger(location)
+                    print(f"Location {location} marked as a charging station.")
+            elif choice == "7":
+                self.update_road_distance()
+            elif choice == "8":
+                self.close_road()
+            elif choice == "9":
+                self.remove_location()
+            elif choice == "10":
                 break
             else:
-                print("Invalid choice. Please enter a number between 1 and 5.")
+                print("Invalid choice. Please enter a number between 1 and 10.")
+    
+    def update_road_distance(self):
+        loc1 = input("Enter first location: ").strip()
+        loc2 = input("Enter second location: ").strip()
+        # Checked against the read-only network, so a snapshot is only thawed
+        # when the road really changes
+        current = dict(self.network().get_neighbors(loc1)).get(loc2)
+        if current is None:
+            print(f"Error: No road between {loc1} and {loc2}.")
+            return
+        try:
+            distance = int(input("Enter new distance (km): "))
+            if distance <= 0:
+                print("Error: Distance must be a positive integer.")
+                return
+        except ValueError:
+            print("Error: Distance must be a valid integer.")
+            return
+        if distance == current:
+            print(f"Road between {loc1} and {loc2} is already {distance}km.")
+            return
+            
+        with avms_stats.span("menu.update_road_distance"):
+            version = self.road_network.version
+            self.road_network.update_edge_weight(loc1, loc2, distance)
+            stranded = self.refresh_vehicle_distances(version)
+        print(f"Road between {loc1} and {loc2} now {distance}km.")
+        self.report_stranded(stranded)
+    
+    def close_road(self):
+        loc1 = input("Enter first location: ").strip()
+        loc2 = input("Enter second location: ").strip()
+        if loc2 not in dict(self.network().get_neighbors(loc1)):
+            print(f"Error: No road between {loc1} and {loc2}.")
+            return
+        with avms_stats.span("menu.close_road"):
+            version = self.road_network.version
+            self.road_network.remove_edge(loc1, loc2)
+            stranded = self.refresh_vehicle_distances(version)
+        print(f"Road between {loc1} and {loc2} closed.")
+        self.report_stranded(stranded)
+    
+    def remove_location(self):
+        location = input("Enter location name: ").strip()
+        if not self.network().has_node(location):
+            print(f"Error: Location {location} does not exist.")
+            return
+        # Vehicles there or heading there would be left pointing at nothing
+        users = self.vehicle_table.vehicles_using(location)
+        if users:
+            print(f"Error: Location {location} is used by {len(users)} vehicle(s): "
+                  f"{', '.join(sorted(vehicle.vehicle_id for vehicle in users))}. "
+                  "Move or remove them first.")
+            return
+        with avms_stats.span("menu.remove_location"):
+            version = self.road_network.version
+            self.road_network.remove_node(location)
+            stranded = self.refresh_vehicle_distances(version)
+        print(f"Location {location} and its roads removed.")
+        self.report_stranded(stranded)
+    
+    def refresh_vehicle_distances(self, version):
+        # Only vehicles whose routes the change touched are recomputed
+        return self.vehicle_table.refresh_distances(self.road_network, version)
+    
+    def report_stranded(self, stranded):
+        for vehicle in stranded:
+            print(f"Warning: Vehicle {vehicle.vehicle_id} can no longer reach {vehicle.get_destination()}.")
     
     def manage_vehicles(self):
         while True:
@@ -99,9 +282,10 @@ class AVMSMenu:
             print("3. Update Vehicle Destination")
             print("4. View All Vehicles")
             print("5. Remove Vehicle")
-            print("6. Back to Main Menu")
+            print("6. Find Vehicles by Location")
+            print("7. Back to Main Menu")
             
-            choice = input("Enter choice (1-6): ").strip()
+            choice = input("Enter choice (1-7): ").strip()
             
             if choice == "1":
                 self.add_vehicle()
@@ -114,9 +298,11 @@ class AVMSMenu:
             elif choice == "5":
                 self.remove_vehicle()
             elif choice == "6":
+                self.find_vehicles_by_location()
+            elif choice == "7":
                 break
             else:
-                print("Invalid choice. Please enter a number between 1 and 6.")
+                print("Invalid choice. Please enter a number between 1 and 7.")
     
     def add_vehicle(self):
         vid = input("Enter vehicle ID: ").strip()
@@ -132,7 +318,7 @@ class AVMSMenu:
         if not location:
             print("Error: Location cannot be empty.")
             return
-        if location not in self.road_network.nodes:
+        if not self.network().has_node(location):
             print(f"Error: Location {location} does not exist in road network.")
             return
             
@@ -140,7 +326,7 @@ class AVMSMenu:
         if not destination:
             print("Error: Destination cannot be empty.")
             return
-        if destination not in self.road_network.nodes:
+        if not self.network().has_node(destination):
             print(f"Error: Destination {destination} does not exist in road network.")
             return
             
@@ -150,18 +336,23 @@ class AVMSMenu:
                 print("Error: Battery level must be between 0 and 100.")
                 return
                 
-            vehicle = Vehicle(vid, location, destination, battery)
-            try:
-                distance = int(input(f"Enter distance from {location} to {destination} (km): "))
-                if distance <= 0:
-                    print("Error: Distance must be a positive integer.")
-                    return
-                vehicle.set_distance_to_destination(distance)
-            except ValueError:
-                print("Error: Distance must be a valid integer.")
+            with avms_stats.span("menu.route_distance"):
+                distance = self.network().shortest_distance(location, destination)
+            if distance is None:
+                print(f"Error: No path exists between {location} and {destination}.")
+                return
+                
+            classes = "/".join(ENERGY_MODELS)
+            vehicle_class = input(f"Enter vehicle class ({classes}) [{DEFAULT_VEHICLE_CLASS}]: ").strip()
+            vehicle_class = vehicle_class or DEFAULT_VEHICLE_CLASS
+            if vehicle_class not in ENERGY_MODELS:
+                print(f"Error: Vehicle class must be one of {classes}.")
                 return
                 
-            self.vehicle_table.put(vid, vehicle)
+            with avms_stats.span("menu.add_vehicle"):
+                vehicle = Vehicle(vid, location, destination, battery, vehicle_class)
+                vehicle.set_distance_to_destination(distance)
+                self.vehicle_table.put(vid, vehicle)
             print(f"Vehicle {vid} added successfully.")
         except ValueError:
             print("Error: Battery level must be a valid integer.")
@@ -180,20 +371,19 @@ class AVMSMenu:
         if not new_loc:
             print("Error: Location cannot be empty.")
             return
-        if new_loc not in self.road_network.nodes:
+        if not self.network().has_node(new_loc):
             print(f"Error: Location {new_loc} does not exist in road network.")
             return
             
+        with avms_stats.span("menu.route_distance"):
+            dist = self.network().shortest_distance(new_loc, vehicle.get_destination())
+        if dist is None:
+            print(f"Error: No path exists between {new_loc} and {vehicle.get_destination()}.")
+            return
+            
         vehicle.set_location(new_loc)
-        try:
-            dist = int(input(f"Enter distance from {new_loc} to {vehicle.get_destination()} (km): "))
-            if dist <= 0:
-                print("Error: Distance must be a positive integer.")
-                return
-            vehicle.set_distance_to_destination(dist)
-            print(f"Updated location for {vid} to {new_loc} with distance {dist}km.")
-        except ValueError:
-            print("Error: Distance must be a valid integer.")
+        vehicle.set_distance_to_destination(dist)
+        print(f"Updated location for {vid} to {new_loc} with distance {dist}km.")
     
     def update_vehicle_destination(self):
         vid = input("Enter vehicle ID: ").strip()
@@ -209,27 +399,27 @@ class AVMSMenu:
         if not new_dest:
             print("Error: Destination cannot be empty.")
             return
-        if new_dest not in self.road_network.nodes:
+        if not self.network().has_node(new_dest):
             print(f"Error: Destination {new_dest} does not exist in road network.")
             return
             
+        with avms_stats.span("menu.route_distance"):
+            dist = self.network().shortest_distance(vehicle.get_location(), new_dest)
+        if dist is None:
+            print(f"Error: No path exists between {vehicle.get_location()} and {new_dest}.")
+            return
+            
         vehicle.set_destination(new_dest)
-        try:
-            dist = int(input(f"Enter distance from {vehicle.get_location()} to {new_dest} (km): "))
-            if dist <= 0:
-                print("Error: Distance must be a positive integer.")
-                return
-            vehicle.set_distance_to_destination(dist)
-            print(f"Updated destination for {vid} to {new_dest} with distance {dist}km.")
-        except ValueError:
-            print("Error: Distance must be a valid integer.")
+        vehicle.set_distance_to_destination(dist)
+        print(f"Updated destination for {vid} to {new_dest} with distance {dist}km.")
     
     def view_all_vehicles(self):
         if self.vehicle_table.count == 0:
             print("No vehicles in system.")
             return
         print("\nAll Vehicles:")
-        self.vehicle_table.display_all()
+        with avms_stats.span("menu.view_all_vehicles"):
+            self.vehicle_table.display_all()
     
     def remove_vehicle(self):
         vid = input("Enter vehicle ID to remove: ").strip()
@@ -237,43 +427,168 @@ class AVMSMenu:
             print("Error: Vehicle ID cannot be empty.")
             return
             
-        if self.vehicle_table.remove(vid):
+        with avms_stats.span("menu.remove_vehicle"):
+            removed = self.vehicle_table.remove(vid)
+        if removed:
             print(f"Vehicle {vid} removed successfully.")
         else:
             print(f"Error: Vehicle {vid} not found.")
     
+    def find_vehicles_by_location(self):
+        location = input("Enter location: ").strip()
+        if not location:
+            print("Error: Location cannot be empty.")
+            return
+        if not self.network().has_node(location):
+            print(f"Error: Location {location} does not exist in road network.")
+            return
+            
+        with avms_stats.span("menu.find_vehicles_by_location"):
+            at_location = self.vehicle_table.vehicles_at(location)
+            heading_to = self.vehicle_table.vehicles_heading_to(location)
+        print(f"\nVehicles at {location}: {len(at_location)}")
+        for vehicle in at_location:
+            print(vehicle)
+        print(f"\nVehicles heading to {location}: {len(heading_to)}")
+        for vehicle in heading_to:
+            print(vehicle)
+    
     def vehicle_recommendations(self):
         if self.vehicle_table.count == 0:
             print("No vehicles in system.")
             return
             
-        vehicles = [entry.value for entry in self.vehicle_table.table if entry.state == 1]
-        
         while True:
             print("\nVehicle Recommendations")
             print("1. Find Nearest Vehicle to Destination")
             print("2. Find Vehicle with Highest Battery")
-            print("3. Back to Main Menu")
+            print("3. List k Nearest Vehicles")
+            print("4. List k Highest Battery Vehicles")
+            print("5. Dispatch Nearest Vehicles to Pickup")
+            print("6. Plan Route with Charging Stops")
+            print("7. Assign Ride Requests")
+            print("8. Back to Main Menu")
             
-            choice = input("Enter choice (1-3): ").strip()
+            choice = input("Enter choice (1-8): ").strip()
             
             if choice == "1":
-                nearest = find_nearest_vehicle(vehicles)
+                with avms_stats.span("menu.nearest_vehicle"):
+                    nearest = self.vehicle_table.nearest_vehicle(feasible_only=True)
                 if nearest:
                     print(f"\nNearest vehicle to its destination:\n{nearest}")
                 else:
-                    print("No vehicles available.")
+                    print("No vehicle has enough range for its trip.")
             elif choice == "2":
-                highest_bat = find_vehicle_with_highest_battery(vehicles)
+                with avms_stats.span("menu.highest_battery_vehicle"):
+                    highest_bat = self.vehicle_table.highest_battery_vehicle(feasible_only=True)
                 if highest_bat:
                     print(f"\nVehicle with highest battery:\n{highest_bat}")
                 else:
-                    print("No vehicles available.")
+                    print("No vehicle has enough range for its trip.")
             elif choice == "3":
+                self.list_top_vehicles(self.vehicle_table.k_nearest, "nearest to their destination")
+            elif choice == "4":
+                self.list_top_vehicles(self.vehicle_table.k_highest_battery, "with highest battery")
+            elif choice == "5":
+                self.dispatch_to_pickup()
+            elif choice == "6":
+                self.plan_route()
+            elif choice == "7":
+                self.assign_ride_requests()
+            elif choice == "8":
                 break
             else:
-                print("Invalid choice. Please enter a number between 1 and 3.")
+                print("Invalid choice. Please enter a number between 1 and 8.")
+    
+    def plan_route(self):
+        vid = input("Enter vehicle ID: ").strip()
+        vehicle = self.vehicle_table.get(vid)
+        if not vehicle:
+            print(f"Error: Vehicle {vid} not found.")
+            return
+        destination = input(f"Enter destination [{vehicle.get_destination()}]: ").strip() or vehicle.get_destination()
+        if not self.network().has_node(destination):
+            print(f"Error: Destination {destination} does not exist in road network.")
+            return
+            
+        with avms_stats.span("menu.plan_route"):
+            route, distance, stops = plan_vehicle_route(self.network(), vehicle, destination)
+        if not route:
+            print(f"Vehicle {vid} cannot reach {destination}, even with charging stops.")
+            return
+        print(f"Route: {' -> '.join(route)} ({distance}km)")
+        if stops:
+            print(f"Charging stops: {', '.join(stops)}")
+        else:
+            print("No charging needed.")
+    
+    def assign_ride_requests(self):
+        pickups = [p.strip() for p in input("Enter pickup locations (comma-separated): ").split(",") if p.strip()]
+        if not pickups:
+            print("Error: Enter at least one pickup location.")
+            return
+        for pickup in pickups:
+            if not self.network().has_node(pickup):
+                print(f"Error: Location {pickup} does not exist in road network.")
+                return
+                
+        with avms_stats.span("menu.assign_ride_requests"):
+            assignments, unassigned = assign_requests(self.network(), self.vehicle_table, pickups)
+        for request, vehicle, distance in assignments:
+            print(f"Pickup at {pickups[request]}: {vehicle.vehicle_id} ({distance}km away)")
+        for request in unassigned:
+            print(f"Pickup at {pickups[request]}: no vehicle available")
+    
+    def dispatch_to_pickup(self):
+        pickup = input("Enter pickup location: ").strip()
+        if not pickup:
+            print("Error: Location cannot be empty.")
+            return
+        if not self.network().has_node(pickup):
+            print(f"Error: Location {pickup} does not exist in road network.")
+            return
+        try:
+            k = int(input("How many vehicles? "))
+            if k <= 0:
+                print("Error: Number of vehicles must be a positive integer.")
+                return
+            min_battery = input("Minimum battery level (blank for any): ").strip()
+            min_battery = int(min_battery) if min_battery else None
+        except ValueError:
+            print("Error: Please enter a valid integer.")
+            return
+            
+        with avms_stats.span("menu.dispatch"):
+            found = nearest_vehicles_to(self.network(), self.vehicle_table, pickup, k, min_battery,
+                                        feasible_only=True)
+        if not found:
+            print(f"No vehicles can reach {pickup}.")
+            return
+        print(f"\nNearest vehicle(s) to {pickup} by road:")
+        for vehicle, distance in found:
+            print(f"{distance}km away: {vehicle}")
+    
+    def list_top_vehicles(self, select, description):
+        try:
+            k = int(input("How many vehicles? "))
+            if k <= 0:
+                print("Error: Number of vehicles must be a positive integer.")
+                return
+            min_battery = input("Minimum battery level (blank for any): ").strip()
+            min_battery = int(min_battery) if min_battery else None
+        except ValueError:
+            print("Error: Please enter a valid integer.")
+            return
+            
+        with avms_stats.span("menu.list_top_vehicles"):
+            selected = select(k, min_battery, feasible_only=True)
+        if not selected:
+            print("No vehicles match.")
+            return
+        print(f"\nTop {len(selected)} vehicle(s) {description}:")
+        for vehicle in selected:
+            print(vehicle)
 
 if __name__ == "__main__":
-    menu = AVMSMenu()
+    menu = AVMSMenu(sys.argv[1] if len(sys.argv) > 1 else None)
     menu.run()
\ No newline at end of file
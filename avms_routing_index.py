@@ -0,0 +1,454 @@
+import argparse
+import random
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from avms_main import DSAHeap, FrozenDSAGraph
+
+# Optional preprocessing that speeds up point-to-point distance queries on a
+# FrozenDSAGraph. LandmarkIndex (ALT) keeps exact distances from a few
+# landmarks to every location and uses the triangle inequality as an A*
+# bound. ContractionHierarchy contracts locations in order of importance,
+# adding shortcuts so a query only ever climbs towards more important
+# locations from both ends. Both answer distance() and shortest_path() with
+# the same results as a plain search, and both are stored as extra sections
+# of a snapshot (see avms_snapshot.save_snapshot).
+
+INF = float("inf")
+
+def _frozen(graph):
+    # Indexes work on dense ids; remember which DSAGraph version they match
+    if isinstance(graph, FrozenDSAGraph):
+        return graph, None
+    return graph.freeze(), graph.version
+
+class LandmarkIndex:
+    def __init__(self, graph, landmarks, tables, version=None):
+        self.graph = graph
+        self.landmarks = landmarks  # Node ids
+        self.tables = tables  # Flat, landmark-major: distance from landmark i to node v at i * n + v
+        self.version = version  # DSAGraph.version it was built from, None if unknown
+
+    def landmark_labels(self):
+        return [self.graph.labels[i] for i in self.landmarks]
+
+    def is_current(self, graph):
+        return self.version is not None and self.version == graph.version
+
+    def _bound(self, node, target):
+        # Lower bound on the distance node -> target from every landmark L:
+        # |d(L, target) - d(L, node)|, over landmarks that reach both.
+        tables, n = self.tables, len(self.graph.labels)
+        best = 0
+        for base in range(0, len(tables), n):
+            to_node, to_target = tables[base + node], tables[base + target]
+            if to_node != INF and to_target != INF:
+                gap = to_target - to_node if to_target > to_node else to_node - to_target
+                if gap > best:
+                    best = gap
+        return best
+
+    def _search(self, source, target):
+        # A* over the CSR graph; the landmark bound is consistent, so the first
+        # time target is settled its distance is final.
+        graph = self.graph
+        offsets, neighbors, weights = graph.offsets, graph.neighbors, graph.weights
+        distances = {source: 0}
+        previous = {}
+        bounds = {}
+        settled = set()
+        heap = DSAHeap(None)
+        heap.add(self._bound(source, target), source)
+        while heap.count > 0:
+            current = heap.remove().value
+            if current in settled:
+                continue
+            if current == target:
+                return distances[target], previous
+            settled.add(current)
+            base = distances[current]
+            for j in range(offsets[current], offsets[current + 1]):
+                neighbor = neighbors[j]
+                candidate = base + weights[j]
+                if neighbor not in distances or candidate < distances[neighbor]:
+                    distances[neighbor] = candidate
+                    previous[neighbor] = current
+                    bound = bounds.get(neighbor)
+                    if bound is None:
+                        bound = bounds[neighbor] = self._bound(neighbor, target)
+                    heap.add(candidate + bound, neighbor)
+        return None, previous
+
+    def distance(self, source, target):
+        ids = _endpoints(self.graph, source, target)
+        if ids is None:
+            return None
+        return self._search(*ids)[0]
+
+    def shortest_path(self, source, target):
+        ids = _endpoints(self.graph, source, target)
+        if ids is None:
+            return [], None
+        distance, previous = self._search(*ids)
+        if distance is None:
+            return [], None
+        path = [ids[1]]
+        while path[-1] != ids[0]:
+            path.append(previous[path[-1]])
+        return [self.graph.labels[i] for i in reversed(path)], distance
+
+    def sections(self):
+        return [(b"ALMK", array('q', self.landmarks)), (b"ALTD", array('d', self.tables))]
+
+def _endpoints(graph, source, target):
+    # Dense ids for a query, or None when no route can exist
+    if source not in graph.index or target not in graph.index:
+        return None
+    source, target = graph.index[source], graph.index[target]
+    if graph.components[source] != graph.components[target]:
+        return None
+    return source, target
+
+def _landmark_table(graph, landmark):
+    distances = graph._dijkstra(landmark)[0]
+    return array('d', (INF if d is None else d for d in distances))
+
+_worker_graph = None
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+def _worker_table(landmark):
+    return _landmark_table(_worker_graph, landmark)
+
+def build_landmarks(graph, count=8, landmarks=None, workers=1, seed=1):
+    # Without landmarks, picks them by farthest-point selection: each new one
+    # is the location furthest from all chosen so far (unreached components
+    # first). That is inherently sequential, so pass the previous index's
+    # landmark_labels() to rebuild after road changes: with the set known, the
+    # tables are independent and are computed across worker processes.
+    frozen, version = _frozen(graph)
+    n = len(frozen.labels)
+    if n == 0:
+        return LandmarkIndex(frozen, array('q'), array('d'), version)
+    if landmarks is not None:
+        ids = [frozen.index[label] for label in landmarks]
+        if workers > 1:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(frozen,)) as pool:
+                tables = list(pool.map(_worker_table, ids))
+        else:
+            tables = [_landmark_table(frozen, i) for i in ids]
+    else:
+        ids, tables = [], []
+        start = random.Random(seed).randrange(n)
+        nearest = _landmark_table(frozen, start)  # Seeds the selection, not kept
+        for _ in range(min(count, n)):
+            best = max(range(n), key=lambda v: (nearest[v], -v))
+            if ids and nearest[best] == 0:
+                break  # Every location is already a landmark
+            ids.append(best)
+            table = _landmark_table(frozen, best)
+            tables.append(table)
+            if len(ids) == 1:
+                nearest = array('d', table)
+            else:
+                for v in range(n):
+                    if table[v] < nearest[v]:
+                        nearest[v] = table[v]
+    flat = array('d')
+    for table in tables:
+        flat.extend(table)
+    return LandmarkIndex(frozen, array('q', ids), flat, version)
+
+class ContractionHierarchy:
+    def __init__(self, graph, rank, offsets, neighbors, weights, middles, version=None):
+        self.graph = graph
+        self.rank = rank  # Contraction order of each node
+        # Upward graph in CSR: edges from each node to more important ones,
+        # shortcuts included. middles holds the contracted node a shortcut
+        # bypasses, -1 for an original road.
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.weights = weights
+        self.middles = middles
+        self.version = version
+
+    def is_current(self, graph):
+        return self.version is not None and self.version == graph.version
+
+    def _search(self, source, target):
+        # Bidirectional Dijkstra over upward edges only. Roads are undirected,
+        # so both sides use the same upward graph. A side stops once its next
+        # key cannot beat the best meeting point.
+        offsets, neighbors, weights = self.offsets, self.neighbors, self.weights
+        distances = ({source: 0}, {target: 0})
+        parents = ({}, {})
+        heaps = (DSAHeap(None), DSAHeap(None))
+        heaps[0].add(0, source)
+        heaps[1].add(0, target)
+        settled = (set(), set())
+        best, meeting = INF, -1
+        if source == target:
+            best, meeting = 0, source
+        while True:
+            # Alternate sides, skipping one whose next key cannot beat best
+            active = [side for side in (0, 1) if heaps[side].count > 0 and heaps[side].peek().priority < best]
+            if not active:
+                break
+            for side in active:
+                entry = heaps[side].remove()
+                current = entry.value
+                if current in settled[side]:
+                    continue
+                settled[side].add(current)
+                here, there = distances[side], distances[1 - side]
+                if current in there and entry.priority + there[current] < best:
+                    best, meeting = entry.priority + there[current], current
+                for j in range(offsets[current], offsets[current + 1]):
+                    neighbor = neighbors[j]
+                    candidate = entry.priority + weights[j]
+                    if neighbor not in here or candidate < here[neighbor]:
+                        here[neighbor] = candidate
+                        parents[side][neighbor] = current
+                        heaps[side].add(candidate, neighbor)
+        if meeting < 0:
+            return None, None
+        return best, (meeting, parents)
+
+    def distance(self, source, target):
+        ids = _endpoints(self.graph, source, target)
+        if ids is None:
+            return None
+        return self._search(*ids)[0]
+
+    def shortest_path(self, source, target):
+        ids = _endpoints(self.graph, source, target)
+        if ids is None:
+            return [], None
+        distance, found = self._search(*ids)
+        if distance is None:
+            return [], None
+        meeting, (forward, backward) = found
+        climb = [meeting]
+        while climb[-1] != ids[0]:
+            climb.append(forward[climb[-1]])
+        climb.reverse()
+        descent = [meeting]
+        while descent[-1] != ids[1]:
+            descent.append(backward[descent[-1]])
+        hops = climb + descent[1:]
+        path = [hops[0]]
+        for a, b in zip(hops, hops[1:]):
+            self._unpack(a, b, path)
+        return [self.graph.labels[i] for i in path], distance
+
+    def _unpack(self, a, b, path):
+        # Appends the original roads a shortcut a-b stands for, excluding a
+        lower, upper = (a, b) if self.rank[a] < self.rank[b] else (b, a)
+        for j in range(self.offsets[lower], self.offsets[lower + 1]):
+            if self.neighbors[j] == upper:
+                middle = self.middles[j]
+                break
+        if middle < 0:
+            path.append(b)
+        else:
+            self._unpack(a, middle, path)
+            self._unpack(middle, b, path)
+
+    def sections(self):
+        return [(b"CHRK", array('q', self.rank)), (b"CHOF", array('q', self.offsets)),
+                (b"CHNB", array('q', self.neighbors)), (b"CHWT", array('d', self.weights)),
+                (b"CHMD", array('q', self.middles))]
+
+def _adjacency(graph):
+    # node -> {neighbour: (weight, middle)}, the working graph during contraction
+    offsets, neighbors, weights = graph.offsets, graph.neighbors, graph.weights
+    adjacency = []
+    for v in range(len(graph.labels)):
+        edges = {}
+        for j in range(offsets[v], offsets[v + 1]):
+            edges[neighbors[j]] = (weights[j], -1)
+        adjacency.append(edges)
+    return adjacency
+
+def _witness(adjacency, source, skip, limit, settle_limit):
+    # Bounded Dijkstra from source that avoids skip; distances found are upper
+    # bounds, so a missing or longer entry just means "add the shortcut".
+    distances = {source: 0}
+    settled = 0
+    heap = DSAHeap(None)
+    heap.add(0, source)
+    done = set()
+    while heap.count > 0 and settled < settle_limit:
+        entry = heap.remove()
+        current = entry.value
+        if current in done:
+            continue
+        if entry.priority > limit:
+            break
+        done.add(current)
+        settled += 1
+        for neighbor, (weight, _) in adjacency[current].items():
+            if neighbor == skip:
+                continue
+            candidate = entry.priority + weight
+            if candidate <= limit and (neighbor not in distances or candidate < distances[neighbor]):
+                distances[neighbor] = candidate
+                heap.add(candidate, neighbor)
+    return distances
+
+def _shortcuts(adjacency, v, settle_limit):
+    # Shortcuts contracting v would need: (u, w, weight) for each pair of
+    # remaining neighbours with no witness path as short as u-v-w.
+    edges = adjacency[v]
+    around = sorted(edges)
+    needed = []
+    for i, u in enumerate(around):
+        others = around[i + 1:]
+        if not others:
+            break
+        to_u = edges[u][0]
+        limit = to_u + max(edges[w][0] for w in others)
+        found = _witness(adjacency, u, v, limit, settle_limit)
+        for w in others:
+            through = to_u + edges[w][0]
+            if found.get(w, INF) > through:
+                needed.append((u, w, through))
+    return needed
+
+def _priority(adjacency, v, contracted_neighbors, settle_limit):
+    # Edge difference plus how many neighbours are already gone, which keeps
+    # contraction spread evenly over the network.
+    return len(_shortcuts(adjacency, v, settle_limit)) - len(adjacency[v]) + contracted_neighbors[v]
+
+def _worker_priorities(task):
+    start, end, settle_limit = task
+    adjacency = _adjacency(_worker_graph)
+    return [_priority(adjacency, v, [0] * len(adjacency), settle_limit) for v in range(start, end)]
+
+def build_contraction_hierarchy(graph, workers=1, settle_limit=64):
+    # Node ordering uses lazy updates: the cheapest node's priority is
+    # recomputed when it reaches the top and it is only contracted if it is
+    # still the cheapest. The initial priorities, one simulated contraction
+    # per node, are independent and are computed across worker processes.
+    frozen, version = _frozen(graph)
+    n = len(frozen.labels)
+    adjacency = _adjacency(frozen)
+    contracted_neighbors = [0] * n
+    if workers > 1 and n > 0:
+        chunk = -(-n // (workers * 4))
+        tasks = [(start, min(start + chunk, n), settle_limit) for start in range(0, n, chunk)]
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(frozen,)) as pool:
+            priorities = [p for block in pool.map(_worker_priorities, tasks) for p in block]
+    else:
+        priorities = [_priority(adjacency, v, contracted_neighbors, settle_limit) for v in range(n)]
+    heap = DSAHeap.heapify(((priority, v), v) for v, priority in enumerate(priorities))
+
+    rank = array('q', [0]) * n
+    upward = [None] * n
+    order = 0
+    while heap.count > 0:
+        entry = heap.peek()
+        v = entry.value
+        priority = (_priority(adjacency, v, contracted_neighbors, settle_limit), v)
+        if heap.count > 1 and priority > entry.priority:
+            heap.update(entry, priority)
+            continue
+        heap.remove()
+        shortcuts = _shortcuts(adjacency, v, settle_limit)
+        edges = adjacency[v]
+        upward[v] = [(u, weight, middle) for u, (weight, middle) in edges.items()]
+        for u in edges:
+            del adjacency[u][v]
+            contracted_neighbors[u] += 1
+        for u, w, weight in shortcuts:
+            if w not in adjacency[u] or weight < adjacency[u][w][0]:
+                adjacency[u][w] = (weight, v)
+                adjacency[w][u] = (weight, v)
+        adjacency[v] = {}
+        rank[v] = order
+        order += 1
+
+    offsets = array('q', [0])
+    neighbors = array('q')
+    weights = array('d')
+    middles = array('q')
+    for v in range(n):
+        for u, weight, middle in upward[v]:
+            neighbors.append(u)
+            weights.append(weight)
+            middles.append(middle)
+        offsets.append(len(neighbors))
+    return ContractionHierarchy(frozen, rank, offsets, neighbors, weights, middles, version)
+
+def verify_index(index, samples=100, seed=1):
+    # Cross-checks random queries against a plain Dijkstra on the same graph.
+    # Returns [(source, target, expected, got)] for every disagreement.
+    graph = index.graph
+    labels = graph.labels
+    rng = random.Random(seed)
+    mismatches = []
+    if not labels:
+        return mismatches
+    for _ in range(samples):
+        source, target = rng.choice(labels), rng.choice(labels)
+        expected = None
+        for label, distance in graph.nodes_by_distance(source):
+            if label == target:
+                expected = distance
+                break
+        got = index.distance(source, target)
+        # Shortcuts add the same roads in a different order, so allow rounding
+        if (got is None) != (expected is None) or (got is not None and abs(got - expected) > 1e-9 * max(1, expected)):
+            mismatches.append((source, target, expected, got))
+    return mismatches
+
+def main():
+    from avms_snapshot import load_snapshot, save_snapshot
+
+    parser = argparse.ArgumentParser(description="Build routing indexes into an AVMS snapshot.")
+    parser.add_argument("snapshot")
+    parser.add_argument("--landmarks", type=int, default=8, help="ALT landmark count, 0 to keep the stored index")
+    parser.add_argument("--ch", action="store_true", help="Also build a contraction hierarchy")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--verify", type=int, default=100, help="Sampled queries to cross-check, 0 to skip")
+    args = parser.parse_args()
+
+    with load_snapshot(args.snapshot, verify=True) as snapshot:
+        # Copy out of the mapping: the file is replaced when the indexes are saved
+        graph = snapshot.graph().copy()
+        table = snapshot.load_fleet() if snapshot.vehicle_count() else None
+        stored = {}
+        for kind, index in ((LandmarkIndex, snapshot.landmarks()), (ContractionHierarchy, snapshot.contraction_hierarchy())):
+            if index is not None:
+                stored[kind] = kind(graph, *[data for _, data in index.sections()])
+
+    indexes = []
+    if args.landmarks:
+        started = time.perf_counter()
+        previous = stored.pop(LandmarkIndex, None)
+        reuse = previous.landmark_labels() if previous and len(previous.landmarks) == args.landmarks else None
+        indexes.append(build_landmarks(graph, args.landmarks, reuse, args.workers))
+        print(f"Landmarks: {args.landmarks} in {time.perf_counter() - started:.2f}s")
+    if args.ch:
+        started = time.perf_counter()
+        stored.pop(ContractionHierarchy, None)
+        indexes.append(build_contraction_hierarchy(graph, args.workers))
+        print(f"Contraction hierarchy: {len(indexes[-1].neighbors)} upward edges in {time.perf_counter() - started:.2f}s")
+    indexes += stored.values()  # Indexes not rebuilt are kept as they were
+    failed = False
+    for index in indexes if args.verify else ():
+        mismatches = verify_index(index, args.verify)
+        for source, target, expected, got in mismatches[:10]:
+            print(f"MISMATCH {type(index).__name__} {source} -> {target}: expected {expected}, got {got}")
+        failed = failed or bool(mismatches)
+    if failed:
+        sys.exit(1)
+    save_snapshot(args.snapshot, graph, table, routing_indexes=indexes)
+    print(f"Indexes written to {args.snapshot}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import json
+import time
+
+import avms_stats
+from avms_concurrency import ConcurrentAVMS
+from avms_snapshot import load_snapshot
+
+# JSON-lines protocol over TCP on localhost. Each request is one object with
+# an "op" field plus its parameters and an optional "id" that is echoed back:
+#   {"id": 1, "op": "update_vehicle", "vehicle_id": "AV-0001", "battery": 80}
+#   {"id": 1, "ok": true, "result": ...} or {"id": 1, "ok": false, "error": "..."}
+# Responses on one connection may arrive out of order; match them by id.
+
+class LatencyCounter:
+    def __init__(self, samples=1024):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = [0.0] * samples  # Ring buffer of recent latencies
+        self._next = 0
+
+    def record(self, seconds, ok=True):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self._samples[self._next] = seconds
+        self._next = (self._next + 1) % len(self._samples)
+
+    def stats(self):
+        recent = sorted(self._samples[:min(self.count, len(self._samples))])
+        def percentile(p):
+            return recent[min(len(recent) - 1, int(p * len(recent)))] * 1000 if recent else 0.0
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+            "max_ms": self.max * 1000,
+        }
+
+def _report(report):
+    return {"accepted": report.accepted, "rejected": report.rejected, "errors": report.errors}
+
+def _stranded(vehicle_ids):
+    return False if vehicle_ids is None else {"stranded": vehicle_ids}
+
+class AVMSServer:
+    def __init__(self, avms=None, host="127.0.0.1", port=0, batch_window=0.005, max_batch=5000,
+                 max_in_flight=64, max_queued_updates=10000, workers=4):
+        self.avms = avms if avms is not None else ConcurrentAVMS(workers=workers)
+        self.host = host
+        self.port = port
+        self.batch_window = batch_window  # Seconds to wait for more updates before applying a batch
+        self.max_batch = max_batch
+        self.max_in_flight = max_in_flight  # Per connection; beyond it the server stops reading
+        self.max_queued_updates = max_queued_updates  # Beyond it update requests wait for room
+        self.latency = {}
+        self.batches = 0
+        self.batched_updates = 0
+        self._updates = None
+        self._server = None
+        self._batcher = None
+        self._operations = {
+            "get_vehicle": (self._read, lambda a, r: a.get_vehicle(r["vehicle_id"])),
+            "vehicles_at": (self._read, lambda a, r: a.vehicles_at(r["location"])),
+            "nearest_vehicle": (self._read, lambda a, r: a.nearest_vehicle(r.get("feasible_only", True))),
+            "highest_battery_vehicle": (self._read, lambda a, r: a.highest_battery_vehicle(r.get("feasible_only", True))),
+            "k_nearest": (self._read, lambda a, r: a.k_nearest(r["k"], r.get("min_battery"), r.get("location"),
+                                                               r.get("feasible_only", True))),
+            "k_highest_battery": (self._read, lambda a, r: a.k_highest_battery(r["k"], r.get("min_battery"), r.get("location"),
+                                                                               r.get("feasible_only", True))),
+            "dispatch": (self._read, lambda a, r: a.dispatch(r["pickup"], r.get("k", 1), r.get("min_battery"),
+                                                             r.get("feasible_only", True))),
+            "is_path": (self._read, lambda a, r: a.is_path(r["source"], r["destination"])),
+            "shortest_path": (self._read, lambda a, r: a.shortest_path(r["source"], r["destination"])),
+            "add_location": (self._write, lambda a, r: _report(a.add_location(r["location"], r.get("charger", False)))),
+            "add_road": (self._write, lambda a, r: _report(a.add_road(r["from"], r["to"], r["distance"]))),
+            "add_vehicle": (self._write, lambda a, r: _report(a.add_vehicle({
+                "id": r["vehicle_id"], "location": r.get("location"), "destination": r.get("destination"),
+                "battery": r.get("battery"), "class": r.get("class")}))),
+            "remove_vehicle": (self._write, lambda a, r: a.remove_vehicle(r["vehicle_id"])),
+            "update_road": (self._write, lambda a, r: _stranded(a.update_road(r["from"], r["to"], r["distance"]))),
+            "close_road": (self._write, lambda a, r: _stranded(a.close_road(r["from"], r["to"]))),
+            "remove_location": (self._write, lambda a, r: _stranded(a.remove_location(r["location"]))),
+            "update_vehicle": (self._update, None),
+            "stats": (self._stats, None),
+        }
+
+    async def start(self):
+        self._updates = asyncio.Queue(self.max_queued_updates)
+        self._batcher = asyncio.create_task(self._run_batcher())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def handle(self, request):
+        # Entry point for one decoded request; also usable in-process
+        started = time.perf_counter()
+        if not isinstance(request, dict):
+            request = {"op": None, "error": "Request must be a JSON object"}
+        op = request.get("op")
+        response = {"id": request.get("id")}
+        if not isinstance(op, str) or op not in self._operations:
+            response.update(ok=False, error=request.get("error") or f"Unknown operation: {op}")
+            op = "invalid"  # Don't let arbitrary names grow the latency table
+        else:
+            runner, call = self._operations[op]
+            try:
+                ok, result = await runner(call, request)
+                if not ok and isinstance(result, str):
+                    response.update(ok=False, error=result)
+                else:
+                    response.update(ok=ok, result=result)
+            except KeyError as e:
+                response.update(ok=False, error=f"Missing parameter: {e.args[0]}")
+            except (TypeError, ValueError) as e:
+                response.update(ok=False, error=str(e))
+            except Exception as e:
+                # Every request gets an answer, or its client waits forever
+                response.update(ok=False, error=f"Internal error: {type(e).__name__}: {e}")
+        counter = self.latency.get(op)
+        if counter is None:
+            counter = self.latency[op] = LatencyCounter()
+        counter.record(time.perf_counter() - started, response["ok"])
+        return response
+
+    async def _read(self, call, request):
+        # Reads run on ConcurrentAVMS's own worker pool against the published
+        # fleet and network, so neither the loop nor the read waits for a batch.
+        result = await asyncio.get_running_loop().run_in_executor(self.avms.executor, call, self.avms, request)
+        return True, result
+
+    async def _write(self, call, request):
+        result = await asyncio.get_running_loop().run_in_executor(None, call, self.avms, request)
+        ok = result if isinstance(result, bool) else result.get("rejected", 0) == 0
+        return ok, result
+
+    async def _update(self, call, request):
+        record = {"id": request["vehicle_id"]}
+        for field in ("location", "destination", "battery"):
+            if field in request:
+                record[field] = request[field]
+        done = asyncio.get_running_loop().create_future()
+        await self._updates.put((record, done))  # Waits when the queue is full
+        return await done
+
+    async def _stats(self, call, request):
+        return True, self.stats()
+
+    async def _run_batcher(self):
+        # Collects updates arriving within batch_window of the first one and
+        # applies them as a single write, coalesced per vehicle. Each update is
+        # validated on its own and its request answered with its own result.
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._updates.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._updates.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            records = [record for record, done in batch]
+            try:
+                report = await loop.run_in_executor(None, self.avms.apply_updates, records)
+            except Exception as e:
+                for record, done in batch:
+                    if not done.done():
+                        done.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_updates += len(batch)
+            for position, (record, done) in enumerate(batch):
+                error = report.failed.get(position)
+                if not done.done():
+                    done.set_result((False, error) if error else (True, {"batch_size": len(batch)}))
+
+    def stats(self):
+        return {
+            "latency": {op: counter.stats() for op, counter in sorted(self.latency.items())},
+            "batches": self.batches,
+            "batched_updates": self.batched_updates,
+            "queued_updates": self._updates.qsize() if self._updates else 0,
+            "instrumentation": avms_stats.snapshot() if avms_stats.enabled else None,
+        }
+
+    async def _handle_connection(self, reader, writer):
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(request):
+            try:
+                response = await self.handle(request)
+                async with write_lock:
+                    writer.write(json.dumps(response).encode() + b"\n")
+                    await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                in_flight.release()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await in_flight.acquire()  # Stop reading once too many requests are pending
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = {"op": None, "error": "Invalid JSON"}
+                task = asyncio.create_task(respond(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+class AVMSClient:
+    # Async client for AVMSServer. Requests can be pipelined: call() may be
+    # awaited concurrently and responses are routed back by id.
+    def __init__(self):
+        self._reader = None
+        self._writer = None
+        self._pending = {}
+        self._next_id = 0
+        self._listener = None
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        client = cls()
+        client._reader, client._writer = await asyncio.open_connection(host, port)
+        client._listener = asyncio.create_task(client._listen())
+        return client
+
+    async def _listen(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+            self._pending.clear()
+
+    async def call(self, op, **params):
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(json.dumps(dict(params, op=op, id=request_id)).encode() + b"\n")
+        await self._writer.drain()
+        return await future
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+
+async def _main(args):
+    avms = snapshot = None
+    if args.snapshot:
+        # The network is served straight from the mapped file until the first
+        # write thaws it, so the snapshot stays open while the server runs.
+        # The fleet is still loaded up front, in O(fleet size).
+        snapshot = load_snapshot(args.snapshot)
+        avms = ConcurrentAVMS(snapshot.graph(), snapshot.load_fleet())
+    server = AVMSServer(avms, args.host, args.port, batch_window=args.batch_window / 1000,
+                        max_in_flight=args.max_in_flight, max_queued_updates=args.max_queued_updates)
+    try:
+        await server.start()
+        print(f"AVMS server listening on {server.host}:{server.port}")
+        await server.serve_forever()
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve AVMS operations as JSON lines over local TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--snapshot", help="Snapshot file to start from")
+    parser.add_argument("--batch-window", type=float, default=5.0, help="Update coalescing window in ms")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--max-queued-updates", type=int, default=10000)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
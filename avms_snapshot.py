@@ -0,0 +1,309 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from avms_main import DEFAULT_VEHICLE_CLASS, FrozenDSAGraph, VehicleHashTable, Vehicle, plain_number
+from avms_routing_index import ContractionHierarchy, LandmarkIndex
+
+# File layout (little-endian throughout, section data included):
+#   header   magic, version, flags, section count, payload length, CRC-32 of the
+#            section table
+#   payload  section table (tag, typecode, offset, byte length, CRC-32 of the
+#            section) followed by the section data, each aligned to 8 bytes
+# Strings are stored as an offsets array ('q') plus one UTF-8 blob.
+# Opening a snapshot only checks the header, the section table and that every
+# section lies inside the file, so startup does not page in the data. With
+# verify=True each section's checksum is also checked the first time it is
+# read, and Snapshot.verify() checks every section up front.
+MAGIC = b"AVMS"
+VERSION = 2
+FLAG_INDEXES = 1  # Precomputed component ids are present
+HEADER = struct.Struct("<4sHHIQI")
+SECTION = struct.Struct("<4sc3xQQI4x")
+NATIVE_LITTLE = sys.byteorder == "little"  # Big-endian hosts byteswap on save and load
+
+class SnapshotError(Exception):
+    pass
+
+def _encode_strings(strings):
+    offsets = array('q', [0])
+    blob = bytearray()
+    for text in strings:
+        blob += str(text).encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+def save_snapshot(path, graph, table=None, include_indexes=True, routing_indexes=()):
+    # routing_indexes: LandmarkIndex / ContractionHierarchy objects built over
+    # the same network, stored alongside it
+    frozen = graph if isinstance(graph, FrozenDSAGraph) else graph.freeze()
+    sections = []
+    label_offsets, label_blob = _encode_strings(frozen.labels)
+    sections += [(b"LBOF", label_offsets), (b"LBDT", label_blob),
+                 (b"GOFF", array('q', frozen.offsets)), (b"GNBR", array('q', frozen.neighbors)),
+                 (b"GWGT", array(_typecode(frozen.weights), frozen.weights))]
+    if include_indexes:
+        sections.append((b"GCMP", array('q', frozen.components)))
+    if frozen.chargers is not None and any(frozen.chargers):
+        sections.append((b"GCHG", bytes(frozen.chargers)))
+    if frozen.coordinates is not None:
+        sections += [(b"GXCO", array('d', frozen.coordinates[0])), (b"GYCO", array('d', frozen.coordinates[1]))]
+    for index in routing_indexes:
+        if len(index.graph.labels) != len(frozen.labels):
+            raise ValueError("Routing index was built for a different road network")
+        sections += index.sections()
+
+    if table is not None:
+        fleet = table.fleet
+        rows = [row for row in range(len(fleet.alive)) if fleet.alive[row]]
+        id_offsets, id_blob = _encode_strings(fleet.vehicles[row].vehicle_id for row in rows)
+        fleet_offsets, fleet_blob = _encode_strings(fleet.labels)
+        class_offsets, class_blob = _encode_strings(fleet.vehicles[row].vehicle_class for row in rows)
+        sections += [(b"VIOF", id_offsets), (b"VIDT", id_blob),
+                     (b"VCOF", class_offsets), (b"VCDT", class_blob),
+                     (b"FLOF", fleet_offsets), (b"FLDT", fleet_blob),
+                     (b"VBAT", array('d', (fleet.battery[row] for row in rows))),
+                     (b"VDST", array('d', (fleet.distance[row] for row in rows))),
+                     (b"VLOC", array('q', (fleet.location[row] for row in rows))),
+                     (b"VDSN", array('q', (fleet.destination[row] for row in rows)))]
+
+    table_size = SECTION.size * len(sections)
+    offset = HEADER.size + table_size
+    entries = []
+    for tag, data in sections:
+        offset += -offset % 8
+        raw = _little_endian(data) if isinstance(data, array) else data
+        typecode = data.typecode.encode() if isinstance(data, array) else b"B"
+        entries.append((tag, typecode, offset, raw))
+        offset += len(raw)
+
+    payload = bytearray()
+    for tag, typecode, start, raw in entries:
+        payload += SECTION.pack(tag, typecode, start, len(raw), zlib.crc32(raw))
+    table_checksum = zlib.crc32(payload)
+    for tag, typecode, start, raw in entries:
+        payload += bytes(start - HEADER.size - len(payload))
+        payload += raw
+
+    flags = FLAG_INDEXES if include_indexes else 0
+    header = HEADER.pack(MAGIC, VERSION, flags, len(sections), len(payload), table_checksum)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(payload)
+    os.replace(temp_path, path)  # Never leave a half-written snapshot under the real name
+
+class Snapshot:
+    # A memory-mapped snapshot. Array sections are zero-copy memoryviews into
+    # the mapping, so pages are only read from disk when a query touches them.
+    def __init__(self, path, verify=False):
+        self.path = path
+        self._verify = verify
+        self._verified = set()
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotError(f"{path} is empty")
+        self._views = []
+        try:
+            self._read_header(path)
+        except Exception:
+            self.close()
+            raise
+        self._graph = None
+
+    def _read_header(self, path):
+        if len(self._map) < HEADER.size:
+            raise SnapshotError(f"{path} is truncated")
+        magic, version, self.flags, count, length, checksum = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not an AVMS snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"{path} has unsupported snapshot version {version}")
+        if len(self._map) != HEADER.size + length:
+            raise SnapshotError(f"{path} is truncated: expected {HEADER.size + length} bytes, found {len(self._map)}")
+        if HEADER.size + count * SECTION.size > len(self._map):
+            raise SnapshotError(f"{path} has a section table past the end of the file")
+        if zlib.crc32(self._map[HEADER.size:HEADER.size + count * SECTION.size]) != checksum:
+            raise SnapshotError(f"{path} failed its section table checksum")
+
+        self.sections = {}
+        for i in range(count):
+            tag, typecode, start, size, crc = SECTION.unpack_from(self._map, HEADER.size + i * SECTION.size)
+            typecode = typecode.decode("ascii", "replace")
+            if start + size > len(self._map):
+                raise SnapshotError(f"{path} has a section past the end of the file")
+            if typecode not in ("B", "q", "d") or size % array(typecode).itemsize:
+                raise SnapshotError(f"{path} has a malformed {tag!r} section")
+            self.sections[tag] = (typecode, start, size, crc)
+
+    def _check(self, tag):
+        typecode, start, size, crc = self.sections[tag]
+        with memoryview(self._map) as data:
+            with data[start:start + size] as raw:
+                valid = zlib.crc32(raw) == crc
+        if not valid:
+            raise SnapshotError(f"{self.path} failed the checksum of its {tag.decode(errors='replace')} section")
+        self._verified.add(tag)
+
+    def verify(self):
+        # Check every section now instead of on first use; reads the whole file
+        for tag in self.sections:
+            if tag not in self._verified:
+                self._check(tag)
+
+    def has(self, tag):
+        return tag in self.sections
+
+    def view(self, tag):
+        if self._verify and tag not in self._verified:
+            self._check(tag)
+        typecode, start, size = self.sections[tag][:3]
+        view = memoryview(self._map)[start:start + size]
+        if typecode == "B":
+            pass
+        elif NATIVE_LITTLE:
+            view = view.cast(typecode)
+        else:
+            # Stored little-endian; a big-endian host gets a swapped copy
+            values = array(typecode)
+            values.frombytes(view)
+            values.byteswap()
+            view.release()
+            return values
+        self._views.append(view)
+        return view
+
+    def strings(self, offsets_tag, data_tag):
+        return _StringTable(self.view(offsets_tag), self.view(data_tag))
+
+    def graph(self):
+        # Read-only CSR graph straight over the mapping; labels are decoded on
+        # use and the label index is built on the first lookup
+        if self._graph is None:
+            labels = self.strings(b"LBOF", b"LBDT")
+            offsets = self.view(b"GOFF")
+            neighbors = self.view(b"GNBR")
+            if self.has(b"GCMP"):
+                components = self.view(b"GCMP")
+            else:
+                components = _components(len(labels), offsets, neighbors)
+            chargers = self.view(b"GCHG") if self.has(b"GCHG") else None
+            coordinates = (self.view(b"GXCO"), self.view(b"GYCO")) if self.has(b"GXCO") else None
+            self._graph = FrozenDSAGraph(labels, offsets, neighbors, self.view(b"GWGT"), components, chargers,
+                                         coordinates)
+        return self._graph
+
+    def landmarks(self):
+        # The stored ALT index over graph(), or None
+        if not self.has(b"ALMK"):
+            return None
+        return LandmarkIndex(self.graph(), self.view(b"ALMK"), self.view(b"ALTD"))
+
+    def contraction_hierarchy(self):
+        if not self.has(b"CHRK"):
+            return None
+        return ContractionHierarchy(self.graph(), self.view(b"CHRK"), self.view(b"CHOF"), self.view(b"CHNB"),
+                                    self.view(b"CHWT"), self.view(b"CHMD"))
+
+    def vehicle_count(self):
+        if not self.has(b"VIOF"):
+            return 0
+        return self.sections[b"VIOF"][2] // 8 - 1
+
+    def thaw_graph(self):
+        return self.graph().thaw()
+
+    def load_fleet(self):
+        table = VehicleHashTable()
+        if not self.has(b"VIOF"):
+            return table
+        ids = list(self.strings(b"VIOF", b"VIDT"))
+        labels = list(self.strings(b"FLOF", b"FLDT"))
+        classes = list(self.strings(b"VCOF", b"VCDT")) if self.has(b"VCOF") else None
+        battery, distance = self.view(b"VBAT"), self.view(b"VDST")
+        location, destination = self.view(b"VLOC"), self.view(b"VDSN")
+        table.reserve(len(ids))
+        for i, vid in enumerate(ids):
+            vehicle = Vehicle(vid,
+                              labels[location[i]] if location[i] >= 0 else None,
+                              labels[destination[i]] if destination[i] >= 0 else None,
+                              plain_number(battery[i]),
+                              classes[i] if classes else DEFAULT_VEHICLE_CLASS)
+            vehicle.set_distance_to_destination(plain_number(distance[i]))
+            table.put(vid, vehicle)
+        return table
+
+    def close(self):
+        self._graph = None
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _StringTable:
+    # Read-only sequence of the strings in an offsets/blob section pair,
+    # decoded one at a time on access
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string index out of range")
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        offsets, blob = self.offsets, self.blob
+        for i in range(len(offsets) - 1):
+            yield bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+def _little_endian(values):
+    if NATIVE_LITTLE:
+        return values.tobytes()
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+def _typecode(values):
+    # Frozen graphs hold arrays, or memoryviews when they came from a snapshot
+    return values.typecode if isinstance(values, array) else values.format
+
+def _components(count, offsets, neighbors):
+    # Connected components over CSR when the snapshot was saved without indexes
+    components = array('q', [-1]) * count
+    for start in range(count):
+        if components[start] >= 0:
+            continue
+        components[start] = start
+        stack = [start]
+        while stack:
+            current = stack.pop()
+            for j in range(offsets[current], offsets[current + 1]):
+                neighbor = neighbors[j]
+                if components[neighbor] < 0:
+                    components[neighbor] = start
+                    stack.append(neighbor)
+    return components
+
+def load_snapshot(path, verify=False):
+    return Snapshot(path, verify)
@@ -0,0 +1,95 @@
+import math
+from array import array
+
+from avms_main import DSAHeap
+
+class SpatialIndex:
+    # Static 2-d tree over located nodes. Points are stored in tree order in
+    # flat arrays: the subtree over [lo, hi) has its splitting point at
+    # (lo + hi) // 2, split on x at even depths and y at odd ones, so no
+    # node objects or child links are needed. Rebuild it after the set of
+    # locations changes (DSAGraph.spatial_index() does this by version).
+    def __init__(self, points):
+        # points: iterable of (label, x, y)
+        points = list(points)
+        order = list(range(len(points)))
+        self._arrange(points, order, 0, len(order), 0)
+        self.labels = [points[i][0] for i in order]
+        self.xs = array('d', (points[i][1] for i in order))
+        self.ys = array('d', (points[i][2] for i in order))
+
+    def __len__(self):
+        return len(self.labels)
+
+    @staticmethod
+    def _arrange(points, order, lo, hi, depth):
+        # Sorting each slice gives O(n log^2 n) construction, which is fine
+        # for an index rebuilt only when locations are added or removed
+        stack = [(lo, hi, depth)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= 1:
+                continue
+            axis = 1 + depth % 2
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i][axis])
+            mid = (lo + hi) // 2
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+    def nearest(self, x, y):
+        # (label, straight-line distance) of the closest location, None when empty
+        found = self.k_nearest(x, y, 1)
+        return found[0] if found else None
+
+    def k_nearest(self, x, y, k):
+        # Up to k (label, distance) pairs, nearest first. A bounded max-heap
+        # (negated distances in the min-heap) holds the best k seen so far,
+        # and a subtree is skipped when its splitting plane is further away
+        # than the current k-th best.
+        if k <= 0 or not self.labels:
+            return []
+        xs, ys = self.xs, self.ys
+        best = DSAHeap(None)
+        stack = [(0, len(xs), 0, 0.0)]  # Subtree and a lower bound on its distance
+        while stack:
+            lo, hi, depth, bound = stack.pop()
+            if hi <= lo or (best.count == k and bound > -best.peek().priority[0]):
+                continue
+            mid = (lo + hi) // 2
+            distance = math.hypot(xs[mid] - x, ys[mid] - y)
+            if best.count < k:
+                best.add((-distance, -mid), mid)
+            elif (-distance, -mid) > best.peek().priority:
+                best.remove()
+                best.add((-distance, -mid), mid)
+            gap = (x - xs[mid]) if depth % 2 == 0 else (y - ys[mid])
+            near, far = ((lo, mid), (mid + 1, hi)) if gap < 0 else ((mid + 1, hi), (lo, mid))
+            stack.append((far[0], far[1], depth + 1, max(bound, abs(gap))))
+            stack.append((near[0], near[1], depth + 1, bound))  # Popped first
+        found = []
+        while best.count > 0:
+            entry = best.remove()
+            found.append((self.labels[entry.value], -entry.priority[0]))
+        found.reverse()
+        return found
+
+    def within(self, x, y, radius):
+        # Every (label, distance) within radius, nearest first
+        xs, ys = self.xs, self.ys
+        found = []
+        stack = [(0, len(xs), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi <= lo:
+                continue
+            mid = (lo + hi) // 2
+            distance = math.hypot(xs[mid] - x, ys[mid] - y)
+            if distance <= radius:
+                found.append((distance, mid))
+            gap = (x - xs[mid]) if depth % 2 == 0 else (y - ys[mid])
+            if gap <= radius:
+                stack.append((lo, mid, depth + 1))
+            if gap >= -radius:
+                stack.append((mid + 1, hi, depth + 1))
+        found.sort()
+        return [(self.labels[i], distance) for distance, i in found]
@@ -0,0 +1,181 @@
+import os
+import time
+
+# Opt-in instrumentation for the hot paths in avms_main. Call sites test the
+# module-level enabled flag before doing any work, so with it off each
+# operation pays a single attribute lookup. Turn it on with enable() or by
+# starting the process with AVMS_STATS=1.
+
+enabled = os.environ.get("AVMS_STATS", "") not in ("", "0")
+
+counters = {}
+histograms = {}
+timings = {}
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    counters.clear()
+    histograms.clear()
+    timings.clear()
+
+def count(name, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.buckets = {}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        # Exact buckets for small values such as probe lengths, powers of two above
+        bucket = value if value <= 16 else 1 << (int(value) - 1).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": dict(sorted(self.buckets.items())),
+        }
+
+class Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+def observe(name, value):
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = Histogram()
+    histogram.add(value)
+
+def record_time(name, seconds):
+    timing = timings.get(name)
+    if timing is None:
+        timing = timings[name] = Timing()
+    timing.add(seconds)
+
+def record_search(name, nodes, edges):
+    # One graph query: locations settled and roads scanned
+    count(name)
+    observe(name + ".nodes", nodes)
+    observe(name + ".edges", edges)
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_time(self.name, time.perf_counter() - self.started)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name):
+    # Times a with-block into timings[name]; a shared no-op when disabled
+    return _Span(name) if enabled else _NULL_SPAN
+
+class CountingKey:
+    # Sort key wrapper that counts comparisons; the sort engine only uses <
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        counters["sort.comparisons"] = counters.get("sort.comparisons", 0) + 1
+        return self.key < other.key
+
+class CountingList(list):
+    # Counts element writes during a sort; a swap is two moves
+    __slots__ = ()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            moved = len(value)
+        else:
+            moved = 1
+        counters["sort.moves"] = counters.get("sort.moves", 0) + moved
+        list.__setitem__(self, index, value)
+
+def snapshot(table=None, graph=None):
+    # Everything collected so far, plus current gauges for the given structures
+    result = {
+        "enabled": enabled,
+        "counters": dict(sorted(counters.items())),
+        "histograms": {name: histograms[name].as_dict() for name in sorted(histograms)},
+        "timings": {name: timings[name].as_dict() for name in sorted(timings)},
+    }
+    if table is not None:
+        result["hash_table"] = table.stats()
+    if graph is not None:
+        result["graph"] = graph.stats()
+    return result
+
+def report(table=None, graph=None):
+    stats = snapshot(table, graph)
+    lines = []
+    for section in ("hash_table", "graph"):
+        if section in stats:
+            gauges = ", ".join(f"{name}={_format(value)}" for name, value in stats[section].items())
+            lines.append(f"{section}: {gauges}")
+    if not enabled:
+        lines.append("Instrumentation is off (set AVMS_STATS=1 to collect counters and timings).")
+    for name, value in stats["counters"].items():
+        lines.append(f"{name}: {value}")
+    for name, histogram in stats["histograms"].items():
+        buckets = " ".join(f"{bucket}:{hits}" for bucket, hits in histogram["buckets"].items())
+        lines.append(f"{name}: n={histogram['count']} mean={histogram['mean']:.2f} "
+                     f"max={_format(histogram['max'])} [{buckets}]")
+    for name, timing in stats["timings"].items():
+        lines.append(f"{name}: n={timing['count']} mean={timing['mean_ms']:.3f}ms "
+                     f"max={timing['max_ms']:.3f}ms total={timing['total_ms']:.3f}ms")
+    return "\n".join(lines)
+
+def _format(value):
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
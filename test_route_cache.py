@@ -0,0 +1,88 @@
+import random
+import unittest
+
+from avms_generators import grid_city
+
+def all_distances(graph):
+    # Every pair through the route cache
+    return {(source, destination): graph.shortest_distance(source, destination)
+            for destination in graph.nodes for source in graph.nodes}
+
+def fresh_distances(graph):
+    # Every pair from a Dijkstra run per destination that bypasses the cache
+    found = {}
+    for destination in graph.nodes:
+        distances = graph._dijkstra(destination)[0]
+        for source in graph.nodes:
+            found[source, destination] = distances.get(source)
+    return found
+
+def random_road(graph, rng):
+    label = rng.choice(sorted(graph.nodes))
+    neighbors = graph.get_neighbors(label)
+    if not neighbors:
+        return None
+    return (label,) + rng.choice(neighbors)
+
+class RouteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = grid_city(5, 5, seed=7)
+        self.graph.route_cache_limit = 1000
+        all_distances(self.graph)  # Cache a tree for every destination
+
+    def assertCacheExact(self):
+        self.assertEqual(all_distances(self.graph), fresh_distances(self.graph))
+        for (source, destination), distance in all_distances(self.graph).items():
+            path, length = self.graph.shortest_path(source, destination)
+            self.assertEqual(length, distance)
+            if distance is not None:
+                self.assertEqual(path[0], source)
+                self.assertEqual(path[-1], destination)
+                self.assertEqual(sum(self.graph.nodes[a].distance[b] for a, b in zip(path, path[1:])), distance)
+
+    def test_weight_changes(self):
+        rng = random.Random(1)
+        for _ in range(40):
+            label1, label2, old = random_road(self.graph, rng)
+            distance = max(1, old + rng.choice([-4, -2, -1, 1, 3, 8]))
+            self.assertTrue(self.graph.update_edge_weight(label1, label2, distance))
+            self.assertCacheExact()
+
+    def test_road_removals_and_additions(self):
+        rng = random.Random(2)
+        labels = sorted(self.graph.nodes)
+        for step in range(30):
+            if step % 3 == 2:
+                label1, label2 = rng.sample(labels, 2)
+                self.graph.add_edge(label1, label2, rng.randint(1, 10))
+            else:
+                road = random_road(self.graph, rng)
+                if road is not None:
+                    self.assertTrue(self.graph.remove_edge(road[0], road[1]))
+            self.assertCacheExact()
+
+    def test_location_removals(self):
+        rng = random.Random(3)
+        for _ in range(8):
+            label = rng.choice(sorted(self.graph.nodes))
+            self.assertTrue(self.graph.remove_node(label))
+            self.assertNotIn(label, self.graph._route_cache)
+            for distances, next_hop in self.graph._route_cache.values():
+                self.assertNotIn(label, distances)
+                self.assertNotIn(label, next_hop.values())
+            self.assertCacheExact()
+
+    def test_uses_and_improves(self):
+        graph = self.graph
+        distances, next_hop = graph._shortest_path_tree("N0-0")
+        for source, hop in next_hop.items():
+            self.assertTrue(graph._uses(next_hop, source, hop))
+            self.assertTrue(graph._uses(next_hop, hop, source))
+            self.assertFalse(graph._improves(distances, source, hop, graph.nodes[source].distance[hop]))
+            self.assertTrue(graph._improves(distances, source, hop, distances[source] - distances[hop] - 1))
+        self.assertFalse(graph._uses(next_hop, "N0-0", "N4-4"))
+        self.assertTrue(graph._improves({"a": 0}, "a", "b", 5))  # b unreachable until now
+        self.assertFalse(graph._improves({}, "a", "b", 5))
+
+if __name__ == "__main__":
+    unittest.main()
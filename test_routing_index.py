@@ -0,0 +1,60 @@
+import random
+import unittest
+
+from avms_generators import random_geometric, scale_free
+from avms_routing_index import build_contraction_hierarchy, build_landmarks
+
+def seeded_graph(seed):
+    # A random road network plus a separate island, so some pairs have no route
+    graph = random_geometric(40, seed=seed)[0]
+    rng = random.Random(seed)
+    for i in range(5):
+        graph.add_node(f"island-{i}")
+    for i in range(4):
+        graph.add_edge(f"island-{i}", f"island-{i + 1}", rng.randint(1, 9))
+    return graph
+
+def road_length(frozen, path):
+    total = 0
+    for a, b in zip(path, path[1:]):
+        total += dict(frozen.get_neighbors(a))[b]
+    return total
+
+class RoutingIndexTest(unittest.TestCase):
+    def assertMatchesDijkstra(self, index):
+        frozen = index.graph
+        for target in range(len(frozen.labels)):
+            expected = frozen._dijkstra(target)[0]
+            for source in range(len(frozen.labels)):
+                source_label, target_label = frozen.labels[source], frozen.labels[target]
+                distance = index.distance(source_label, target_label)
+                path, length = index.shortest_path(source_label, target_label)
+                if expected[source] is None:
+                    self.assertIsNone(distance)
+                    self.assertEqual((path, length), ([], None))
+                    continue
+                self.assertAlmostEqual(distance, expected[source], places=9)
+                self.assertAlmostEqual(length, expected[source], places=9)
+                self.assertEqual(path[0], source_label)
+                self.assertEqual(path[-1], target_label)
+                self.assertAlmostEqual(road_length(frozen, path), expected[source], places=9)
+
+    def test_landmarks_match_dijkstra(self):
+        for seed in (1, 2):
+            index = build_landmarks(seeded_graph(seed), 4)
+            self.assertMatchesDijkstra(index)
+            # Rebuilding from the same landmark set gives the same index
+            again = build_landmarks(index.graph, 4, index.landmark_labels())
+            self.assertEqual(list(again.tables), list(index.tables))
+
+    def test_contraction_hierarchy_matches_dijkstra(self):
+        for seed in (1, 2):
+            self.assertMatchesDijkstra(build_contraction_hierarchy(seeded_graph(seed)))
+
+    def test_integer_weights(self):
+        graph = scale_free(50, seed=3)
+        self.assertMatchesDijkstra(build_landmarks(graph, 3))
+        self.assertMatchesDijkstra(build_contraction_hierarchy(graph))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import avms_snapshot
+from avms_generators import fleet, grid_city
+from avms_main import VehicleHashTable
+from avms_routing_index import build_contraction_hierarchy, build_landmarks
+from avms_snapshot import HEADER, SnapshotError, load_snapshot, save_snapshot
+
+def vehicle_state(table):
+    return sorted((v.vehicle_id, v.get_location(), v.get_destination(), v.get_battery_level(),
+                   v.get_distance_to_destination(), v.vehicle_class) for v in table.values())
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "network.avms")
+        self.graph = grid_city(6, 6, seed=4)
+        self.graph.set_charger("N2-3")
+        self.table = VehicleHashTable()
+        for vehicle in fleet(self.graph, 20, seed=5):
+            self.table.put(vehicle.vehicle_id, vehicle)
+        frozen = self.graph.freeze()
+        self.indexes = [build_landmarks(frozen, 3), build_contraction_hierarchy(frozen)]
+        save_snapshot(self.path, self.graph, self.table, routing_indexes=self.indexes)
+        with open(self.path, "rb") as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        path = os.path.join(self.directory, "damaged.avms")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def assertRoundTrips(self, path):
+        frozen = self.graph.freeze()
+        with load_snapshot(path, verify=True) as snapshot:
+            snapshot.verify()
+            graph = snapshot.graph()
+            self.assertEqual(list(graph.labels), list(frozen.labels))
+            self.assertEqual(list(graph.offsets), list(frozen.offsets))
+            self.assertEqual(list(graph.neighbors), list(frozen.neighbors))
+            self.assertEqual(list(graph.weights), list(frozen.weights))
+            self.assertTrue(graph.is_charger("N2-3"))
+            self.assertEqual(graph.get_coordinates("N1-1"), frozen.get_coordinates("N1-1"))
+            expected = frozen.shortest_distance("N0-0", "N5-5")
+            self.assertEqual(graph.shortest_distance("N0-0", "N5-5"), expected)
+            self.assertEqual(snapshot.landmarks().distance("N0-0", "N5-5"), expected)
+            self.assertEqual(snapshot.contraction_hierarchy().distance("N0-0", "N5-5"), expected)
+            self.assertEqual(snapshot.vehicle_count(), 20)
+            self.assertEqual(vehicle_state(snapshot.load_fleet()), vehicle_state(self.table))
+            self.assertEqual(sorted(snapshot.thaw_graph().nodes), sorted(self.graph.nodes))
+
+    def test_round_trip(self):
+        self.assertRoundTrips(self.path)
+
+    def test_round_trip_with_byteswapped_sections(self):
+        # What a big-endian host does: swap on save and swap back on load
+        avms_snapshot.NATIVE_LITTLE = False
+        try:
+            save_snapshot(self.path, self.graph, self.table, routing_indexes=self.indexes)
+            self.assertRoundTrips(self.path)
+        finally:
+            avms_snapshot.NATIVE_LITTLE = True
+
+    def test_truncated(self):
+        for length in (0, 3, HEADER.size, HEADER.size + 10, len(self.data) // 2, len(self.data) - 1):
+            with self.subTest(length=length):
+                with self.assertRaises(SnapshotError):
+                    load_snapshot(self.write(self.data[:length]))
+
+    def test_not_a_snapshot(self):
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.write(b"PNG!" + self.data[4:]))
+        version = bytearray(self.data)
+        version[4] += 1
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.write(bytes(version)))
+
+    def test_corrupted_section_table(self):
+        damaged = bytearray(self.data)
+        damaged[HEADER.size + 9] ^= 0xFF
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.write(bytes(damaged)))
+
+    def test_corrupted_sections(self):
+        with load_snapshot(self.path) as snapshot:
+            sections = dict(snapshot.sections)
+        for tag, (typecode, start, size, crc) in sections.items():
+            damaged = bytearray(self.data)
+            damaged[start + size // 2] ^= 0x01
+            with self.subTest(tag=tag):
+                with load_snapshot(self.write(bytes(damaged)), verify=True) as snapshot:
+                    # Caught on the section's first read, and by a full check
+                    with self.assertRaises(SnapshotError):
+                        snapshot.view(tag)
+                    with self.assertRaises(SnapshotError):
+                        snapshot.verify()
+                # Without verify only the header and section table are checked
+                with load_snapshot(self.write(bytes(damaged))) as snapshot:
+                    snapshot.view(tag)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import math
+import random
+import unittest
+
+from avms_generators import random_geometric
+from avms_spatial import SpatialIndex
+
+def brute_force(points, x, y):
+    # Every (distance, label), nearest first
+    return sorted((math.hypot(px - x, py - y), label) for label, px, py in points)
+
+def seeded_points(seed, count):
+    rng = random.Random(seed)
+    points = [(f"P{i}", rng.uniform(0, 50), rng.uniform(0, 50)) for i in range(count)]
+    # Repeated and collinear points make ties and zero-width splits
+    points += [(f"D{i}", points[i][1], points[i][2]) for i in range(5)]
+    points += [(f"L{i}", 25.0, float(i)) for i in range(10)]
+    return points
+
+class SpatialIndexTest(unittest.TestCase):
+    def assertSameDistances(self, found, expected):
+        self.assertEqual(len(found), len(expected))
+        for (_, distance), (want, _) in zip(found, expected):
+            self.assertAlmostEqual(distance, want, places=9)
+
+    def test_nearest_matches_brute_force(self):
+        for seed in (1, 2, 3):
+            points = seeded_points(seed, 200)
+            index = SpatialIndex(points)
+            located = {label: (x, y) for label, x, y in points}
+            rng = random.Random(seed)
+            for _ in range(50):
+                x, y = rng.uniform(-10, 60), rng.uniform(-10, 60)
+                expected = brute_force(points, x, y)
+                label, distance = index.nearest(x, y)
+                self.assertAlmostEqual(distance, expected[0][0], places=9)
+                self.assertAlmostEqual(math.hypot(located[label][0] - x, located[label][1] - y), distance, places=9)
+                for k in (1, 2, 7, 40, len(points), len(points) + 5):
+                    found = index.k_nearest(x, y, k)
+                    self.assertSameDistances(found, expected[:k])
+                    self.assertEqual(len({label for label, _ in found}), len(found))
+                    for label, distance in found:
+                        self.assertAlmostEqual(math.hypot(located[label][0] - x, located[label][1] - y), distance,
+                                               places=9)
+
+    def test_within_matches_brute_force(self):
+        for seed in (4, 5):
+            points = seeded_points(seed, 200)
+            index = SpatialIndex(points)
+            rng = random.Random(seed)
+            for _ in range(50):
+                x, y = rng.uniform(-10, 60), rng.uniform(-10, 60)
+                radius = rng.choice([0.0, 1.5, 5.0, 12.0, 100.0])
+                expected = [(distance, label) for distance, label in brute_force(points, x, y) if distance <= radius]
+                found = index.within(x, y, radius)
+                self.assertEqual(sorted(label for label, _ in found), sorted(label for _, label in expected))
+                self.assertSameDistances(found, expected)
+        # A query exactly on a point finds it at radius 0
+        self.assertEqual(sorted(index.within(points[0][1], points[0][2], 0)), [("D0", 0.0), ("P0", 0.0)])
+
+    def test_empty(self):
+        index = SpatialIndex([])
+        self.assertIsNone(index.nearest(0, 0))
+        self.assertEqual(index.k_nearest(0, 0, 3), [])
+        self.assertEqual(index.within(0, 0, 10), [])
+
+class AStarTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = random_geometric(60, seed=6)[0]
+
+    def assertMatchesDijkstra(self, graph, dijkstra):
+        # shortest_path runs A* for destinations without a cached tree
+        labels = sorted(graph.nodes) if hasattr(graph, "nodes") else list(graph.labels)
+        rng = random.Random(7)
+        for _ in range(60):
+            source, destination = rng.choice(labels), rng.choice(labels)
+            graph._route_cache.clear()
+            path, distance = graph.shortest_path(source, destination)
+            expected = dijkstra(source, destination)
+            if expected is None:
+                self.assertEqual((path, distance), ([], None))
+                continue
+            self.assertAlmostEqual(distance, expected, places=9)
+            self.assertEqual((path[0], path[-1]), (source, destination))
+            self.assertAlmostEqual(sum(dict(graph.get_neighbors(a))[b] for a, b in zip(path, path[1:])), distance,
+                                   places=9)
+
+    def test_astar_matches_dijkstra(self):
+        graph = self.graph
+        self.assertTrue(graph.heuristic_admissible())
+        self.assertMatchesDijkstra(graph, lambda source, destination: graph._dijkstra(destination)[0].get(source))
+        frozen = graph.freeze()
+        self.assertTrue(frozen.heuristic_admissible())
+        self.assertMatchesDijkstra(frozen, lambda source, destination:
+                                   frozen._dijkstra(frozen.index[destination])[0][frozen.index[source]])
+
+    def test_admissibility_tracks_changes(self):
+        graph = self.graph
+        label1, (label2, distance) = "G0", graph.get_neighbors("G0")[0]
+        # A road shorter than the straight line makes the bound unsafe
+        self.assertTrue(graph.update_edge_weight(label1, label2, 0.01))
+        self.assertFalse(graph.heuristic_admissible())
+        self.assertFalse(graph.freeze().heuristic_admissible())
+        self.assertTrue(graph.update_edge_weight(label1, label2, distance))
+        self.assertTrue(graph.heuristic_admissible())
+        far = max(graph.nodes, key=lambda label: math.dist(graph.get_coordinates("G1"), graph.get_coordinates(label)))
+        self.assertTrue(graph.add_edge("G1", far, 0.01))
+        self.assertFalse(graph.heuristic_admissible())
+        self.assertTrue(graph.remove_edge("G1", far))
+        self.assertTrue(graph.heuristic_admissible())
+
+        # So does a location without coordinates, until it is removed
+        graph.add_node("unplaced")
+        graph.add_edge("unplaced", "G0", 1)
+        self.assertFalse(graph.heuristic_admissible())
+        self.assertTrue(graph.remove_node("unplaced"))
+        self.assertTrue(graph.heuristic_admissible())
+
+        # A short road is forgotten when its location goes
+        self.assertTrue(graph.update_edge_weight(label1, label2, 0.01))
+        self.assertTrue(graph.remove_node(label1))
+        self.assertTrue(graph.heuristic_admissible())
+        self.assertMatchesDijkstra(graph, lambda source, destination: graph._dijkstra(destination)[0].get(source))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from avms_main import Vehicle, VehicleHashTable
+
+class CollidingKey:
+    # Every instance hashes alike, so all of them share one probe chain
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 0
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.name == other.name
+
+    def __repr__(self):
+        return f"CollidingKey({self.name!r})"
+
+def live_keys(table):
+    return [key for key, state in zip(table._keys, table._states) if state == 1]
+
+class VehicleHashTableTest(unittest.TestCase):
+    def test_reinsert_after_remove(self):
+        table = VehicleHashTable()
+        for i in range(20):
+            self.assertTrue(table.put(f"AV-{i:04d}", i))
+        self.assertTrue(table.remove("AV-0005"))
+        self.assertEqual(len(table), 19)
+        self.assertIsNone(table.get("AV-0005"))
+        self.assertFalse(table.remove("AV-0005"))
+
+        self.assertTrue(table.put("AV-0005", "again"))
+        self.assertFalse(table.put("AV-0005", "duplicate"))
+        self.assertEqual(len(table), 20)
+        self.assertEqual(table.get("AV-0005"), "again")
+        for i in range(20):
+            if i != 5:
+                self.assertEqual(table.get(f"AV-{i:04d}"), i)
+        self.assertEqual(sorted(live_keys(table)), sorted(f"AV-{i:04d}" for i in range(20)))
+
+    def test_collision_chain_with_tombstones(self):
+        table = VehicleHashTable()
+        keys = [CollidingKey(name) for name in "abcde"]
+        for i, key in enumerate(keys):
+            table.put(key, i)
+        # Removing from the middle of the chain leaves tombstones the later
+        # keys must still be found past
+        table.remove(keys[1])
+        table.remove(keys[2])
+        self.assertGreater(table.stats()["tombstones"], 0)
+        self.assertEqual(len(table), 3)
+        self.assertIsNone(table.get(keys[1]))
+        self.assertEqual(table.get(keys[4]), 4)
+
+        # Re-adding a key that sits past a tombstone must not duplicate it
+        self.assertFalse(table.put(CollidingKey("e"), "duplicate"))
+        self.assertTrue(table.put(CollidingKey("b"), "again"))
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.get(keys[1]), "again")
+        self.assertEqual(table.get(keys[4]), 4)
+        self.assertEqual(len(live_keys(table)), len(set(live_keys(table))))
+
+        for key in keys:
+            table.remove(key)
+        self.assertEqual(len(table), 0)
+        self.assertEqual(live_keys(table), [])
+
+    def test_reinserted_vehicle_is_indexed_once(self):
+        table = VehicleHashTable()
+        vehicle = Vehicle("AV-0001", "A", "B", 50)
+        vehicle.set_distance_to_destination(10)
+        table.put("AV-0001", vehicle)
+        for _ in range(3):
+            table.remove("AV-0001")
+            self.assertEqual(table.vehicles_at("A"), [])
+            table.put("AV-0001", vehicle)
+        self.assertEqual(len(table), 1)
+        self.assertEqual([v.vehicle_id for v in table.vehicles_at("A")], ["AV-0001"])
+        self.assertIs(table.nearest_vehicle(), vehicle)
+
+if __name__ == "__main__":
+    unittest.main()